@@ -0,0 +1,128 @@
+"""Multi-edit session check: patch-based itinerary edits against the stub OpenAI server.
+
+Generates an itinerary with the ItineraryEngine, then applies a series of follow-up
+edits with the ItineraryEditor, the way the chat does. After every edit it checks that
+
+- only the targeted day sections changed (all other days are byte-identical),
+- the day count and section order are unchanged,
+- the grand total equals the sum of the daily totals,
+
+and reports latency and output tokens per edit against the full generation. The same
+checks run without a server in tests/test_edits.py.
+
+    python bench/edit_session.py            # structured itineraries (local totals)
+    python bench/edit_session.py --prose    # prose itineraries
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import pandas as pd  # noqa: E402
+
+from fake_openai_server import FakeOpenAIConfig, start_server  # noqa: E402
+from trivanza_context import count_tokens  # noqa: E402
+from trivanza_costs import CostTable, parse_money  # noqa: E402
+from trivanza_edits import ItineraryEditor, parse_itinerary  # noqa: E402
+from trivanza_gateway import AsyncGatewayClient, GatewayClient, LLMGateway  # noqa: E402
+from trivanza_itinerary import ItineraryEngine  # noqa: E402
+from trivanza_prompts import build_system_prompt_text, build_trip_prompt  # noqa: E402
+
+EDITS = [
+    "Swap Day 3's hotel for something cheaper",
+    "Make the last day more relaxed",
+    "Add a cooking class on day 2 and update the packing list",
+    "Can the second day start later?",
+    "Replace the fort visit on day 1 with a spice plantation",
+]
+RATES = pd.DataFrame([{"Code": "USD", "INR_Value": 86.28}, {"Code": "EUR", "INR_Value": 99.75}])
+
+
+def sample_trip():
+    start = date.today() + timedelta(days=30)
+    return {
+        "origin": "New Delhi", "destination": "Goa", "from_date": start, "to_date": start + timedelta(days=4),
+        "traveler_type": "Couple", "group_size": 2, "purpose_of_travel": "Leisure / Holiday",
+        "food_preferences": ["Local Cuisine"], "comm_connectivity": [], "sustainability": "None",
+        "cultural_pref": "Standard", "activities_interests": ["Sightseeing"], "budget_amount": 60000,
+        "currency_type": "₹ INR", "accommodation_pref": ["Mid-Range Hotel"], "mode_of_transport": "Flight",
+    }
+
+
+def check(parsed_before, parsed_after, days):
+    """Returns a list of problems with an edit's result."""
+    problems = []
+    if list(parsed_before.days) != list(parsed_after.days):
+        problems.append(f"day sections changed from {list(parsed_before.days)} to {list(parsed_after.days)}")
+    for day, section in parsed_before.days.items():
+        if day not in days and parsed_after.days.get(day) != section:
+            problems.append(f"untouched Day {day} changed")
+    daily = [parse_money(s.rsplit("🎯", 1)[-1]) for s in parsed_after.days.values()]
+    grand = parse_money(parsed_after.finals.get("grand_total", ""))
+    if grand is None or any(d is None for d in daily):
+        problems.append("totals could not be read")
+    elif abs(sum(a for a, _ in daily) - grand[0]) > len(daily):  # displayed amounts are rounded
+        problems.append(f"grand total {grand[0]:,.0f} != sum of daily totals {sum(a for a, _ in daily):,.0f}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prose", action="store_true", help="Use prose itineraries instead of structured ones")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(FakeOpenAIConfig(args.latency, args.tokens_per_second, completion_tokens=4000))
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="edit-session")
+    gateway = LLMGateway()
+    cost_table = None if args.prose else CostTable(RATES)
+    ctx = sample_trip()
+    system_prompt = build_system_prompt_text("Asia/Kolkata", "Panaji, India", 0)
+    generated = []
+
+    def on_usage(usage, kind, **timings):
+        if usage is not None:
+            generated.append(usage.completion_tokens)
+
+    started = time.perf_counter()
+    itinerary = asyncio.run(ItineraryEngine(AsyncGatewayClient(gateway), cost_table=cost_table).generate(
+        system_prompt, build_trip_prompt(ctx), ctx, on_usage=on_usage
+    ))
+    full_seconds = time.perf_counter() - started
+    full_tokens = count_tokens(itinerary)
+    print(f"full generation: {full_seconds:.2f}s, {len(generated)} calls, ~{full_tokens} output tokens")
+
+    editor = ItineraryEditor(GatewayClient(gateway), cost_table=cost_table)
+    failures = 0
+    for request in EDITS:
+        before = parse_itinerary(itinerary)
+        started = time.perf_counter()
+        result = editor.edit(system_prompt, itinerary, request, ctx)
+        seconds = time.perf_counter() - started
+        if result is None:
+            print(f"{request!r}: not patchable, would fall back to a full reply")
+            continue
+        itinerary, (days, finals) = result
+        after = parse_itinerary(itinerary)
+        changed = [d for d in days if before.days[d] != after.days[d]] + [k for k in finals if before.finals.get(k) != after.finals.get(k)]
+        edited_tokens = sum(count_tokens(after.days[d]) for d in days) + sum(count_tokens(after.finals.get(k, "")) for k in finals)
+        problems = check(before, after, days)
+        failures += bool(problems)
+        print(
+            f"{request!r}: days={days} finals={finals} changed={changed} {seconds:.2f}s "
+            f"~{edited_tokens} output tokens ({edited_tokens / full_tokens:.0%} of full)"
+            + ("" if not problems else "\n  FAIL: " + "; ".join(problems))
+        )
+    server.shutdown()
+    print(f"{len(EDITS)} edits, {failures} failed, gateway stats: {gateway.stats}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""A local OpenAI-compatible stub server for exercising Trivanza without the real API.
+
+Serves POST /v1/chat/completions (JSON and SSE streaming) with configurable latency,
+streaming speed and injected 429s, and sends `x-ratelimit-*` headers like the real API.
+
+    python bench/fake_openai_server.py --port 8765 --latency 0.3 --tokens-per-second 200 --rate-429 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test streamlit run trivanza_server.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Items returned for days rewritten by an itinerary edit.
+EDITED_ITEMS = [
+    {"time": "10:00", "category": "Activities", "title": "Spice Plantation Tour", "details": "A slower morning among the spice gardens.", "link": "", "amount": 1500, "currency": "INR"},
+    {"time": "19:30", "category": "Accommodation", "title": "Casa Anjuna", "details": "A cheaper heritage stay.", "link": "https://www.booking.com/", "amount": 6500, "currency": "INR"},
+]
+# One JSON object that satisfies every structured request the app makes
+# (itinerary skeleton, day items, packing/tip extras, itinerary edits).
+STRUCTURED_REPLY = {
+    "greeting": "Namaste Traveler! Your trip sounds wonderful. Let's get it planned for you!",
+    "days": [{"day": i + 1, "city": "Goa", "theme": "Beaches and Forts", "items": EDITED_ITEMS} for i in range(30)],
+    "items": [
+        {"time": "09:00", "category": "Meals", "title": "Cafe Bodega", "details": "Breakfast in a courtyard cafe.", "link": "", "amount": 900, "currency": "INR"},
+        {"time": "11:00", "category": "Activities", "title": "Fort Aguada", "details": "Explore the 17th-century fort.", "link": "", "amount": 100, "currency": "INR"},
+        {"time": "20:00", "category": "Accommodation", "title": "Taj Fort Aguada Resort", "details": "Sea-view room.", "link": "https://www.booking.com/", "amount": 12000, "currency": "INR"},
+    ],
+    "packing_checklist": ["Sunscreen", "Light cotton clothes", "Sandals"],
+    "pro_tip": "Rent a scooter to hop between beaches.",
+}
+FILLER = "Certainly! Here is some helpful travel information for you. "
+FINAL_REPLY = (
+    "🧾 Cost Breakdown:\n\n- Flights: ₹10,000\n- Accommodation: ₹10,000\n- Meals: ₹5,000\n\n"
+    "💰 Grand Total: ₹25,000\n\n🎒 Packing Checklist:\n\n- Sunscreen\n- Sandals\n\n"
+    "💼 Budget Analysis: You are within budget.\n\n📌 Destination Pro Tip: Rent a scooter.\n\n"
+    "⚠️ *Disclaimer: All estimated costs are for guidance only.*"
+)
+EXACT_HEADING_RE = re.compile(r"Start with exactly this heading: `([^`]+)`")
+DAY_HEADING_RE = re.compile(r"^### Day \d+.*$", re.MULTILINE)
+
+
+def prose_reply(request, filler):
+    """Echoes the day headings a prose itinerary prompt asks for, so the sections can be parsed."""
+    messages = request.get("messages") or [{}]
+    prompt = str(messages[-1].get("content", ""))
+    if "Write ONLY the final sections" in prompt:
+        return FINAL_REPLY
+    headings = EXACT_HEADING_RE.findall(prompt)
+    if "Rewrite ONLY these sections" in prompt:
+        headings = DAY_HEADING_RE.findall(prompt)
+    if not headings:
+        return filler
+    return "\n\n".join(f"{heading}\n\n{filler}\n\n🎯 Daily Total: ₹5,000" for heading in headings)
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency=0.2, tokens_per_second=400.0, completion_tokens=120, rate_429=0.0,
+                 requests_per_minute=10000, tokens_per_minute=2000000, reject_first=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.rate_429 = rate_429
+        # The first `reject_first` requests get a 429, for deterministic retry checks.
+        self.reject_first = reject_first
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "streams": 0}
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _ratelimit_headers(self):
+            return {
+                "x-ratelimit-limit-requests": str(config.requests_per_minute),
+                "x-ratelimit-remaining-requests": str(config.requests_per_minute - 1),
+                "x-ratelimit-limit-tokens": str(config.tokens_per_minute),
+                "x-ratelimit-remaining-tokens": str(config.tokens_per_minute - 1000),
+                "x-ratelimit-reset-requests": "6ms",
+                "x-ratelimit-reset-tokens": "30ms",
+            }
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            with config.lock:
+                config.stats["requests"] += 1
+                limited = config.stats["requests"] <= config.reject_first or random.random() < config.rate_429
+                if limited:
+                    config.stats["rate_limited"] += 1
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                return
+            if limited:
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                dict(self._ratelimit_headers(), **{"retry-after-ms": "50"}))
+                return
+
+            structured = (request.get("response_format") or {}).get("type") == "json_object"
+            n_tokens = min(config.completion_tokens, int(request.get("max_tokens") or config.completion_tokens))
+            content = json.dumps(STRUCTURED_REPLY) if structured else prose_reply(request, (FILLER * (n_tokens // 10 + 1))[: n_tokens * 5])
+            prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in request.get("messages", []))
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": n_tokens,
+                "total_tokens": prompt_tokens + n_tokens,
+                "prompt_tokens_details": {"cached_tokens": (prompt_tokens // 1024) * 1024 // 2},
+            }
+            time.sleep(config.latency)
+            base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": request.get("model", "gpt-4o")}
+
+            if not request.get("stream"):
+                time.sleep(n_tokens / config.tokens_per_second)
+                self._send_json(200, dict(base, object="chat.completion", choices=[{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }], usage=usage), self._ratelimit_headers())
+                return
+
+            with config.lock:
+                config.stats["streams"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            for name, value in self._ratelimit_headers().items():
+                self.send_header(name, value)
+            self.end_headers()
+            pieces = [content[i:i + 5] for i in range(0, len(content), 5)]
+            try:
+                for piece in pieces:
+                    self._write_event(dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+                    time.sleep(1 / config.tokens_per_second)
+                self._write_event(dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    self._write_event(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client cancelled the stream
+
+        def _write_event(self, payload):
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Starts the server in a daemon thread; returns (server, base_url)."""
+    config = config or FakeOpenAIConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    args = parser.parse_args(argv)
+    config = FakeOpenAIConfig(args.latency, args.tokens_per_second, args.completion_tokens, args.rate_429)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Counts script and fragment runs per chat turn against a real Streamlit server.
+
+AppTest executes a fragment as part of a full script run, so it cannot tell whether a
+chat message re-runs the whole page. This starts trivanza_server.py with `streamlit run`
+(against bench/fake_openai_server.py) and drives one session over the websocket protocol
+the browser uses: it loads the page, then submits each chat message the way the frontend
+does, as a rerun of the chat fragment. The counts are the app's own server-side
+trivanza_executions_total counters, read from the Prometheus file it writes on exit, plus
+the run type the server reports for every turn.
+
+    python bench/fragment_reruns.py --turns 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from http.cookies import SimpleCookie
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SERVER_PATH = os.path.join(ROOT, "trivanza_server.py")
+sys.path[:0] = [HERE, ROOT]
+
+from fake_openai_server import FakeOpenAIConfig  # noqa: E402
+from load_test import CHAT_TURNS, _free_port, start_stub_server  # noqa: E402
+
+EXECUTIONS_RE = re.compile(r'^trivanza_executions_total\{kind="(\w+)"\} (\S+)$', re.MULTILINE)
+
+
+def start_app(port, env, timeout=60.0):
+    """Runs trivanza_server.py under `streamlit run` and waits for its health check."""
+    process = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", SERVER_PATH, "--server.port", str(port),
+        "--server.headless", "true", "--browser.gatherUsageStats", "false",
+    ], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("The app did not start")
+
+
+def page_cookies(port):
+    """Loads the page like a browser and returns the cookies it set (incl. the session cookie)."""
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=10) as response:
+        cookie = SimpleCookie()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookie.load(header)
+    return "; ".join(f"{name}={morsel.value}" for name, morsel in cookie.items())
+
+
+async def run_session(port, messages, timeout):
+    """Loads the app, sends each chat message, and returns the run status of every turn."""
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    from websockets.asyncio.client import connect
+
+    state = {"page_script_hash": "", "chat_input": None, "fragment_id": ""}
+
+    async def run(websocket, client_state):
+        back = BackMsg()
+        back.rerun_script.CopyFrom(client_state)
+        await websocket.send(back.SerializeToString())
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await asyncio.wait_for(websocket.recv(), timeout))
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                state["page_script_hash"] = msg.new_session.page_script_hash
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                if msg.delta.new_element.WhichOneof("type") == "chat_input":
+                    state["chat_input"] = msg.delta.new_element.chat_input.id
+                    state["fragment_id"] = msg.delta.fragment_id
+            elif kind == "script_finished":
+                return ForwardMsg.ScriptFinishedStatus.Name(msg.script_finished)
+
+    from streamlit.proto.ClientState_pb2 import ClientState
+
+    headers = {"Cookie": page_cookies(port), "Origin": f"http://127.0.0.1:{port}"}
+    async with connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"],
+                       additional_headers=headers, max_size=None) as websocket:
+        statuses = {"page_load": await run(websocket, ClientState())}
+        if not state["chat_input"]:
+            raise RuntimeError("The page has no chat input")
+        turns = []
+        for text in messages:
+            client_state = ClientState(page_script_hash=state["page_script_hash"], fragment_id=state["fragment_id"])
+            widget = client_state.widget_states.widgets.add(id=state["chat_input"])
+            widget.chat_input_value.data = text
+            started = time.perf_counter()
+            status = await run(websocket, client_state)
+            turns.append({"status": status, "seconds": time.perf_counter() - started})
+        statuses["turns"] = turns
+    return statuses
+
+
+def read_executions(prom_path):
+    with open(prom_path, encoding="utf-8") as f:
+        return {kind: float(value) for kind, value in EXECUTIONS_RE.findall(f.read())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-run timeout (s)")
+    args = parser.parse_args(argv)
+
+    stub, base_url = start_stub_server(FakeOpenAIConfig(latency=0.05, tokens_per_second=2000.0))
+    prom_path = os.path.join(tempfile.mkdtemp(prefix="trivanza-reruns-"), "metrics.prom")
+    env = dict(
+        os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="rerun-bench", TRIVANZA_METRICS_PROM=prom_path,
+        TRIVANZA_SESSION_STORE="off", TRIVANZA_ITINERARY_CACHE="off",
+    )
+    port = _free_port()
+    app = start_app(port, env, args.timeout)
+    try:
+        messages = [CHAT_TURNS[i % len(CHAT_TURNS)] for i in range(args.turns)]
+        statuses = asyncio.run(run_session(port, messages, args.timeout))
+    finally:
+        app.send_signal(signal.SIGINT)  # a clean shutdown writes the metrics file
+        try:
+            app.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            app.kill()
+        stub.terminate()
+
+    executions = read_executions(prom_path)
+    # The page load runs the script (and the chat fragment inside it) once.
+    print(json.dumps({
+        "turns": executions.get("turns", 0),
+        "script_runs": executions.get("script", 0),
+        "chat_fragment_runs": executions.get("chat_fragment", 0),
+        "script_runs_per_turn": (executions.get("script", 0) - 1) / args.turns,
+        "fragment_only_runs_per_turn": (executions.get("chat_fragment", 0) - executions.get("script", 0)) / args.turns,
+        "page_load": statuses["page_load"],
+        "turn_statuses": sorted({turn["status"] for turn in statuses["turns"]}),
+        "turn_seconds_max": max(turn["seconds"] for turn in statuses["turns"]),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
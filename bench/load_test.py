@@ -0,0 +1,289 @@
+"""Load test: drive trivanza_chatbot.py through scripted sessions against a stub OpenAI server.
+
+Each simulated traveler is a `streamlit.testing.v1.AppTest` session that initializes
+(with a stubbed location component), submits the "Plan My Trip" form and then sends
+N chat turns. Sessions run concurrently at each requested level; the OpenAI client
+points at bench/fake_openai_server.py running in a separate process, so the
+measured CPU time and RSS belong to the app alone. Every level runs in a fresh
+subprocess, so its peak_rss_mb is that level's own high-water mark (ru_maxrss never
+goes down within a process) and rss_growth_mb is the growth over the warmed-up app.
+AppTest runs fragments inside full script runs, so rerun counts come from
+bench/fragment_reruns.py, which drives a real server instead.
+
+    python bench/load_test.py --sessions 1 10 100 --turns 5 --output bench_results.json
+    python bench/load_test.py --compare bench_results.json   # re-run and diff against a baseline
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+APP_PATH = os.path.join(ROOT, "trivanza_chatbot.py")
+sys.path[:0] = [HERE, ROOT]
+
+from fake_openai_server import FakeOpenAIConfig  # noqa: E402
+from trivanza_metrics import percentile  # noqa: E402
+
+STUB_LOCATION = {"status": "GPS_SUCCESS", "lat": 15.4909, "lon": 73.8278, "browser_timezone": "Asia/Kolkata"}
+CHAT_TURNS = [
+    "Where is the nearest ATM?",
+    "What's the best way to get from the airport to my hotel?",
+    "Can you suggest a vegetarian dinner spot that's open late?",
+    "Do I need a SIM card for this trip?",
+    "Make Day 2 a bit more relaxed please.",
+]
+# Streamlit releases (major.minor) whose internals allow_concurrent_apptests() was checked against.
+CONCURRENT_APPTEST_VERSIONS = ("1.65",)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(config):
+    """Starts the stub server in a subprocess and waits until it accepts connections."""
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_openai_server.py"), "--port", str(port),
+        "--latency", str(config.latency), "--tokens-per-second", str(config.tokens_per_second),
+        "--completion-tokens", str(config.completion_tokens), "--rate-429", str(config.rate_429),
+    ], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Stub server did not start")
+
+
+def stub_location_component():
+    """Makes the location component report fixed coordinates, as a browser would."""
+    import streamlit.components.v1 as components
+
+    components.html = lambda *args, **kwargs: dict(STUB_LOCATION)
+
+
+def check_streamlit_internals():
+    """Fails unless this Streamlit is one allow_concurrent_apptests() was written against."""
+    import streamlit
+    import streamlit.runtime.scriptrunner.magic as magic
+    from streamlit.runtime import Runtime
+
+    version = ".".join(streamlit.__version__.split(".")[:2])
+    missing = [name for owner, name in ((Runtime, "_instance"), (Runtime, "instance"), (Runtime, "exists"),
+                                        (magic, "add_magic")) if not hasattr(owner, name)]
+    if version not in CONCURRENT_APPTEST_VERSIONS or missing:
+        raise RuntimeError(
+            f"Concurrent sessions patch Streamlit internals checked against {', '.join(CONCURRENT_APPTEST_VERSIONS)} "
+            f"only; this is Streamlit {streamlit.__version__}" + (f" (missing {', '.join(missing)})" if missing else "")
+            + ". Re-check allow_concurrent_apptests() and add the version, or run with --sessions 1."
+        )
+
+
+def allow_concurrent_apptests():
+    """AppTest assumes one test runs at a time; make its process-wide state shareable.
+
+    Each run installs a mock Runtime singleton and clears it when done, which breaks any
+    run still in progress on another thread, so a cleared singleton falls back to the
+    last one seen. The same goes for the "global.appTest" option, which is simply left on.
+    Streamlit's magic rewrite uses ast.parse, which is not thread-safe on Python 3.11,
+    so it is serialized. These are Streamlit internals, so this refuses to run on a
+    version it was not checked against (see check_streamlit_internals).
+    """
+    check_streamlit_internals()
+    import streamlit.runtime.scriptrunner.magic as magic
+    from streamlit import config
+    from streamlit.runtime import Runtime
+
+    config.set_option("global.appTest", True)
+
+    last_runtime = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last_runtime[:] = [cls._instance]
+            return cls._instance
+        if last_runtime:
+            return last_runtime[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last_runtime))
+
+    add_magic = magic.add_magic
+    magic_lock = threading.Lock()
+
+    def locked_add_magic(*args, **kwargs):
+        with magic_lock:
+            return add_magic(*args, **kwargs)
+
+    magic.add_magic = locked_add_magic
+
+
+def run_session(turns, timeout):
+    """Runs one scripted traveler session and returns its measurements."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    turn_latencies = []
+    errors = 0
+
+    def timed_run(action):
+        nonlocal errors
+        started = time.perf_counter()
+        action.run()
+        turn_latencies.append(time.perf_counter() - started)
+        errors += len(at.exception) + len(at.error)
+
+    at.run()  # initialization + location
+    at.text_input(key="origin").set_value("New Delhi")
+    at.text_input(key="destination").set_value("Goa")
+    at.date_input(key="to_date").set_value(date.today() + timedelta(days=3))
+    timed_run(at.button[0].click())
+    for i in range(turns):
+        timed_run(at.chat_input[0].set_value(CHAT_TURNS[i % len(CHAT_TURNS)]))
+
+    counts = at.session_state.execution_counts
+    return {
+        "turn_latencies": turn_latencies,
+        "errors": errors,
+        "turns": counts["turns"],
+    }
+
+
+def peak_rss_mb():
+    """High-water mark of this process's RSS (ru_maxrss is in KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_level(sessions, turns, timeout):
+    """Runs `sessions` concurrent sessions and aggregates their measurements."""
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(lambda _: run_session(turns, timeout), range(sessions)))
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    latencies = sorted(t for r in results for t in r["turn_latencies"])
+    total_turns = sum(r["turns"] for r in results) or 1
+    return {
+        "sessions": sessions,
+        "turns_per_session": turns + 1,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "cpu_ms_per_turn": cpu * 1000 / total_turns,
+        "peak_rss_mb": peak_rss_mb(),
+        "turn_latency_p50": percentile(latencies, 0.50),
+        "turn_latency_p99": percentile(latencies, 0.99),
+        "errors": sum(r["errors"] for r in results),
+    }
+
+
+def measure_level(sessions, turns, timeout):
+    """Warms up the app, then runs one level; meant to run in a fresh process (see --level)."""
+    stub_location_component()
+    # Sessions run in plain worker threads; Streamlit warns about that on every run.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    if sessions > 1:
+        allow_concurrent_apptests()
+    run_session(1, timeout)  # warm-up: imports, caches and the shared Runtime mock
+    warm_rss = peak_rss_mb()
+    level = run_level(sessions, turns, timeout)
+    level["warm_rss_mb"] = warm_rss
+    level["rss_growth_mb"] = level["peak_rss_mb"] - warm_rss
+    return level
+
+
+def run_level_subprocess(sessions, turns, timeout):
+    """Runs measure_level() in a child process and returns its results."""
+    completed = subprocess.run([
+        sys.executable, os.path.abspath(__file__), "--level", str(sessions),
+        "--turns", str(turns), "--timeout", str(timeout),
+    ], stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(current, baseline):
+    """Prints relative changes of every numeric result against a baseline run."""
+    baseline_levels = {level["sessions"]: level for level in baseline.get("levels", [])}
+    for level in current["levels"]:
+        before = baseline_levels.get(level["sessions"])
+        if not before:
+            continue
+        print(f"--- {level['sessions']} sessions vs baseline ---")
+        for key, value in level.items():
+            if key == "sessions" or not isinstance(value, (int, float)) or not before.get(key):
+                continue
+            print(f"{key:>28}: {before[key]:10.3f} -> {value:10.3f} ({(value - before[key]) / before[key]:+.1%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns after the form submission")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Stub streaming speed")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of stub responses that are 429s")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-run AppTest timeout (s)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Baseline results JSON to diff against")
+    parser.add_argument("--level", type=int, help=argparse.SUPPRESS)  # one level, in a child process
+    args = parser.parse_args(argv)
+
+    if args.level:
+        # The parent has already started the stub server and set up the environment.
+        print(json.dumps(measure_level(args.level, args.turns, args.timeout)))
+        return
+
+    if max(args.sessions) > 1:
+        check_streamlit_internals()  # before any level runs, not halfway through
+    config = FakeOpenAIConfig(args.latency, args.tokens_per_second, args.completion_tokens, args.rate_429)
+    server, base_url = start_stub_server(config)
+    os.environ.update(
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY="load-test",
+        TRIVANZA_ITINERARY_CACHE="off",
+        TRIVANZA_SESSION_PATH=os.path.join(tempfile.mkdtemp(prefix="trivanza-load-"), "sessions.sqlite3"),
+    )
+    try:
+        levels = []
+        for sessions in args.sessions:
+            level = run_level_subprocess(sessions, args.turns, args.timeout)
+            levels.append(level)
+            print(json.dumps(level))
+    finally:
+        server.terminate()
+
+    results = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "stub": vars(args),
+        "levels": levels,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
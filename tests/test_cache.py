@@ -0,0 +1,111 @@
+import json
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import trivanza_cache
+from trivanza_cache import ItineraryCache, canonical_trip_key, prewarm, shift_dates
+
+CTX = {
+    "origin": "New Delhi", "destination": "Goa", "from_date": date(2026, 11, 1), "to_date": date(2026, 11, 3),
+    "group_size": 2, "budget_amount": 30000, "currency_type": "₹ INR", "traveler_type": "Couple",
+    "food_preferences": ["Vegetarian", "Local"], "accommodation_pref": ["Hotel"],
+}
+ITINERARY = "### Day 1: Beaches – Panaji (2026-11-01)\n\n### Day 3: Forts – Panaji (2026-11-03)"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ItineraryCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=3600)
+
+
+def test_key_normalisation():
+    same = dict(CTX, origin="  new   DELHI ", destination="goa", food_preferences=["local", "Vegetarian"],
+                from_date=date(2026, 11, 20), to_date=date(2026, 11, 22), traveler_type="couple")
+    assert canonical_trip_key(same) == canonical_trip_key(CTX)
+    assert canonical_trip_key(dict(CTX, from_date="2026-11-01", to_date="2026-11-03")) == canonical_trip_key(CTX)
+    for change in ({"to_date": date(2026, 11, 4)}, {"from_date": date(2026, 12, 1), "to_date": date(2026, 12, 3)},
+                   {"group_size": 3}, {"destination": "Goa, India"}, {"accommodation_pref": ["Hostel"]}):
+        assert canonical_trip_key(dict(CTX, **change)) != canonical_trip_key(CTX)
+
+
+def test_cached_itinerary_is_re_anchored_to_the_new_dates(cache):
+    cache.put(CTX, ITINERARY)
+    later = dict(CTX, from_date=date(2026, 11, 28), to_date=date(2026, 11, 30))
+    assert cache.get(later) == "### Day 1: Beaches – Panaji (2026-11-28)\n\n### Day 3: Forts – Panaji (2026-11-30)"
+    assert cache.get(CTX) == ITINERARY
+    assert shift_dates("until 2026-02-30 or 2026-12-31", 1) == "until 2026-02-30 or 2027-01-01"
+
+
+def test_ttl_expiry(cache, monkeypatch):
+    now = 1_800_000_000.0
+    monkeypatch.setattr(trivanza_cache.time, "time", lambda: now)
+    cache.put(CTX, ITINERARY)
+    now += 3600
+    assert cache.contains(CTX) and cache.get(CTX) == ITINERARY
+    now += 1
+    assert not cache.contains(CTX)
+    assert cache.get(CTX) is None
+    assert cache.stats()["entries"] == 0  # the expired row was deleted on lookup
+
+
+def test_hit_miss_stats_and_contains_does_not_count(cache):
+    assert cache.get(CTX) is None
+    assert not cache.contains(CTX)
+    cache.put(CTX, ITINERARY)
+    assert cache.contains(CTX)
+    cache.get(CTX)
+    cache.get(dict(CTX, from_date=date(2026, 11, 10), to_date=date(2026, 11, 12)))
+    assert cache.stats() == {"hits": 2, "misses": 1, "hit_rate": 2 / 3, "entries": 1}
+
+
+def test_lru_eviction(tmp_path):
+    cache = ItineraryCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    trips = [dict(CTX, group_size=n) for n in (1, 2, 3)]
+    cache.put(trips[0], "one")
+    cache.put(trips[1], "two")
+    cache.get(trips[0])  # now more recently used than trips[1]
+    cache.put(trips[2], "three")
+    assert [cache.contains(trip) for trip in trips] == [True, False, True]
+
+
+class FakeGateway:
+    """Answers the structured itinerary engine's requests and records them."""
+
+    def __init__(self):
+        self.requests = []
+
+    def last_queue_seconds(self):
+        return 0.0
+
+    def create(self, priority, deadline, **kwargs):
+        self.requests.append(kwargs)
+        if "outline of a travel itinerary" in kwargs["messages"][0]["content"]:
+            content = json.dumps({"greeting": "Namaste Traveler!",
+                                  "days": [{"day": n, "city": "Panaji", "theme": "Beaches"} for n in (1, 2, 3)]})
+        elif "packing_checklist" in kwargs["messages"][-1]["content"]:
+            content = json.dumps({"packing_checklist": ["Sunscreen"], "pro_tip": "Rent a scooter."})
+        else:
+            content = json.dumps({"items": [{"time": "10:00", "category": "Activities", "title": "Fort", "details": "",
+                                             "link": "", "amount": 1000, "currency": "INR"}]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def test_prewarm_uses_the_structured_engine_and_skips_cached_trips(cache, tmp_path):
+    csv_path = tmp_path / "trips.csv"
+    csv_path.write_text(
+        "origin,destination,from_date,to_date,group_size,budget_amount,currency_type,food_preferences\n"
+        "New Delhi,Goa,2026-11-01,2026-11-03,2,30000,₹ INR,Vegetarian;Local\n"
+        "Mumbai,Jaipur,2026-12-01,2026-12-03,1,20000,₹ INR,\n",
+        encoding="utf-8",
+    )
+    cache.put(dict(CTX, traveler_type="", accommodation_pref=[]), ITINERARY)  # the Goa trip is already cached
+    gateway = FakeGateway()
+    assert prewarm(str(csv_path), cache, concurrency=2, gateway=gateway) == {"generated": 1, "failed": 0}
+    # One outline, three days and the extras, each a small request instead of one long reply.
+    assert len(gateway.requests) == 5 and max(r["max_tokens"] for r in gateway.requests) < 3500
+    jaipur = cache.get({"origin": "Mumbai", "destination": "Jaipur", "from_date": date(2026, 12, 1),
+                        "to_date": date(2026, 12, 3), "group_size": 1, "budget_amount": 20000, "currency_type": "₹ INR"})
+    assert "### Day 3: Beaches – Panaji (2026-12-03)" in jaipur and "Grand Total" in jaipur
+    assert cache.stats()["misses"] == 0  # only the lookup above counted
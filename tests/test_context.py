@@ -0,0 +1,100 @@
+import trivanza_context
+from trivanza_context import ConversationContext, count_tokens, extractive_summary, message_tokens, prepare_markdown
+
+# The app's default TRIVANZA_CONTEXT_BUDGET (trivanza_chatbot.CONTEXT_TOKEN_BUDGET).
+CONTEXT_TOKEN_BUDGET = 6000
+SYSTEM_PROMPT = "You are Trivanza, a travel planning assistant."
+ITINERARY = "Here is your plan.\n\n" + "\n\n".join(
+    f"### Day {n}: Sightseeing (2026-11-0{n})\n\n**Museum {n}**\n\n💰 Cost: ₹1,000\n\n" + "Details. " * 150
+    for n in range(1, 6)
+)
+
+
+def user_turn(n):
+    return {"role": "user", "content": f"Turn {n}: what else is there to do near the old town? " + "Tell me more. " * 150}
+
+
+def assistant_turn(n):
+    return {"role": "assistant", "content": f"Answer {n}: try the night market and the riverside walk. " + "Lovely. " * 300}
+
+
+def payload_tokens(payload):
+    """Tokens of everything sent except the system prompt, which the budget does not cover."""
+    return sum(message_tokens(m) for m in payload[1:])
+
+
+def test_fifty_turns_stay_within_budget():
+    context = ConversationContext(CONTEXT_TOKEN_BUDGET)
+    calls = []
+
+    def summarize(previous, messages):
+        calls.append(messages)
+        return extractive_summary(previous, messages)
+
+    messages = [user_turn(0), {"role": "assistant", "content": ITINERARY}]
+    largest = 0
+    for n in range(1, 51):
+        messages.append(user_turn(n))
+        payload = context.build_payload(SYSTEM_PROMPT, messages, summarize=summarize)
+        assert payload[0] == {"role": "system", "content": SYSTEM_PROMPT}
+        largest = max(largest, payload_tokens(payload))
+        assert largest <= CONTEXT_TOKEN_BUDGET
+        assert count_tokens(context.summary) <= context.summary_tokens
+        # The itinerary and the newest turn are always sent verbatim.
+        assert payload[-1] == messages[-1]
+        assert {"role": "assistant", "content": ITINERARY} in payload
+        messages.append(assistant_turn(n))
+
+    # The budget, not just the turn limit, decided what was sent.
+    assert largest > CONTEXT_TOKEN_BUDGET * 0.8
+    assert len(payload) < len(messages)
+    # Each turn is folded into the summary exactly once, in order, and the itinerary never is.
+    folded = [m for batch in calls for m in batch]
+    assert folded == [m for m in messages[:context.summarized_count] if m["content"] != ITINERARY]
+    summary = payload[1]
+    assert summary["role"] == "system" and summary["content"].startswith("Summary of the earlier conversation:")
+    assert "Turn 0" not in summary["content"]  # the oldest folds were truncated away
+    assert " ".join(folded[-1]["content"].split())[:200] in summary["content"]
+
+
+def test_summary_is_reset_when_history_is_cleared():
+    context = ConversationContext(budget_tokens=300, summary_tokens=100, max_recent_messages=2)
+    messages = []
+    for n in range(6):
+        messages += [user_turn(n), assistant_turn(n)]
+    context.build_payload(SYSTEM_PROMPT, messages)
+    assert context.summary and context.summarized_count > 0
+
+    payload = context.build_payload(SYSTEM_PROMPT, [user_turn(99)])
+    assert context.summary == "" and context.summarized_count == 0
+    assert payload == [{"role": "system", "content": SYSTEM_PROMPT}, user_turn(99)]
+
+
+def test_short_conversation_is_sent_verbatim():
+    context = ConversationContext(CONTEXT_TOKEN_BUDGET)
+    messages = [user_turn(1), assistant_turn(1), user_turn(2)]
+    payload = context.build_payload(SYSTEM_PROMPT, messages, summarize=lambda *a: 1 / 0)
+    assert payload == [{"role": "system", "content": SYSTEM_PROMPT}] + messages
+    assert context.summary == ""
+
+
+def test_token_cache_is_bounded_and_holds_no_text(monkeypatch):
+    monkeypatch.setattr(trivanza_context, "TOKEN_CACHE_SIZE", 10)
+    monkeypatch.setattr(trivanza_context, "_token_counts", trivanza_context.OrderedDict())
+    texts = [f"message number {n} " * 20 for n in range(25)]
+    counts = [count_tokens(text) for text in texts]
+    assert len(trivanza_context._token_counts) == 10
+    assert not any(isinstance(part, str) for key in trivanza_context._token_counts for part in key)
+    assert [count_tokens(text) for text in texts] == counts
+
+
+def test_render_cache_is_bounded_and_keeps_only_changed_text(monkeypatch):
+    monkeypatch.setattr(trivanza_context, "RENDER_CACHE_SIZE", 10)
+    monkeypatch.setattr(trivanza_context, "_prepared", trivanza_context.OrderedDict())
+    indented = [f"\n    Day {n}\n    Visit the fort.\n" for n in range(15)]
+    plain = [f"Reply {n}" for n in range(5)]
+    assert [prepare_markdown(text) for text in indented] == [f"Day {n}\nVisit the fort." for n in range(15)]
+    assert [prepare_markdown(text) for text in plain] == plain
+    assert len(trivanza_context._prepared) == 10
+    assert sum(value is not None for value in trivanza_context._prepared.values()) == 5
+    assert prepare_markdown(indented[-1]) == "Day 14\nVisit the fort."
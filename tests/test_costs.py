@@ -0,0 +1,65 @@
+import json
+import math
+
+import pandas as pd
+
+from trivanza_costs import (
+    UNCONVERTED_NOTE, CostTable, parse_day_items, parse_rendered_items, render_budget_analysis,
+    render_cost_breakdown, render_day,
+)
+
+RATES = pd.DataFrame([{"Code": "USD", "INR_Value": 86.28}])
+
+
+def day_items(*rows):
+    items = [
+        {"time": "10:00", "category": category, "title": title, "details": "", "link": "", "amount": amount, "currency": code}
+        for category, title, amount, code in rows
+    ]
+    return parse_day_items(json.dumps({"items": items}), 1)
+
+
+def test_unknown_currency_is_never_converted_one_to_one():
+    table = CostTable(RATES)
+    items = table.convert(day_items(
+        ("Activities", "Temple", 1_500_000, "IDR"), ("Meals", "Lunch", 20, "USD"), ("Meals", "Tea", 100, ""),
+    ), "INR")
+    assert math.isnan(items["amount_target"][0])
+    assert list(items["amount_target"][1:]) == [20 * 86.28, 100]
+
+    day = render_day("### Day 1: Temples", items, "INR")
+    assert f"Cost: IDR 1,500,000 {UNCONVERTED_NOTE} · Activities" in day
+    assert "🎯 Daily Total: ₹1,826" in day
+    assert "Not included: items priced in IDR" in day
+    assert "💰 Grand Total: ₹1,826" in render_cost_breakdown(items, table, "INR")
+    assert "% over" not in render_budget_analysis(items, "INR", 10_000)
+
+
+def test_rendered_unconverted_items_stay_out_of_totals():
+    table = CostTable(RATES)
+    items = table.convert(day_items(("Activities", "Temple", 1_500_000, "IDR"), ("Meals", "Lunch", 20, "USD")), "INR")
+    parsed = parse_rendered_items(render_day("### Day 1: Temples", items, "INR"), 1)
+    assert list(parsed["currency"]) == ["IDR", "USD"]
+    assert math.isnan(parsed["amount_target"][0])
+    assert parsed["amount_target"].sum() == 1726
+
+
+def test_unknown_target_currency_is_never_treated_as_inr():
+    table = CostTable(RATES)
+    assert math.isnan(table.rate("USD", "IDR")) and math.isnan(table.rate("IDR", "INR"))
+    assert table.rate("IDR", "IDR") == 1.0 and table.rate("USD", "INR") == 86.28
+    items = table.convert(day_items(
+        ("Meals", "Lunch", 20, "USD"), ("Meals", "Tea", 100, "INR"), ("Meals", "Satay", 50_000, "IDR"),
+        ("Meals", "Juice", 10_000, ""),
+    ), "IDR")
+    assert math.isnan(items["amount_target"][0]) and math.isnan(items["amount_target"][1])
+    assert list(items["amount_target"][2:]) == [50_000, 10_000]
+    assert "Not included: items priced in INR, USD" in render_day("### Day 1: Bali", items, "IDR")
+
+
+def test_categories_are_matched_case_insensitively():
+    items = day_items(
+        ("flights", "DEL-GOI", 5000, "INR"), (" MEALS ", "Lunch", 500, "INR"), ("travel extras", "SIM", 300, "INR"),
+        ("Shopping", "Souvenirs", 800, "INR"),
+    )
+    assert list(items["category"]) == ["Flights", "Meals", "Travel Extras", "Travel Extras"]
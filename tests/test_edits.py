@@ -0,0 +1,247 @@
+import json
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from trivanza_costs import (
+    DISCLAIMER, CostTable, parse_day_items, parse_money, render_budget_analysis, render_cost_breakdown, render_day,
+)
+from trivanza_edits import ItineraryEditor, parse_itinerary, select_targets
+from trivanza_itinerary import CLOSING_LINE, unplanned_day
+
+RATES = pd.DataFrame([{"Code": "USD", "INR_Value": 86.28}, {"Code": "EUR", "INR_Value": 99.75}])
+START = date(2026, 11, 1)
+CITIES = ["Panaji", "Panaji", "Calangute", "Anjuna", "Panaji"]
+CTX = {"currency_type": "₹ INR", "budget_amount": 60000}
+
+
+def item(title, amount, currency="INR", category="Activities", time="10:00"):
+    return {"time": time, "category": category, "title": title, "details": "", "link": "", "amount": amount, "currency": currency}
+
+
+class FakeClient:
+    """Stands in for the gateway: returns the queued replies and records the requests."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        content = self.replies.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def structured_itinerary(table):
+    days = []
+    for n, city in enumerate(CITIES, start=1):
+        items = [item(f"Breakfast {n}", 600, category="Meals", time="09:00"), item(f"Fort {n}", 10, "EUR"),
+                 item(f"Hotel {n}", 7000, category="Accommodation", time="20:00")]
+        days.append(table.convert(parse_day_items(json.dumps({"items": items}), n), "INR"))
+    all_items = pd.concat(days, ignore_index=True)
+    headings = [f"### Day {n}: Beaches – {city} ({START + timedelta(days=n - 1)})" for n, city in enumerate(CITIES, start=1)]
+    return "\n\n".join(
+        ["Namaste Traveler! A 5-day getaway to Goa sounds wonderful."]
+        + [render_day(heading, day, "INR") for heading, day in zip(headings, days)]
+        + [render_cost_breakdown(all_items, table, "INR"), "🎒 Packing Checklist:\n\n- Sunscreen",
+           render_budget_analysis(all_items, "INR", CTX["budget_amount"]), "📌 Destination Pro Tip: Rent a scooter.",
+           DISCLAIMER, CLOSING_LINE]
+    )
+
+
+def assert_consistent(before, after, edited_days):
+    """Untouched days are byte-identical, the day list is unchanged, the totals add up."""
+    assert list(after.days) == list(before.days)
+    for day, section in before.days.items():
+        if day not in edited_days:
+            assert after.days[day] == section
+    daily = [parse_money(section.rsplit("🎯", 1)[-1])[0] for section in after.days.values()]
+    assert parse_money(after.finals["grand_total"])[0] == pytest.approx(sum(daily), abs=len(daily))
+
+
+def test_parse_structured_itinerary():
+    parsed = parse_itinerary(structured_itinerary(CostTable(RATES)))
+    assert list(parsed.days) == [1, 2, 3, 4, 5]
+    assert list(parsed.finals) == ["cost_breakdown", "grand_total", "packing", "budget", "tip", "disclaimer"]
+    assert parsed.closing == CLOSING_LINE
+
+
+def test_select_targets():
+    parsed = parse_itinerary(structured_itinerary(CostTable(RATES)))
+    assert select_targets("Swap Day 3's hotel for something cheaper", parsed) == ([3], [])
+    assert select_targets("Make the last day more relaxed", parsed) == ([5], [])
+    assert select_targets("Add a cooking class on the second day and update the packing list", parsed) == ([2], ["packing"])
+    assert select_targets("Spend more time in Calangute", parsed) == ([3], [])
+    # A named day wins over the cities mentioned alongside it.
+    assert select_targets("Move the Panaji fort visit to day 4", parsed) == ([4], [])
+    assert select_targets("Make the whole trip cheaper", parsed) is None
+    assert select_targets("Make it cheaper", parsed) is None
+
+
+def test_multi_edit_session_keeps_untouched_days_and_totals():
+    table = CostTable(RATES)
+    itinerary = structured_itinerary(table)
+    edits = [
+        ("Swap Day 3's hotel for something cheaper", 3, [item("Fort 3", 10, "EUR"), item("Casa Anjuna", 3500, category="Accommodation")]),
+        ("Make the last day more relaxed", 5, [item("Spa", 40, "USD")]),
+        ("Replace the fort visit on day 1 with a spice plantation", 1, [item("Spice Plantation", 1500)]),
+        ("Can the second day start later?", 2, [item("Late brunch", 900, category="Meals", time="11:30")]),
+    ]
+    for request, day, items in edits:
+        # The day number sometimes comes back as a string.
+        client = FakeClient(json.dumps({"days": [{"day": str(day), "theme": "Slow Day", "items": items}]}))
+        before = parse_itinerary(itinerary)
+        itinerary, (days, finals) = ItineraryEditor(client, cost_table=table).edit("system", itinerary, request, CTX)
+        after = parse_itinerary(itinerary)
+        assert (days, finals) == ([day], [])
+        assert after.days[day] != before.days[day]
+        assert after.days[day].startswith(f"### Day {day}: Slow Day – {CITIES[day - 1]} (")
+        assert_consistent(before, after, days)
+        assert "Budget Analysis" in after.finals["budget"]
+    assert len(client.requests) == 1 and client.requests[0]["response_format"] == {"type": "json_object"}
+
+
+def test_structured_extras_edit():
+    table = CostTable(RATES)
+    itinerary = structured_itinerary(table)
+    client = FakeClient(json.dumps({"days": [{"day": 2, "theme": "Cooking", "items": [item("Cooking class", 2500)]}],
+                                    "packing_checklist": ["Apron", "Sunscreen"]}))
+    new, applied = ItineraryEditor(client, cost_table=table).edit(
+        "system", itinerary, "Add a cooking class on day 2 and update the packing list", CTX
+    )
+    after = parse_itinerary(new)
+    assert applied == ([2], ["packing"])
+    assert after.finals["packing"] == "🎒 Packing Checklist:\n\n- Apron\n- Sunscreen"
+    assert_consistent(parse_itinerary(itinerary), after, [2])
+
+
+@pytest.mark.parametrize("reply", [
+    "not json at all",
+    json.dumps([{"day": 3, "items": []}]),
+    json.dumps({"days": [{"day": 4, "items": [item("Elsewhere", 100)]}]}),
+    json.dumps({"days": [{"day": "third", "items": [item("Elsewhere", 100)]}]}),
+    json.dumps({"days": "3"}),
+])
+def test_structured_edit_that_replaces_nothing_falls_back(reply):
+    table = CostTable(RATES)
+    client = FakeClient(reply)
+    assert ItineraryEditor(client, cost_table=table).edit("system", structured_itinerary(table), "Change day 3", CTX) is None
+
+
+PROSE = """Namaste Traveler! Here is your 3-day Goa trip.
+
+### Day 1: Arrival (2026-11-01)
+
+**Flight AI-123**
+
+💰 Cost: ₹4,000
+
+🎒 Pack light for the flight.
+
+🎯 Daily Total: ₹4,000
+
+### Day 2: Beaches (2026-11-02)
+
+**Calangute Beach**
+
+💰 Cost: ₹500
+
+📌 Tip: go early.
+
+🎯 Daily Total: ₹2,500
+
+### Day 3: Return (2026-11-03)
+
+**Flight AI-124**
+
+💰 Cost: ₹3,000
+
+🎯 Daily Total: ₹3,000
+
+🧾 Cost Breakdown:
+
+- Flights: ₹7,000
+- Activities: ₹2,500
+
+💰 Grand Total: ₹9,500
+
+🎒 Packing Checklist:
+
+- Sunscreen
+
+⚠️ *Disclaimer: All estimated costs are for guidance only.*
+
+How does this look? I'm happy to make any adjustments you'd like."""
+
+
+def test_parse_prose_with_emoji_item_lines():
+    parsed = parse_itinerary(PROSE)
+    assert list(parsed.days) == [1, 2, 3]
+    assert "🎒 Pack light" in parsed.days[1] and "📌 Tip" in parsed.days[2]
+    assert list(parsed.finals) == ["cost_breakdown", "grand_total", "packing", "disclaimer"]
+    assert parsed.render() == PROSE
+
+
+TRAIN_DAY = "### Day 1: Arrival (2026-11-01)\n\n**Train**\n\n💰 Cost: ₹1,000\n\n🎯 Daily Total: ₹1,000"
+PROSE_WITH_BUDGET = PROSE.replace(
+    "⚠️ *Disclaimer", "💼 Budget Analysis: Your budget is ₹60,000 and the trip costs ₹9,500.\n\n⚠️ *Disclaimer"
+)
+
+
+def test_prose_edit_recomputes_grand_total():
+    before = parse_itinerary(PROSE)
+    client = FakeClient(TRAIN_DAY)
+    new, applied = ItineraryEditor(client).edit("system", PROSE, "Take the train on day 1 instead", CTX)
+    after = parse_itinerary(new)
+    assert applied == ([1], [])
+    assert after.finals["grand_total"] == "💰 Grand Total: ₹6,500"
+    assert_consistent(before, after, [1])
+
+
+def test_prose_edit_regenerates_breakdown_and_budget():
+    breakdown = "🧾 Cost Breakdown:\n\n- Transportation: ₹1,000\n- Flights: ₹3,000\n- Activities: ₹2,500"
+    budget = "💼 Budget Analysis: Your budget is ₹60,000 and the trip now costs ₹6,500."
+    client = FakeClient("\n\n".join([TRAIN_DAY, breakdown, "💰 Grand Total: ₹6,000", budget]))
+    new, applied = ItineraryEditor(client).edit("system", PROSE_WITH_BUDGET, "Take the train on day 1 instead", CTX)
+    after = parse_itinerary(new)
+    assert applied == ([1], ["cost_breakdown", "budget"])
+    assert (after.finals["cost_breakdown"], after.finals["budget"]) == (breakdown, budget)
+    assert after.finals["grand_total"] == "💰 Grand Total: ₹6,500"  # always summed locally
+    prompt = client.requests[0]["messages"][-1]["content"]
+    assert "- Flights: ₹7,000" in prompt and "Your budget is ₹60,000" in prompt
+    assert "- Day 2: ₹2,500\n- Day 3: ₹3,000" in prompt
+
+
+def test_prose_edit_renders_missing_totals_locally():
+    client = FakeClient(TRAIN_DAY)
+    new, applied = ItineraryEditor(client).edit("system", PROSE_WITH_BUDGET, "Take the train on day 1 instead", CTX)
+    after = parse_itinerary(new)
+    assert applied == ([1], [])
+    assert after.finals["cost_breakdown"] == "🧾 Cost Breakdown:\n\n- Day 1: ₹1,000\n- Day 2: ₹2,500\n- Day 3: ₹3,000"
+    assert "₹9,500" not in new and "₹7,000" not in new
+    assert "estimated cost is ₹6,500, leaving **₹53,500**" in after.finals["budget"]
+
+
+def test_unplanned_day_stays_out_of_recomputed_totals():
+    table = CostTable(RATES)
+    parsed = parse_itinerary(structured_itinerary(table))
+    parsed.days[4] = unplanned_day("### Day 4: Beaches – Anjuna (2026-11-04)", 4)
+    client = FakeClient(json.dumps({"days": [{"day": 2, "items": [item("Cooking class", 2500)]}]}))
+    new, _ = ItineraryEditor(client, cost_table=table).edit("system", parsed.render(), "Add a cooking class on day 2", CTX)
+    after = parse_itinerary(new)
+    assert after.days[4] == parsed.days[4]
+    assert after.finals["grand_total"].endswith("(excluding Day 4)") and "Day 4, which" in after.finals["cost_breakdown"]
+    assert "This leaves out Day 4" in after.finals["budget"]
+
+    prose = parse_itinerary(PROSE)
+    prose.days[2] = unplanned_day("### Day 2: Beaches (2026-11-02)", 2)
+    new, _ = ItineraryEditor(FakeClient(TRAIN_DAY)).edit("system", prose.render(), "Take the train on day 1 instead", CTX)
+    assert parse_itinerary(new).finals["grand_total"] == "💰 Grand Total: ₹4,000 (excluding Day 2)"
+
+
+def test_prose_edit_without_heading_falls_back():
+    client = FakeClient("Sure! I've made Day 3 more relaxed for you.")
+    assert ItineraryEditor(client).edit("system", PROSE, "Make day 3 more relaxed", CTX) is None
@@ -0,0 +1,140 @@
+import threading
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import openai
+import pytest
+from fake_openai_server import FakeOpenAIConfig, start_server
+
+from trivanza_gateway import PRIORITY_CHAT, PRIORITY_ITINERARY, LLMGateway, TokenBucket, estimate_request_tokens
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(**config):
+        server, base_url = start_server(FakeOpenAIConfig(**dict({"latency": 0.05, "tokens_per_second": 1e6}, **config)))
+        servers.append(server)
+        return server.config, openai.OpenAI(base_url=base_url, api_key="test", max_retries=0)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def ask(gateway, content, priority=PRIORITY_CHAT, max_tokens=100):
+    return gateway.create(
+        priority=priority, model="gpt-4o", max_tokens=max_tokens, messages=[{"role": "user", "content": content}]
+    )
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)  # start in a fixed order
+    for thread in threads:
+        thread.join(timeout=30)
+
+
+def test_limits_are_learned_from_headers(server, monkeypatch):
+    monkeypatch.delenv("TRIVANZA_TPM", raising=False)
+    monkeypatch.delenv("TRIVANZA_RPM", raising=False)
+    config, client = server(tokens_per_minute=450000, requests_per_minute=5000)
+    gateway = LLMGateway(client)
+    assert gateway.tokens.capacity is None and gateway.requests.capacity is None
+
+    # Unknown limits throttle nothing: 10 large requests are well above any fixed default.
+    started = time.monotonic()
+    for n in range(10):
+        ask(gateway, f"question {n}", max_tokens=8000)
+    assert time.monotonic() - started < 5
+    assert (gateway.tokens.capacity, gateway.requests.capacity) == (450000, 5000)
+
+
+def test_configured_limit_is_only_a_starting_point(server, monkeypatch):
+    monkeypatch.setenv("TRIVANZA_TPM", "30000")
+    config, client = server(tokens_per_minute=450000)
+    gateway = LLMGateway(client)
+    assert gateway.tokens.capacity == 30000
+    ask(gateway, "hello")
+    assert gateway.tokens.capacity == 450000
+
+
+def test_unknown_bucket_never_waits():
+    bucket = TokenBucket(None)
+    bucket.take(10 ** 9, time.monotonic())
+    assert bucket.wait_time(10 ** 9, time.monotonic()) == 0.0
+    bucket.observe(600, 100, time.monotonic())
+    assert bucket.capacity == 600 and bucket.level <= 100
+
+
+def test_retries_after_429(server):
+    config, client = server(reject_first=2)
+    gateway = LLMGateway(client)
+    response = ask(gateway, "hello")
+    assert response.choices[0].message.content
+    assert config.stats == {"requests": 3, "rate_limited": 2, "streams": 0}
+    assert gateway.stats["retries"] == 2 and gateway.stats["rate_limited"] == 2
+
+
+@pytest.mark.parametrize("headers, minimum, maximum", [
+    ({"retry-after-ms": "1500"}, 1.5, 1.5),
+    ({"retry-after-ms": "soon", "retry-after": "2"}, 2.0, 2.0),
+    ({"retry-after-ms": "soon", "retry-after": "later"}, 0.0, 0.5),
+    ({"retry-after": formatdate(time.time() + 30, usegmt=True)}, 10.0, 10.0),
+    ({"retry-after": formatdate(time.time() - 30, usegmt=True)}, 0.0, 0.5),
+])
+def test_backoff_tolerates_malformed_retry_hints(headers, minimum, maximum):
+    gateway = LLMGateway(client=object(), base_delay=0.5, max_delay=10.0)
+    error = openai.APIConnectionError(request=None)
+    error.response = SimpleNamespace(headers=headers)
+    assert minimum <= gateway._backoff(0, error) <= maximum
+
+
+def test_streamed_usage_corrects_the_token_bucket(server):
+    config, client = server()
+    gateway = LLMGateway(client, tokens_per_minute=10 ** 9)
+    kwargs = {"model": "gpt-4o", "max_tokens": 5000, "messages": [{"role": "user", "content": "hello"}]}
+    estimated = estimate_request_tokens(kwargs)
+    stream = gateway.create(priority=PRIORITY_CHAT, stream=True, stream_options={"include_usage": True}, **kwargs)
+    level = gateway.tokens.level
+    usage = [chunk.usage for chunk in stream if chunk.usage is not None]
+    stream.close()
+    assert len(usage) == 1 and usage[0].total_tokens < estimated
+    # The unused part of the max_tokens allowance is handed back (plus a little refill).
+    assert gateway.tokens.level - level >= estimated - usage[0].total_tokens
+
+
+def test_identical_requests_are_coalesced(server):
+    config, client = server(latency=0.5)
+    gateway = LLMGateway(client)
+    responses = []
+    run_threads([lambda: responses.append(ask(gateway, "same question"))] * 5)
+    assert len(responses) == 5 and len({r.id for r in responses}) == 1
+    assert config.stats["requests"] == 1
+    assert gateway.stats["coalesced"] == 4
+
+
+def test_chat_is_admitted_before_itinerary(server):
+    config, client = server(tokens_per_minute=60000)
+    gateway = LLMGateway(client, tokens_per_minute=60000)
+    # Empty the token bucket so every request below has to queue (1000 tokens/s refill).
+    with gateway._cond:
+        gateway.tokens.take(gateway.tokens.capacity, time.monotonic())
+    order = []
+
+    def request(name, priority):
+        def run():
+            ask(gateway, name, priority=priority, max_tokens=300)
+            order.append(name)
+        return run
+
+    run_threads(
+        [request(f"itinerary {n}", PRIORITY_ITINERARY) for n in range(3)]
+        + [request(f"chat {n}", PRIORITY_CHAT) for n in range(3)]
+    )
+    assert order == ["chat 0", "chat 1", "chat 2", "itinerary 0", "itinerary 1", "itinerary 2"]
@@ -0,0 +1,76 @@
+import math
+import random
+
+import pytest
+
+from trivanza_geo import Gazetteer, KDTree, chord_to_km, get_gazetteer, reverse_geocode, to_xyz
+
+
+def brute_force(points, query, k):
+    return sorted((math.dist(point, query), i) for i, point in enumerate(points))[:k]
+
+
+def small_gazetteer(places):
+    names = [name for name, _, _ in places]
+    return Gazetteer(names, ["X"] * len(places), [f"Etc/{name}" for name in names], [(lat, lon) for _, lat, lon in places])
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_kdtree_agrees_with_brute_force(k):
+    rng = random.Random(11)
+    # Uniform on the sphere, so the poles and the antimeridian are covered too.
+    points = [to_xyz(math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180)) for _ in range(2000)]
+    tree = KDTree(points)
+    for _ in range(200):
+        query = to_xyz(math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180))
+        expected = brute_force(points, query, k)
+        result = tree.query(query, k=k)
+        assert [i for _, i in result] == [i for _, i in expected]
+        assert [d for d, _ in result] == pytest.approx([d for d, _ in expected])
+
+
+def test_antimeridian_neighbours():
+    gazetteer = small_gazetteer([("East", -17.0, 179.9), ("West", -17.0, -179.9), ("Far", -17.0, 170.0)])
+    assert gazetteer.nearest(-17.0, 179.95)["city"] == "East"
+    assert gazetteer.nearest(-17.0, -179.95)["city"] == "West"
+    # Across the antimeridian is ~11 km away; the same-side city is ~1,000 km away.
+    assert gazetteer.nearest(-17.0, -179.99)["distance_km"] < 15
+    assert gazetteer.nearest(-17.0, 180.0)["distance_km"] == pytest.approx(10.6, abs=0.5)
+
+
+def test_polar_queries():
+    gazetteer = small_gazetteer([("North", 89.5, 0.0), ("Svalbard", 78.2, 15.6), ("South", -89.5, 120.0)])
+    # Near the pole every longitude is close together.
+    north = gazetteer.nearest(89.9, -170.0)
+    assert north["city"] == "North" and north["distance_km"] < 70
+    assert gazetteer.nearest(90.0, 0.0)["distance_km"] == pytest.approx(55.6, abs=0.5)
+    assert gazetteer.nearest(-90.0, -45.0)["city"] == "South"
+
+
+def test_chord_to_km():
+    assert chord_to_km(0.0) == 0.0
+    assert chord_to_km(2.0) == pytest.approx(math.pi * 6371.0088)
+    assert chord_to_km(math.dist(to_xyz(0, 0), to_xyz(0, 1))) == pytest.approx(111.2, abs=0.1)
+
+
+@pytest.mark.parametrize("lat, lon, country, timezone", [
+    (15.4909, 73.8278, "India", "Asia/Kolkata"),
+    (48.8566, 2.3522, "France", "Europe/Paris"),
+    (-33.8688, 151.2093, "Australia", "Australia/Sydney"),
+    (40.7128, -74.0060, "United States", "America/New_York"),
+    (64.1466, -21.9426, "Iceland", "Atlantic/Reykjavik"),
+    (-13.8333, -171.7500, "Samoa", "Pacific/Apia"),
+])
+def test_reverse_geocode_bundled_gazetteer(lat, lon, country, timezone):
+    place = reverse_geocode(lat, lon)
+    assert (place["country"], place["timezone"]) == (country, timezone)
+    assert place["distance_km"] < 20
+
+
+def test_reverse_geocode_covers_small_towns_and_rejects_bad_input():
+    assert len(get_gazetteer().tree) > 20000
+    # Rural Himachal Pradesh: no major city within 50 km, but there are towns.
+    assert reverse_geocode(32.2432, 77.1892)["distance_km"] < 50
+    assert reverse_geocode(91, 0) is None and reverse_geocode(0, -181) is None
+    # Coordinates within ~1 km share one cached lookup.
+    assert reverse_geocode(15.49091, 73.82781) is reverse_geocode(15.49089, 73.82779)
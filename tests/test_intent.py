@@ -0,0 +1,54 @@
+import pytest
+
+from trivanza_intent import (
+    DEFAULT_ROUTES, DEFAULT_SAMPLES_PATH, EMERGENCY, HELDOUT_SAMPLES_PATH, INTENTS, QUICK_FACT,
+    REGRESSION_SAMPLES_PATH, classify, evaluate, read_samples,
+)
+from trivanza_prompts import STATIC_SYSTEM_PROMPT, build_system_prompt_text
+
+# data/intent_heldout.tsv was frozen before any tuning against it (85% when frozen).
+MIN_HELDOUT_ACCURACY = 0.8
+# The tuning samples and the regression set were written alongside lexicon changes, so
+# these floors only catch regressions; they say nothing about unseen messages.
+MIN_SAMPLES_ACCURACY = 0.97
+MIN_REGRESSION_ACCURACY = 0.95
+# Generous enough for a loaded CI machine; the classifier itself runs in tens of µs.
+MAX_P99_US = 1000.0
+
+
+@pytest.mark.parametrize("path, min_accuracy", [
+    (DEFAULT_SAMPLES_PATH, MIN_SAMPLES_ACCURACY),
+    (REGRESSION_SAMPLES_PATH, MIN_REGRESSION_ACCURACY),
+    (HELDOUT_SAMPLES_PATH, MIN_HELDOUT_ACCURACY),
+])
+def test_accuracy_and_latency(path, min_accuracy):
+    result = evaluate(read_samples(path), repeats=50)
+    assert result["accuracy"] >= min_accuracy, result["mistakes"]
+    assert result["p99_us"] <= MAX_P99_US
+
+
+def test_heldout_is_labeled_and_disjoint():
+    heldout = list(read_samples(HELDOUT_SAMPLES_PATH))
+    assert {intent for intent, _, _ in heldout} == set(INTENTS)
+    seen = {message.lower() for path in (DEFAULT_SAMPLES_PATH, REGRESSION_SAMPLES_PATH) for _, _, message in read_samples(path)}
+    assert not [message for _, _, message in heldout if message.lower() in seen]
+
+
+# Regression checks for misses that were fixed by retuning; not an accuracy measure.
+@pytest.mark.parametrize("message, intent", [
+    ("Someone is following me, who do I call?", EMERGENCY),
+    ("Is Uber available in Istanbul?", QUICK_FACT),
+    ("Is there an Uber near me right now?", EMERGENCY),
+    ("Are credit cards accepted in Bhutan?", QUICK_FACT),
+])
+def test_fixed_misses_stay_fixed(message, intent):
+    assert classify(message) == intent
+
+
+@pytest.mark.parametrize("route", sorted(DEFAULT_ROUTES))
+def test_every_route_keeps_the_shared_prompt_prefix(route):
+    prompt = build_system_prompt_text("Asia/Kolkata", "Panaji, India", 0, DEFAULT_ROUTES[route]["focus"])
+    full = build_system_prompt_text("Asia/Kolkata", "Panaji, India", 0)
+    assert prompt.startswith(STATIC_SYSTEM_PROMPT) and full.startswith(STATIC_SYSTEM_PROMPT)
+    # OpenAI only caches prompts of 1,024 tokens or more (about 4 characters per token).
+    assert len(STATIC_SYSTEM_PROMPT) // 4 >= 1024
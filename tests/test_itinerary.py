@@ -0,0 +1,171 @@
+import asyncio
+import json
+from datetime import date
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from trivanza_costs import CostTable
+from trivanza_edits import parse_itinerary
+from trivanza_itinerary import CLOSING_LINE, ItineraryEngine, parse_skeleton
+
+RATES = pd.DataFrame([{"Code": "USD", "INR_Value": 86.28}])
+CTX = {"destination": "Goa", "from_date": date(2026, 11, 1), "to_date": date(2026, 11, 3),
+       "currency_type": "₹ INR", "budget_amount": 30000}
+SKELETON = json.dumps({"greeting": "Namaste Traveler! Three days in Goa.",
+                       "days": [{"day": n, "city": "Panaji", "theme": f"Theme {n}"} for n in (1, 2, 3)]})
+DAY = json.dumps({"items": [{"time": "10:00", "category": "Activities", "title": "Fort", "details": "", "link": "",
+                             "amount": 1000, "currency": "INR"}]})
+
+
+class FakeAsyncClient:
+    """Answers each request kind from a queue of replies and records every request.
+
+    `days` maps a day number to its replies in order: text, an exception to raise, or
+    None to hang until cancelled. Days without (remaining) replies get DAY.
+    """
+
+    def __init__(self, skeletons, extras="{}", days=None):
+        self.skeletons = list(skeletons)
+        self.extras = extras
+        self.days = {day: list(replies) for day, replies in (days or {}).items()}
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def last_queue_seconds(self):
+        return 0.25
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        system = kwargs["messages"][0]["content"]
+        user = kwargs["messages"][-1]["content"]
+        day = next((n for n in (1, 2, 3) if f"items for Day {n} " in user or f"section for Day {n} " in user), None)
+        if "outline of a travel itinerary" in system:
+            content = self.skeletons.pop(0)
+        elif "packing_checklist" in user or "Write ONLY the final sections" in user:
+            content = self.extras
+        elif self.days.get(day):
+            content = self.days[day].pop(0)
+            if content is None:
+                await asyncio.sleep(10)
+            elif isinstance(content, Exception):
+                raise content
+        else:
+            content = DAY
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def generate(client, on_usage=None, on_day=None, structured=True):
+    engine = ItineraryEngine(client, cost_table=CostTable(RATES) if structured else None)
+    return asyncio.run(engine.generate("system", "Plan 3 days in Goa", CTX, on_usage=on_usage, on_day=on_day))
+
+
+def day_requests(client, day):
+    return [r for r in client.requests if f" for Day {day} " in r["messages"][-1]["content"]]
+
+
+def skeleton_requests(client):
+    return [r for r in client.requests if "outline of a travel itinerary" in r["messages"][0]["content"]]
+
+
+@pytest.mark.parametrize("text", ['{"greeting": "Namaste! Three da', "[]", '"days"'])
+def test_parse_skeleton_rejects_truncated_or_non_object_replies(text):
+    with pytest.raises(ValueError):
+        parse_skeleton(text, 3, "Goa")
+
+
+def test_parse_skeleton_pads_and_ignores_bad_days():
+    greeting, outline = parse_skeleton(json.dumps({"days": "Panaji"}), 2, "Goa")
+    assert greeting.startswith("Namaste Traveler!")
+    assert outline == [("Goa", "Explore"), ("Goa", "Explore")]
+
+
+def test_truncated_skeleton_is_retried_with_more_tokens():
+    client = FakeAsyncClient(['{"greeting": "Namaste Traveler! Three days in Go', SKELETON])
+    itinerary = generate(client)
+    first, second = skeleton_requests(client)
+    assert second["max_tokens"] == 2 * first["max_tokens"]
+    assert itinerary.startswith("Namaste Traveler! Three days in Goa.")
+    assert "### Day 2: Theme 2 – Panaji (2026-11-02)" in itinerary
+
+
+def test_skeleton_falls_back_to_a_generic_outline():
+    client = FakeAsyncClient(["not json", "[1, 2, 3]"])
+    parsed = parse_itinerary(generate(client))
+    assert len(skeleton_requests(client)) == 2
+    assert list(parsed.days) == [1, 2, 3]
+    assert parsed.days[3].startswith("### Day 3: Explore – Goa (2026-11-03)")
+    assert parsed.closing == CLOSING_LINE
+
+
+@pytest.mark.parametrize("extras", ["not json", "[]", json.dumps({"packing_checklist": "Sunscreen", "pro_tip": ["x"]})])
+def test_bad_extras_leave_no_empty_sections(extras):
+    itinerary = generate(FakeAsyncClient([SKELETON], extras=extras))
+    assert "\n\n\n" not in itinerary
+    parsed = parse_itinerary(itinerary)
+    assert list(parsed.finals) == ["cost_breakdown", "grand_total", "budget", "disclaimer"]
+
+
+def test_extras_are_rendered():
+    extras = json.dumps({"packing_checklist": ["Sunscreen", "", "Hat"], "pro_tip": "Rent a scooter."})
+    parsed = parse_itinerary(generate(FakeAsyncClient([SKELETON], extras=extras)))
+    assert parsed.finals["packing"] == "🎒 Packing Checklist:\n\n- Sunscreen\n- Hat"
+    assert parsed.finals["tip"] == "📌 Destination Pro Tip: Rent a scooter."
+
+
+def test_on_usage_reports_timings_errors_and_cancellations():
+    calls = []
+
+    def on_usage(usage, kind, **timings):
+        calls.append((kind, timings))
+
+    generate(FakeAsyncClient([SKELETON]), on_usage=on_usage)
+    assert [kind for kind, _ in calls] == ["itinerary_skeleton"] + ["itinerary_day"] * 3 + ["itinerary_final"]
+    assert all(t["queue_seconds"] == 0.25 and t["total_seconds"] >= 0 and t["error"] is None for _, t in calls)
+
+    calls.clear()
+
+    def on_day(index, text):
+        raise RuntimeError("the page was closed")
+
+    with pytest.raises(RuntimeError):
+        generate(FakeAsyncClient([SKELETON], days={2: [None], 3: [None]}), on_usage=on_usage, on_day=on_day)
+    days = sorted(str(t["error"]) for kind, t in calls if kind == "itinerary_day")
+    # Day 1 finished; the other two were cancelled with the generation.
+    assert days == ["None", "cancelled", "cancelled"]
+
+
+@pytest.mark.parametrize("failure", [TimeoutError("day 2 timed out"), "not json", '{"items": []}'])
+def test_failed_day_is_retried_once(failure):
+    client = FakeAsyncClient([SKELETON], days={2: [failure]})
+    parsed = parse_itinerary(generate(client))
+    assert len(day_requests(client, 2)) == 2 and len(day_requests(client, 1)) == 1
+    assert "Fort" in parsed.days[2]
+    assert parsed.finals["grand_total"] == "💰 Grand Total: ₹3,000"
+
+
+@pytest.mark.parametrize("failure", [TimeoutError("day 2 timed out"), "not json"])
+def test_day_that_fails_twice_becomes_a_placeholder_left_out_of_the_totals(failure):
+    shown = {}
+    client = FakeAsyncClient([SKELETON], days={2: [failure, failure]})
+    itinerary = generate(client, on_day=shown.__setitem__)
+    parsed = parse_itinerary(itinerary)
+    assert len(day_requests(client, 2)) == 2
+    assert parsed.days[2].startswith("### Day 2: Theme 2 – Panaji (2026-11-02)")
+    assert "could not be planned just now. Ask me to redo Day 2" in parsed.days[2] == shown[1]
+    assert "Fort" in parsed.days[1] and "Fort" in parsed.days[3]
+    assert parsed.finals["grand_total"] == "💰 Grand Total: ₹2,000 (excluding Day 2)"
+    assert "Day 2, which could not be planned" in parsed.finals["cost_breakdown"]
+    assert "This leaves out Day 2" in parsed.finals["budget"]
+
+
+def test_prose_day_that_fails_twice_becomes_a_placeholder():
+    prose = "### Day {n}: Theme {n} – Panaji\n\nFort visit.\n\n🎯 Daily Total: ₹1,000"
+    client = FakeAsyncClient([SKELETON], extras="🧾 Cost Breakdown: ...", days={
+        n: [prose.format(n=n)] for n in (1, 3)
+    } | {2: [TimeoutError("slow"), ""]})
+    itinerary = generate(client, structured=False)
+    assert "Ask me to redo Day 2" in itinerary and "Fort visit" in itinerary
+    final = next(r for r in client.requests if "Write ONLY the final sections" in r["messages"][-1]["content"])
+    assert "🎯 Daily Total: not available" in final["messages"][-1]["content"]
@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+import trivanza_metrics
+from trivanza_metrics import CANCELLED, MetricsRegistry, call_outcome, record_llm_call, summarize_jsonl
+
+
+def test_cancelled_calls_are_not_errors(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    registry = MetricsRegistry(prom_path=None, jsonl_path=str(path))
+    monkeypatch.setattr(trivanza_metrics, "METRICS", registry)
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, prompt_tokens_details=None)
+    record_llm_call("chat", "gpt-4o", usage=usage, queue_seconds=0.1, ttft_seconds=0.5, total_seconds=2.0)
+    record_llm_call("chat", "gpt-4o", usage=None, total_seconds=1.0, error=CANCELLED)
+    record_llm_call("chat", "gpt-4o", usage=None, total_seconds=0.2, error="APITimeoutError")
+
+    counters = registry.snapshot()["counters"]
+    for outcome in ("ok", "cancelled", "error"):
+        assert counters[f'trivanza_llm_requests_total{{kind="chat",outcome="{outcome}"}}'] == 1
+    summary = summarize_jsonl(path)["chat"]
+    assert (summary["calls"], summary["errors"], summary["cancelled"]) == (3, 1, 1)
+    assert summary["queue_s"]["p50"] == 0.1
+
+
+def test_call_outcome():
+    assert [call_outcome(e) for e in (None, "", CANCELLED, "RateLimitError")] == ["ok", "ok", "cancelled", "error"]
@@ -0,0 +1,150 @@
+import random
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from trivanza_geo import KDTree, to_xyz
+from trivanza_poi import (
+    POIIndex, build_index, detect_category, find_nearby, is_open, parse_opening_hours, read_osm_xml,
+)
+
+IST = ZoneInfo("Asia/Kolkata")
+PANAJI = (15.4909, 73.8278)
+SUNDAY_NIGHT = datetime(2026, 11, 1, 23, 30, tzinfo=IST)
+MONDAY_NOON = datetime(2026, 11, 2, 12, 0, tzinfo=IST)
+MONDAY_1AM = datetime(2026, 11, 2, 1, 0, tzinfo=IST)
+
+# Pharmacies a few hundred metres apart, nearest first, plus objects the build must skip.
+EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="15.4910" lon="73.8280">
+    <tag k="amenity" v="pharmacy"/><tag k="name" v="Weekday Chemist"/><tag k="opening_hours" v="Mo-Fr 09:00-18:00; Sa-Su off"/>
+    <tag k="phone" v="+91 832 222 0001"/><tag k="addr:street" v="18th June Road"/><tag k="addr:city" v="Panaji"/>
+  </node>
+  <node id="2" lat="15.4930" lon="73.8290">
+    <tag k="amenity" v="pharmacy"/><tag k="name" v="Night Owl Pharmacy"/><tag k="opening_hours" v="Mo-Su 20:00-02:00"/>
+  </node>
+  <node id="3" lat="15.4960" lon="73.8300">
+    <tag k="healthcare" v="pharmacy"/><tag k="name" v="Appointment Only"/><tag k="opening_hours" v="by appointment"/>
+  </node>
+  <node id="4" lat="15.5000" lon="73.8320">
+    <tag k="shop" v="chemist"/><tag k="brand" v="Always Open"/><tag k="opening_hours" v="24/7"/>
+  </node>
+  <node id="5" lat="15.4911" lon="73.8279"><tag k="amenity" v="pharmacy"/></node>
+  <node id="6" lat="15.4912" lon="73.8281"><tag k="amenity" v="cafe"/><tag k="name" v="Cafe Bodega"/></node>
+  <node id="7" lat="15.4913" lon="73.8282"/>
+  <node id="8" lat="15.4800" lon="73.8100"><tag k="amenity" v="atm"/><tag k="name" v="SBI ATM"/></node>
+  <way id="9"><nd ref="1"/><nd ref="2"/><tag k="amenity" v="hospital"/><tag k="name" v="GMC"/></way>
+</osm>
+"""
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    root = tmp_path_factory.mktemp("poi")
+    extract = root / "goa.osm"
+    extract.write_text(EXTRACT, encoding="utf-8")
+    counts = build_index(read_osm_xml(str(extract)), str(root / "index"), source="goa.osm")
+    assert counts == {"atm": 1, "hospital": 1, "pharmacy": 4, "mechanic": 0}
+    return POIIndex(str(root / "index"))
+
+
+def names(places):
+    return [place["name"] for place in places]
+
+
+def test_nearest_without_opening_hours_filter(index):
+    places = index.nearest("pharmacy", *PANAJI, k=10)
+    assert names(places) == ["Weekday Chemist", "Night Owl Pharmacy", "Appointment Only", "Always Open"]
+    assert all(place["open_now"] is None for place in places)
+    assert places[0]["distance_km"] < places[1]["distance_km"] < places[3]["distance_km"]
+    assert places[0]["address"] == "18th June Road, Panaji" and places[0]["phone"] == "+91 832 222 0001"
+
+
+@pytest.mark.parametrize("when, expected", [
+    (SUNDAY_NIGHT, [("Night Owl Pharmacy", True), ("Appointment Only", None), ("Always Open", True)]),
+    (MONDAY_1AM, [("Night Owl Pharmacy", True), ("Appointment Only", None), ("Always Open", True)]),
+    (MONDAY_NOON, [("Weekday Chemist", True), ("Appointment Only", None), ("Always Open", True)]),
+])
+def test_nearest_open_at(index, when, expected):
+    places = index.nearest("pharmacy", *PANAJI, k=10, open_at=when)
+    assert [(place["name"], place["open_now"]) for place in places] == expected
+
+
+def test_find_nearby_tool_result(index):
+    result = find_nearby(index, "pharmacy", *PANAJI, timezone="Asia/Kolkata", limit=2, now=SUNDAY_NIGHT)
+    assert result["local_time"] == "Sun 23:30" and result["open_now_filter"]
+    assert names(result["places"]) == ["Night Owl Pharmacy", "Appointment Only"]
+    assert result["places"][0]["phone"] == "not listed"
+    assert result["places"][1]["opening_hours"] == "by appointment"
+
+    result = find_nearby(index, "pharmacy", *PANAJI, timezone="Not/AZone", open_now=False, limit=1)
+    assert names(result["places"]) == ["Weekday Chemist"] and not result["open_now_filter"]
+
+
+def test_ways_are_placed_at_their_centroid(index):
+    [hospital] = index.nearest("hospital", *PANAJI, k=5)
+    assert hospital["name"] == "GMC"
+    assert (hospital["lat"], hospital["lon"]) == pytest.approx((15.4920, 73.8285))
+
+
+@pytest.mark.parametrize("message, category", [
+    ("My scooter has a puncture", "mechanic"),
+    ("Where can I withdraw cash?", "atm"),
+    ("I need a doctor for my son", "hospital"),
+    ("What time does the museum open?", None),
+])
+def test_detect_category(message, category):
+    assert detect_category(message) == category
+
+
+def test_unknown_category(index):
+    with pytest.raises(KeyError):
+        index.nearest("mechanic_shop", *PANAJI)
+
+
+@pytest.mark.parametrize("hours, when, expected", [
+    ("24/7", SUNDAY_NIGHT, True),
+    ("Mo-Fr 09:00-18:00", MONDAY_NOON, True),
+    ("Mo-Fr 09:00-18:00", SUNDAY_NIGHT, False),
+    ("Sa-Mo 10:00-14:00", MONDAY_NOON, True),  # day range wrapping past Sunday
+    ("Tu,Th 10:00-14:00", MONDAY_NOON, False),
+    ("Mo-Su 09:00-13:00,14:00-18:00", MONDAY_NOON, True),
+    ("Mo-Su 20:00-02:00", SUNDAY_NIGHT, True),
+    ("Su 20:00-02:00", MONDAY_1AM, True),  # carries over into Monday morning
+    ("Mo 20:00-02:00", MONDAY_1AM, False),
+    ("Mo-Su 10:00-20:00; Mo off", MONDAY_NOON, False),  # later rules override earlier ones
+    ("Mo-Fr 09:00-18:00; PH off", MONDAY_NOON, True),
+    ("Mo closed", MONDAY_NOON, False),
+    ("by appointment", MONDAY_NOON, None),
+    ("Mo-Fr 9am-6pm", MONDAY_NOON, None),
+    ("Mo-Fr 09:00-25:00", MONDAY_NOON, None),
+    ("", MONDAY_NOON, None),
+])
+def test_opening_hours(hours, when, expected):
+    assert is_open(hours, when) is expected
+
+
+def test_parse_opening_hours():
+    assert parse_opening_hours("24/7") == {day: ((0, 1440),) for day in range(7)}
+    assert parse_opening_hours("Sa-Mo 10:00-14:00") == {5: ((600, 840),), 6: ((600, 840),), 0: ((600, 840),)}
+    assert parse_opening_hours("Mo-Fr 08:00-12:00; Fr off")[4] == ()
+    assert parse_opening_hours("sunrise-sunset") is None
+
+
+def test_from_buffers_matches_list_built_tree():
+    rng = random.Random(3)
+    points = [to_xyz(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(500)]
+    built = KDTree(points)
+    wrapped = KDTree.from_buffers(memoryview(built.coords.tobytes()).cast("d"), built.order)
+    by_node = KDTree.from_buffers(built.coords)  # node numbers instead of input indexes
+    for _ in range(50):
+        query = to_xyz(rng.uniform(-60, 60), rng.uniform(-180, 180))
+        expected = built.query(query, k=5)
+        assert wrapped.query(query, k=5) == expected
+        assert [(d, built.order[i]) for d, i in by_node.query(query, k=5)] == expected
+        even = built.query(query, k=5, predicate=lambda i: i % 2 == 0)
+        assert wrapped.query(query, k=5, predicate=lambda i: i % 2 == 0) == even
+        assert all(i % 2 == 0 for _, i in even) and len(even) == 5
+    assert len(wrapped) == len(by_node) == len(built) == 500
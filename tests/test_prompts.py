@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import trivanza_prompts
+from trivanza_prompts import DYNAMIC_CONTEXT_TEMPLATE, PROMPT_FOCUS, STATIC_SYSTEM_PROMPT, build_system_prompt_text
+
+USERS = [("Asia/Kolkata", "Panaji, India"), ("America/New_York", "New York, United States"), ("Not/AZone", "Not Detected")]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freezes the prompt builder's clock at `clock.now` and counts how often it is read."""
+
+    class FakeDatetime:
+        now_utc = datetime(2026, 11, 1, 9, 30, tzinfo=timezone.utc)
+        calls = 0
+
+        @classmethod
+        def now(cls, tz=None):
+            cls.calls += 1
+            return cls.now_utc.astimezone(tz)
+
+    monkeypatch.setattr(trivanza_prompts, "datetime", FakeDatetime)
+    build_system_prompt_text.cache_clear()
+    yield FakeDatetime
+    build_system_prompt_text.cache_clear()
+
+
+def static_part(prompt):
+    """Everything before the per-request context block, as sent on the wire."""
+    return prompt[:prompt.index(DYNAMIC_CONTEXT_TEMPLATE.split("{")[0])].encode("utf-8")
+
+
+@pytest.mark.parametrize("focus", [None, *sorted(PROMPT_FOCUS)])
+def test_prefix_is_byte_identical_across_users_minutes_and_turns(clock, focus):
+    prompts = []
+    for minute in range(3):
+        clock.now_utc = datetime(2026, 11, 1, 9, 30 + minute, tzinfo=timezone.utc)
+        for timezone_str, location in USERS:
+            for _turn in range(2):
+                prompts.append(build_system_prompt_text(timezone_str, location, 29_000_000 + minute, focus))
+    expected = (STATIC_SYSTEM_PROMPT + (PROMPT_FOCUS[focus] if focus else "")).encode("utf-8")
+    assert {static_part(prompt) for prompt in prompts} == {expected}
+    # Only the trailing context block differs: per user and per minute.
+    assert len(set(prompts)) == len(USERS) * 3
+
+
+def test_static_prompt_has_no_per_request_values():
+    assert "{" not in STATIC_SYSTEM_PROMPT and "}" not in STATIC_SYSTEM_PROMPT
+    assert "CURRENT CONTEXT ---" not in STATIC_SYSTEM_PROMPT
+    for value in ("Panaji", "2026", "AM IST", "PM IST"):
+        assert value not in STATIC_SYSTEM_PROMPT
+
+
+def test_context_block_uses_the_users_timezone(clock):
+    prompt = build_system_prompt_text("Asia/Kolkata", "Panaji, India", 1)
+    assert prompt.endswith(
+        "- Today is Sunday, November 01, 2026.\n- The current time is 03:00 PM IST.\n"
+        "- The user's current location is: **Panaji, India**.\n"
+    )
+    assert "The current time is 09:30 AM UTC." in build_system_prompt_text("Not/AZone", "Not Detected", 1)
+
+
+def test_prompt_is_memoised_per_timezone_location_and_minute(clock):
+    first = build_system_prompt_text("Asia/Kolkata", "Panaji, India", 100, "nearby")
+    clock.now_utc = datetime(2026, 11, 1, 9, 30, 59, tzinfo=timezone.utc)
+    assert build_system_prompt_text("Asia/Kolkata", "Panaji, India", 100, "nearby") is first
+    assert clock.calls == 1
+    # A new minute, location or focus builds a fresh prompt.
+    clock.now_utc = datetime(2026, 11, 1, 9, 31, tzinfo=timezone.utc)
+    later = build_system_prompt_text("Asia/Kolkata", "Panaji, India", 101, "nearby")
+    assert later is not first and "03:01 PM IST" in later
+    build_system_prompt_text("Asia/Kolkata", "Margao, India", 101, "nearby")
+    build_system_prompt_text("Asia/Kolkata", "Margao, India", 101)
+    info = build_system_prompt_text.cache_info()
+    assert (info.hits, info.misses, clock.calls) == (1, 4, 4)
+    assert info.maxsize == 1024
@@ -0,0 +1,85 @@
+import zlib
+from datetime import date
+
+from trivanza_sessions import MessageLog, SessionStore, sign_session_id, verify_session_cookie
+
+SECRET = b"test-secret"
+SID = "0123456789abcdef0123456789abcdef"
+
+
+def test_session_cookie_signature():
+    cookie = sign_session_id(SID, SECRET)
+    assert verify_session_cookie(cookie, SECRET) == SID
+    assert verify_session_cookie(cookie, b"other-secret") is None
+    assert verify_session_cookie(SID, SECRET) is None  # a bare id from a URL or a guess
+    assert verify_session_cookie(cookie[:-1] + ("0" if cookie[-1] != "0" else "1"), SECRET) is None
+    assert verify_session_cookie("../etc." + cookie.split(".")[1], SECRET) is None
+    assert verify_session_cookie(None, SECRET) is None
+
+
+def test_one_tab_at_a_time():
+    store = SessionStore(path=None)
+    connected = {"tab-1"}
+    assert store.claim(SID, "tab-1", connected.__contains__) is not None
+    assert store.claim(SID, "tab-2", connected.__contains__) is None
+    assert store.claim(SID, "tab-1", connected.__contains__) is not None
+    connected.clear()  # the first tab was closed
+    assert store.claim(SID, "tab-2", connected.__contains__).owner == "tab-2"
+
+
+def test_save_survives_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    session = SessionStore(path).get(SID)
+    session.messages.append({"role": "user", "content": "Plan a trip to Goa"})
+    session.trip_context = {"destination": "Goa", "from_date": date(2026, 11, 1)}
+    SessionStore(path).save(session)
+
+    restored = SessionStore(path).get(SID)  # a new process: nothing in memory
+    assert list(restored.messages) == [{"role": "user", "content": "Plan a trip to Goa"}]
+    assert restored.trip_context == {"destination": "Goa", "from_date": date(2026, 11, 1)}
+
+
+def test_evict_idle_writes_outside_the_lock(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite3"), idle_seconds=0)
+    store.get(SID).messages.append({"role": "user", "content": "hello"})
+    save = store._save
+
+    def checked_save(sessions):
+        assert not store._lock.locked()
+        save(sessions)
+
+    store._save = checked_save
+    assert store.evict_idle() == 1
+    assert len(store) == 0
+    assert list(store.get(SID).messages) == [{"role": "user", "content": "hello"}]
+
+
+def test_flush_since_writes_only_recently_used_sessions(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite3"))
+    store.get("a" * 32)
+    store.flush()
+    store.get("b" * 32)
+    written = []
+    store._save = written.extend
+    store.flush(since=True)
+    assert [s.session_id for s in written] == ["b" * 32]
+
+
+def test_recent_tail_is_decompressed_once(monkeypatch):
+    log = MessageLog(recent_window=2, decompressed_tail=3)
+    messages = [{"role": "assistant", "content": f"Answer {n}: " + "Lovely. " * 100} for n in range(10)]
+    for message in messages:
+        log.append(message)
+    assert list(log) == messages and log[-4:] == messages[-4:] and log[3] == messages[3]
+    assert sorted(log._texts) == [5, 6, 7]  # only the compressed tail is cached
+
+    inflated = []
+    decompress = zlib.decompress
+    monkeypatch.setattr(zlib, "decompress", lambda data: inflated.append(data) or decompress(data))
+    assert list(log) == messages
+    assert len(inflated) == 5  # messages 0-4; the tail came from the cache
+
+    log.append({"role": "user", "content": "x" * 300})
+    assert sorted(log._texts) == [6, 7]
+    log.release()
+    assert not log._texts and list(log)[:-1] == messages
@@ -0,0 +1,267 @@
+"""Persistent itinerary cache for Trivanza.
+
+Itineraries generated from the "Plan My Trip" form are stored in a SQLite file shared by
+every Streamlit session and process. The key is a canonical form of the trip_context, so
+near-identical requests (same route, duration, month and preferences) reuse one generation.
+Pre-warmed entries are generated like the app's own: structured, one day per request.
+
+Pre-warm the cache from a CSV of popular trips:
+
+    python trivanza_cache.py prewarm popular_trips.csv --concurrency 4
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+logger = logging.getLogger("trivanza.cache")
+
+DEFAULT_CACHE_PATH = os.environ.get("TRIVANZA_CACHE_PATH", ".trivanza_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+LIST_FIELDS = ("food_preferences", "comm_connectivity", "activities_interests", "accommodation_pref")
+TEXT_FIELDS = (
+    "traveler_type", "purpose_of_travel", "sustainability", "cultural_pref",
+    "currency_type", "mode_of_transport",
+)
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _normalize_text(value):
+    return " ".join(str(value).split()).casefold()
+
+
+def canonical_trip_key(ctx):
+    """Returns a stable cache key for a trip_context.
+
+    Dates are reduced to the trip duration and the travel month, lists are sorted and
+    free-text places are case-folded, so cosmetic differences map to the same key.
+    """
+    from_date = _as_date(ctx["from_date"])
+    to_date = _as_date(ctx["to_date"])
+    canonical = {
+        "origin": _normalize_text(ctx["origin"]),
+        "destination": _normalize_text(ctx["destination"]),
+        "duration_days": (to_date - from_date).days + 1,
+        "month": from_date.month,
+        "group_size": int(ctx["group_size"]),
+        "budget_amount": int(ctx["budget_amount"]),
+    }
+    for field in TEXT_FIELDS:
+        canonical[field] = _normalize_text(ctx.get(field) or "")
+    for field in LIST_FIELDS:
+        canonical[field] = sorted(_normalize_text(v) for v in ctx.get(field) or [])
+    encoded = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def shift_dates(text, days):
+    """Moves every YYYY-MM-DD date in text by the given number of days."""
+    if not days:
+        return text
+
+    def _shift(match):
+        try:
+            original = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return match.group(0)
+        return (original + timedelta(days=days)).isoformat()
+
+    return ISO_DATE_RE.sub(_shift, text)
+
+
+class ItineraryCache:
+    """SQLite-backed itinerary cache with a TTL and size-bounded LRU eviction.
+
+    Each operation opens its own short-lived connection, so one instance can be shared
+    across threads and several processes can use the same file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS itineraries ("
+                " key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " from_date TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " hit_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_itineraries_last_access ON itineraries (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, ctx):
+        """Returns the cached itinerary re-dated to ctx's start date, or None on a miss."""
+        key = canonical_trip_key(ctx)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, from_date, created_at FROM itineraries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[2] > self.ttl_seconds:
+                conn.execute("DELETE FROM itineraries WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute(
+                    "UPDATE itineraries SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                    (now, key)
+                )
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        offset = (_as_date(ctx["from_date"]) - date.fromisoformat(row[1])).days
+        return shift_dates(row[0], offset)
+
+    def contains(self, ctx):
+        """Whether a fresh entry exists for ctx; unlike get(), counts no hit or miss."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT created_at FROM itineraries WHERE key = ?", (canonical_trip_key(ctx),)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl_seconds
+
+    def put(self, ctx, response):
+        """Stores an itinerary and evicts the least recently used entries beyond max_entries."""
+        key = canonical_trip_key(ctx)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO itineraries (key, response, from_date, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, response, _as_date(ctx["from_date"]).isoformat(), now, now)
+            )
+            conn.execute(
+                "DELETE FROM itineraries WHERE key IN ("
+                " SELECT key FROM itineraries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        """Hit/miss counters for this process plus the number of stored entries."""
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM itineraries").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
+
+
+def cache_enabled():
+    """The cache can be switched off for a deployment with TRIVANZA_ITINERARY_CACHE=off."""
+    return os.environ.get("TRIVANZA_ITINERARY_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+
+# --- Pre-warm CLI ---
+
+def read_trip_contexts(csv_path):
+    """Reads trip contexts from a CSV whose columns match the trip_context keys.
+
+    List columns (e.g. accommodation_pref) hold ';'-separated values.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            ctx = {k: (v or "").strip() for k, v in row.items()}
+            ctx["from_date"] = date.fromisoformat(ctx["from_date"])
+            ctx["to_date"] = date.fromisoformat(ctx["to_date"])
+            ctx["group_size"] = int(ctx.get("group_size") or 1)
+            ctx["budget_amount"] = int(float(ctx.get("budget_amount") or 0))
+            for field in LIST_FIELDS:
+                ctx[field] = [v.strip() for v in ctx.get(field, "").split(";") if v.strip()]
+            for field in TEXT_FIELDS:
+                ctx.setdefault(field, "")
+            yield ctx
+
+
+def _generate_itinerary(gateway, ctx, model):
+    """Generates ctx's itinerary the way the app does: structured, with days in parallel."""
+    from trivanza_costs import CURRENCY_RATES, CostTable
+    from trivanza_gateway import PRIORITY_ITINERARY, AsyncGatewayClient
+    from trivanza_itinerary import ItineraryEngine
+    from trivanza_prompts import build_system_prompt_text, build_trip_prompt
+
+    engine = ItineraryEngine(
+        AsyncGatewayClient(gateway, priority=PRIORITY_ITINERARY), model=model, cost_table=CostTable(CURRENCY_RATES)
+    )
+    system_prompt = build_system_prompt_text("UTC", "Not Detected", int(time.time() // 60))
+    return asyncio.run(engine.generate(system_prompt, build_trip_prompt(ctx), ctx))
+
+
+def prewarm(csv_path, cache, concurrency=4, model="gpt-4o", force=False, gateway=None):
+    """Generates and stores itineraries for every trip in csv_path, at most `concurrency` at a time."""
+    from trivanza_gateway import LLMGateway
+
+    gateway = gateway or LLMGateway()
+    contexts = [ctx for ctx in read_trip_contexts(csv_path) if force or not cache.contains(ctx)]
+    generated = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(_generate_itinerary, gateway, ctx, model): ctx for ctx in contexts}
+        for future in as_completed(futures):
+            ctx = futures[future]
+            try:
+                cache.put(ctx, future.result())
+                generated += 1
+            except Exception as e:
+                failed += 1
+                logger.warning("Pre-warm failed for %s -> %s: %s", ctx["origin"], ctx["destination"], e)
+    return {"generated": generated, "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the Trivanza itinerary cache.")
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH, help="SQLite cache file")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("prewarm", help="Fill the cache from a CSV of popular trip contexts")
+    warm.add_argument("csv_path")
+    warm.add_argument("--concurrency", type=int, default=4)
+    warm.add_argument("--model", default="gpt-4o")
+    warm.add_argument("--force", action="store_true", help="Regenerate trips that are already cached")
+    sub.add_parser("stats", help="Print cache statistics")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    cache = ItineraryCache(args.path)
+    if args.command == "prewarm":
+        print(json.dumps(prewarm(args.csv_path, cache, args.concurrency, args.model, args.force)))
+    else:
+        print(json.dumps(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
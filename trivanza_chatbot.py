@@ -1,97 +1,55 @@
 import streamlit as st
-from openai import OpenAI
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
 from datetime import date, datetime, timedelta
 import pandas as pd
 import requests 
 import streamlit.components.v1 as components
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from trivanza_itinerary import ItineraryEngine
+from trivanza_costs import CURRENCY_RATES, CostTable
+from trivanza_geo import reverse_geocode
+from trivanza_context import ConversationContext, extractive_summary, latest_itinerary_index, prepare_markdown
+from trivanza_cache import ItineraryCache, cache_enabled
+from trivanza_edits import ItineraryEditor, parse_itinerary, select_targets
+from trivanza_gateway import PRIORITY_CHAT, PRIORITY_ITINERARY, AsyncGatewayClient, GatewayClient, LLMGateway
+from trivanza_metrics import CANCELLED, METRICS, STAGE_TIMING, record_llm_call, timed
+from trivanza_intent import ITINERARY_EDIT, NEARBY, route_for, route_message
+from trivanza_poi import DEFAULT_LIMIT, NEARBY_REPLY_INSTRUCTIONS, NEARBY_TOOL, detect_category, find_nearby, get_poi_index
+from trivanza_prompts import build_system_prompt_text, build_trip_prompt, format_trip_summary
+from trivanza_sessions import SESSION_COOKIE, load_session_secret, open_session_store, verify_session_cookie
 
 # Page configuration for the Streamlit app
 st.set_page_config(page_title="✈️ Trivanza - Your AI Travel Assistant", layout="centered")
 
-# Initialize the OpenAI client
-# Make sure to have your OPENAI_API_KEY set as an environment variable
-client = OpenAI()
+logger = logging.getLogger("trivanza")
+
+# Input-token budget per call (excluding the system prompt); older turns are summarized.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("TRIVANZA_CONTEXT_BUDGET", "6000"))
+
+# Maximum number of itinerary days generated at the same time.
+ITINERARY_CONCURRENCY = int(os.environ.get("TRIVANZA_ITINERARY_CONCURRENCY", "6"))
+
+ASSISTANT_AVATAR = "https://raw.githubusercontent.com/armanmujtaba/Trivanza/main/trivanza_logo.png"
 
 # --- Restored Original Features & Data ---
 
-# Currency rate table for INR conversion (Restored from original script)
-CURRENCY_RATES = pd.DataFrame([
-    {"Currency": "US Dollar", "Code": "USD", "INR_Value": 86.28},
-    {"Currency": "Euro", "Code": "EUR", "INR_Value": 99.75},
-    {"Currency": "British Pound", "Code": "GBP", "INR_Value": 116.94},
-    {"Currency": "Japanese Yen", "Code": "JPY", "INR_Value": 0.60},
-    {"Currency": "Australian Dollar", "Code": "AUD", "INR_Value": 56.35},
-    {"Currency": "Canadian Dollar", "Code": "CAD", "INR_Value": 63.55},
-    {"Currency": "Swiss Franc", "Code": "CHF", "INR_Value": 106.01},
-    {"Currency": "Chinese Yuan", "Code": "CNY", "INR_Value": 12.02},
-    {"Currency": "UAE Dirham", "Code": "AED", "INR_Value": 23.51},
-    {"Currency": "Singapore Dollar", "Code": "SGD", "INR_Value": 67.36},
-    {"Currency": "New Zealand Dollar", "Code": "NZD", "INR_Value": 52.38},
-    {"Currency": "Russian Ruble", "Code": "RUB", "INR_Value": 1.10},
-    {"Currency": "South African Rand", "Code": "ZAR", "INR_Value": 4.83},
-    {"Currency": "Brazilian Real", "Code": "BRL", "INR_Value": 15.77},
-    {"Currency": "Saudi Riyal", "Code": "SAR", "INR_Value": 22.99},
-    {"Currency": "Qatari Riyal", "Code": "QAR", "INR_Value": 23.66},
-    {"Currency": "Kuwaiti Dinar", "Code": "KWD", "INR_Value": 281.80},
-    {"Currency": "Bahraini Dinar", "Code": "BHD", "INR_Value": 228.77},
-    {"Currency": "Omani Rial", "Code": "OMR", "INR_Value": 224.42},
-])
-
-# --- Core Application Logic and Prompts ---
-
-# This is the full, combined system prompt. It includes all of your original
-# detailed instructions plus the new "Google for Travelers" enhancements.
-ENHANCED_SYSTEM_PROMPT_TEMPLATE = """
-IMPORTANT: You are Trivanza, an expert, all-in-one AI travel assistant. Your persona is that of a friendly, polite, and incredibly helpful human travel expert. Your goal is to make the user feel like they are talking to a real person who genuinely wants to help.
-
-Your #1 PRIORITY IS TO ASSIST WITH ON-THE-GO, REAL-TIME TRAVELER NEEDS. This includes emergencies, navigation, and finding local services. This is just as important as trip planning.
-
-Your capabilities include:
-- **On-the-Go & Emergency Assistance (TOP PRIORITY):** You have access to real-time mapping services to find nearby places (ATMs, hospitals, pharmacies, etc.), live flight status data, and local transport information. You must use this to provide accurate, helpful, on-the-go assistance.
-- **Trip Planning:** Creating detailed itineraries, suggesting bookings, packing lists, and budgets based on your extensive travel knowledge.
-- **Practical Information:** Answering questions on visa requirements, currency exchange, local SIM cards, and Wi-Fi.
-
-You MUST use the current real-world date, time, and location as context.
-- Today is {today_str}.
-- The current time is {current_time}.
-- The user's current location is: **{current_location}**. You MUST use this for all on-the-go requests. Do NOT ask for their location unless it is "Not Detected".
-
-**GLOBAL AWARENESS:** The user can be from anywhere in the world. Do not assume their nationality or currency. When providing information like emergency numbers (e.g., for a lost passport), if you don't know their nationality, you MUST ask politely (e.g., "I can certainly help with that. To find the correct embassy for you, could you please let me know your nationality?").
-
-**TONE AND LANGUAGE:**
-- Be polite, empathetic, and conversational. Use phrases like "Of course," "I can certainly help with that," "Let's see," and "I hope this helps!"
-- Instead of just giving data, be proactive. For example, after finding a hospital, ask, "Would you like me to find a pharmacy nearby as well, or perhaps check its opening hours?"
-- Your responses should always be user-friendly, clear, and genuinely useful.
-
-**CRITICAL INSTRUCTION ON REALISM:** You must act as if you are connected to live, real-world data sources. Your information should be factual and verifiable.
-- **TIME AWARENESS:** You MUST consider the current time ({current_time}). If a user asks for an eatery late at night, recommend places that are open 24/7 or have late hours. Do not suggest a restaurant that is likely closed.
-- **PROVIDE FULL DETAILS:** When you suggest a service (like a hospital, mechanic, or restaurant), you MUST include its full contact details (Name, Address, and a plausible Phone Number).
-- **OFFER ALTERNATIVES:** For services like mechanics, also suggest national on-call or roadside assistance services with their contact numbers.
-- **Example (User asks for a mechanic in Gurugram):** "Certainly. A reliable car mechanic in your area is 'GoMechanic - Sector 45'. Their address is Plot No. 123, Sector 45, Gurugram, and you can reach them at a number like +91 98765 43210. For immediate on-road help, you could also contact a national roadside assistance service like Allianz at 1800-103-5858. I hope you get the help you need quickly!"
-
---- ITINERARY OUTPUT FORMAT (Original Detailed Instructions Preserved) ---
-IMPORTANT: For every itinerary, you MUST follow all these instructions STRICTLY:
-1.  **Greeting:** Always begin with a warm, Personalized Travel Greeting Lines (with Place & Duration) (e.g., "Namaste Traveler! An amazing 7-day getaway to Bali sounds wonderful. Let's get it planned for you!").
-2.  **Formatting:**
-    - Use Markdown, but never use heading levels higher than `###`.
-    - Each day should be started with a heading: `### Day N: <activity/city> (<YYYY-MM-DD>)`.
-    - Every single itinerary item (flight, hotel, meal, activity, transportation, etc.) MUST be in a separate paragraph (two line breaks).
-    - Suggest REALISTIC named options (e.g., "Air India AI-123", "Ibis Paris Montmartre") with plausible, working booking/info links: `[Book](https://www.booking.com/...)`.
-    - Show the cost for each item and sum exact costs for each day: `🎯 Daily Total: ₹<amount>`.
-3.  **Cost Calculation:**
-    - All costs MUST be for the **total number of travelers** and the **entire trip duration**.
-    - For international trips, show prices in **both local currency and the user's preferred currency**, clearly stating the exchange rate used. If their currency is unknown, use a common one like USD and mention it.
-    - Always include realistic local transportation costs for the group within each day's plan.
-4.  **Final Sections (In this exact order and format):**
-    - `🧾 Cost Breakdown:` (Flights, Accommodation, Meals, Transportation, Activities, Travel Extras)
-    - `💰 Grand Total: ₹<sum>`
-    - `🎒 Packing Checklist:` (Must be personalized for the destination, weather, and activities).
-    - `💼 Budget Analysis:` (Analyze cost vs. budget and provide actionable, expert advice. State exactly how much is left or over).
-    - `📌 Destination Pro Tip:` (A fun, useful tip about the location).
-    - `⚠️ *Disclaimer: All estimated costs are for guidance only...*`
-5.  **Closing:** Always ask: "How does this look? I'm happy to make any adjustments you'd like."
-"""
+# Structured itineraries: the model lists priced items as JSON and all currency
+# conversion, totals and budget analysis are computed locally against CURRENCY_RATES.
+STRUCTURED_ITINERARIES = os.environ.get("TRIVANZA_STRUCTURED_ITINERARY", "on").lower() not in ("0", "off", "false", "no")
+COST_TABLE = CostTable(CURRENCY_RATES)
+
+# The nearest bundled city is only trusted as the user's location within this distance.
+MAX_CITY_DISTANCE_KM = float(os.environ.get("TRIVANZA_MAX_CITY_DISTANCE_KM", "50"))
+
+# Itinerary edits regenerate only the days they mention and recompute the totals locally.
+PATCH_EDITS = os.environ.get("TRIVANZA_PATCH_EDITS", "on").lower() not in ("0", "off", "false", "no")
 
 # --- App State and Helper Functions ---
 
@@ -110,139 +68,402 @@ def get_location_component():
 
         const options = { enableHighAccuracy: true, timeout: 5000, maximumAge: 0 };
 
+        // Only raw coordinates are sent; the server resolves them to a city and timezone.
+        // The browser timezone is a fallback for when no position is available.
+        const browserTimezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+
         function success(pos) {
             const crd = pos.coords;
-            const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
-            fetch(`https://nominatim.openstreetmap.org/reverse?format=jsonv2&lat=${crd.latitude}&lon=${crd.longitude}`)
-                .then(response => response.json())
-                .then(data => {
-                    const city = data.address.city || data.address.town || data.address.village || 'Unknown City';
-                    const country = data.address.country || 'Unknown Country';
-                    sendLocation({ "status": "GPS_SUCCESS", "location": `${city}, ${country}`, "timezone": timezone });
-                })
-                .catch(err => sendLocation({ "status": "GEOCODE_FAILED", "timezone": timezone }));
+            sendLocation({ "status": "GPS_SUCCESS", "lat": crd.latitude, "lon": crd.longitude, "browser_timezone": browserTimezone });
         }
 
         function error(err) {
-            const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
-            sendLocation({ "status": "GPS_FAILED", "timezone": timezone });
+            sendLocation({ "status": "GPS_FAILED", "browser_timezone": browserTimezone });
         }
 
         if (navigator.geolocation) {
             navigator.geolocation.getCurrentPosition(success, error, options);
         } else {
-            sendLocation({ "status": "GPS_NOT_SUPPORTED", "timezone": "UTC" });
+            sendLocation({ "status": "GPS_NOT_SUPPORTED", "browser_timezone": browserTimezone });
         }
         </script>
         """, height=0)
 
-def build_system_prompt():
+def build_system_prompt(focus=None):
     """Builds the system prompt with current date, time, and location information."""
     user_timezone_str = st.session_state.get("timezone", "UTC")
+    current_location = st.session_state.get('current_location', 'Not Set')
+    return build_system_prompt_text(user_timezone_str, current_location, int(time.time() // 60), focus)
+
+def record_usage(usage, kind, model="gpt-4o", error=None, **timings):
+    """Logs token usage (including OpenAI prefix-cache hits) and records the call's metrics.
+
+    Also keeps a running estimated cost for the session in st.session_state.estimated_cost_usd.
+    """
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        logger.info(
+            "%s usage: prompt_tokens=%d cached_tokens=%d completion_tokens=%d",
+            kind, usage.prompt_tokens, cached_tokens, usage.completion_tokens
+        )
+    cost = record_llm_call(kind, model, session_id=st.session_state.get("session_id"), usage=usage, error=error, **timings)
+    st.session_state.estimated_cost_usd = st.session_state.get("estimated_cost_usd", 0.0) + cost
+
+def summarize_conversation(previous_summary, messages):
+    """Folds older chat turns into the running summary using a small, cheap model."""
+    transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    started = time.perf_counter()
     try:
-        user_tz = ZoneInfo(user_timezone_str)
-    except ZoneInfoNotFoundError:
-        user_tz = ZoneInfo("UTC") # Fallback to UTC if timezone is invalid
+        response = get_llm_gateway().create(
+            priority=PRIORITY_CHAT,
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "You maintain a running summary of a travel-assistant chat. Update the summary with the new turns. Keep the traveler's preferences, constraints, decisions and open questions. Be concise: at most 200 words, plain bullet points."},
+                {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+            ],
+            temperature=0.2,
+            max_tokens=300
+        )
+        record_usage(
+            response.usage, "summary", model="gpt-4o-mini",
+            queue_seconds=get_llm_gateway().last_queue_seconds(), total_seconds=time.perf_counter() - started
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        logger.warning("Summarization failed, using extractive summary: %s", e)
+        record_usage(None, "summary", model="gpt-4o-mini", error=type(e).__name__)
+        return extractive_summary(previous_summary, messages)
+
+@st.cache_resource
+def get_llm_gateway():
+    """One gateway (rate limits, retries, coalescing) shared by every session in this process.
+
+    Make sure to have your OPENAI_API_KEY set as an environment variable.
+    """
+    return LLMGateway()
 
-    now_local = datetime.now(user_tz)
-    today_str = now_local.strftime("%A, %B %d, %Y")
-    current_time_str = now_local.strftime("%I:%M %p %Z") # e.g., 01:30 PM IST
+@st.cache_resource
+def get_itinerary_cache():
+    """One itinerary cache shared by every session in this process."""
+    return ItineraryCache()
 
-    current_location = st.session_state.get('current_location', 'Not Set')
-    return ENHANCED_SYSTEM_PROMPT_TEMPLATE.format(
-        today_str=today_str,
-        current_time=current_time_str,
-        current_location=current_location
+@st.cache_resource
+def get_session_store():
+    """Chat histories of every session in this process; idle ones are spilled to disk."""
+    return open_session_store()
+
+@st.cache_resource
+def get_session_secret():
+    """The key trivanza_server.py signs session cookies with."""
+    return load_session_secret(get_session_store().path)
+
+def _tab_is_connected(streamlit_session_id):
+    try:
+        return Runtime.instance().is_active_session(streamlit_session_id) is True
+    except RuntimeError:
+        return False
+
+def claim_session():
+    """The session id for this tab: the browser's signed cookie, unless another open tab is using it.
+
+    Without a valid cookie (e.g. the app was started without trivanza_server.py) or with
+    the browser's chat already open in another tab, the tab gets a chat of its own.
+    """
+    store = get_session_store()
+    session_id = verify_session_cookie(st.context.cookies.get(SESSION_COOKIE), get_session_secret())
+    ctx = get_script_run_ctx()
+    owner = ctx.session_id if ctx is not None else None
+    if session_id is not None and owner is not None and store.claim(session_id, owner, _tab_is_connected) is not None:
+        return session_id
+    session_id = uuid.uuid4().hex
+    store.claim(session_id, owner)
+    return session_id
+
+def save_session():
+    """Writes this session to disk so a crash or restart doesn't lose the latest turn."""
+    try:
+        get_session_store().save(current_session())
+    except Exception as e:  # The chat goes on; the periodic sweep will retry.
+        logger.warning("Could not save session: %s", e)
+
+def current_session():
+    """This browser session's chat state (messages, trip_context, pending_llm_prompt).
+
+    Look it up again after any long wait instead of holding on to it: an idle session
+    may have been evicted to disk in the meantime.
+    """
+    return get_session_store().get(st.session_state.session_id)
+
+def build_messages_payload(focus=None):
+    """Builds the token-budgeted message list for the next model call."""
+    context = st.session_state.setdefault("conversation_context", ConversationContext(CONTEXT_TOKEN_BUDGET))
+    with timed("prompt_build"):
+        return context.build_payload(build_system_prompt(focus), current_session().messages, summarize=summarize_conversation)
+
+def stream_assistant_response(messages_payload, max_tokens, waiting_text, error_prefix, fallback_message, usage_kind="chat",
+                              model="gpt-4o", temperature=0.7, **create_kwargs):
+    """Streams the model's reply into an assistant chat bubble and commits it to the chat history.
+
+    The reply is drawn token by token, so no extra rerun is needed to show it. If the user
+    sends a new message mid-stream, Streamlit interrupts this run; the upstream stream is
+    closed and whatever was received so far is kept in the history.
+
+    Returns the full reply if the stream completed, otherwise None.
+    """
+    with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
+        placeholder = st.empty()
+        placeholder.markdown(f"_{waiting_text}_")
+        chunks = []
+        stream = None
+        assistant_response = None
+        completed = False
+        usage = None
+        error = None
+        queue_seconds = ttft_seconds = None
+        started = time.perf_counter()
+        try:
+            stream = get_llm_gateway().create(
+                priority=PRIORITY_CHAT,
+                model=model,
+                messages=messages_payload,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                **create_kwargs
+            )
+            queue_seconds = get_llm_gateway().last_queue_seconds()
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not chunks:
+                    ttft_seconds = st.session_state.last_ttft = time.perf_counter() - started
+                    logger.info("Time to first token: %.2fs", ttft_seconds)
+                chunks.append(delta)
+                placeholder.markdown("".join(chunks) + "▌")
+            assistant_response = "".join(chunks)
+            completed = True
+        except Exception as e:
+            logger.warning("%s: %s", error_prefix, e)
+            error = type(e).__name__
+            st.error(f"{error_prefix}: {e}")
+            assistant_response = fallback_message
+        finally:
+            if stream is not None:
+                stream.close()
+            record_usage(
+                usage, usage_kind, model=model, error=error if completed or error else CANCELLED,
+                queue_seconds=queue_seconds, ttft_seconds=ttft_seconds, total_seconds=time.perf_counter() - started
+            )
+            if assistant_response is None and chunks:
+                # Interrupted by a new user action: keep the partial reply so the history stays coherent.
+                assistant_response = "".join(chunks) + " …"
+            if assistant_response is not None:
+                current_session().messages.append({"role": "assistant", "content": assistant_response})
+        placeholder.markdown(assistant_response)
+    return assistant_response if completed else None
+
+async def _run_itinerary_engine(system_prompt, trip_prompt, trip_context, **callbacks):
+    engine = ItineraryEngine(
+        AsyncGatewayClient(get_llm_gateway(), priority=PRIORITY_ITINERARY),
+        concurrency=ITINERARY_CONCURRENCY,
+        cost_table=COST_TABLE if STRUCTURED_ITINERARIES else None
     )
+    return await engine.generate(system_prompt, trip_prompt, trip_context, on_usage=record_usage, **callbacks)
 
-def format_trip_summary(ctx):
-    """Formats the user's trip details for display (Restored from original)."""
-    date_fmt = f"{ctx['from_date']} to {ctx['to_date']}"
-    travelers = f"{ctx['group_size']} {'person' if ctx['group_size']==1 else 'people'} ({ctx['traveler_type']})"
-    budget = f"{ctx['currency_type']} {ctx['budget_amount']}"
-    food = ', '.join(ctx['food_preferences']) if ctx.get('food_preferences') else 'None'
-    comm_conn = ', '.join(ctx['comm_connectivity']) if ctx.get('comm_connectivity') else 'None'
-    sustainability = ctx['sustainability']
-    cultural = ctx['cultural_pref']
-    activities_interests = ', '.join(ctx['activities_interests']) if ctx.get('activities_interests') else 'None'
-    accommodation = ', '.join(ctx['accommodation_pref']) if ctx.get('accommodation_pref') else 'None'
-    mode = ctx.get("mode_of_transport", "Any")
-    purpose = ctx.get("purpose_of_travel", "None")
-    return (
-        f"**Trip Summary:**\n"
-        f"- **From:** {ctx['origin']}\n"
-        f"- **To:** {ctx['destination']}\n"
-        f"- **Dates:** {date_fmt}\n"
-        f"- **Travelers:** {travelers}\n"
-        f"- **Purpose of Travel:** {purpose}\n"
-        f"- **Budget:** {budget}\n"
-        f"- **Accommodation Preferences:** {accommodation}\n"
-        f"- **Preferred Transport:** {mode}\n"
-        f"- **Food Preferences:** {food}\n"
-        f"- **Communication & Connectivity:** {comm_conn}\n"
-        f"- **Sustainability:** {sustainability}\n"
-        f"- **Cultural Sensitivity:** {cultural}\n"
-        f"- **Activities & Interests:** {activities_interests}\n"
+def generate_itinerary_response(trip_context, trip_prompt, fallback_message):
+    """Generates the itinerary day by day, rendering each day as soon as it is ready.
+
+    Returns the itinerary on success, otherwise None (the fallback message is shown instead).
+    """
+    with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
+        body = st.empty()
+        progress = body.container()
+        progress.markdown("_🚀 Crafting your personalized itinerary..._")
+        day_slots = []
+
+        def on_skeleton(greeting, headings):
+            progress.markdown(greeting)
+            for heading in headings:
+                slot = progress.empty()
+                slot.markdown(f"{heading}\n\n_Planning this day..._")
+                day_slots.append(slot)
+            progress.markdown("_Putting together your cost breakdown..._")
+
+        def on_day(index, text):
+            day_slots[index].markdown(text)
+
+        assistant_response = None
+        started = time.perf_counter()
+        try:
+            assistant_response = asyncio.run(_run_itinerary_engine(
+                build_system_prompt(), trip_prompt, trip_context, on_skeleton=on_skeleton, on_day=on_day
+            ))
+        except Exception as e:
+            logger.warning("Itinerary generation failed: %s", e)
+            METRICS.inc("trivanza_itinerary_errors_total", error=type(e).__name__)
+            st.error(f"An error occurred while generating the itinerary: {e}")
+        METRICS.observe("trivanza_itinerary_seconds", time.perf_counter() - started)
+        body.markdown(assistant_response or fallback_message)
+    current_session().messages.append({"role": "assistant", "content": assistant_response or fallback_message})
+    return assistant_response
+
+def apply_itinerary_edit(request, route):
+    """Patches the latest itinerary instead of streaming a full reply.
+
+    Returns False (and renders nothing) when the request doesn't name specific days or
+    sections, or when the edit fails, so the caller can fall back to a normal reply.
+    """
+    messages = current_session().messages
+    index = latest_itinerary_index(messages)
+    if index is None:
+        return False
+    itinerary = messages[index]["content"]
+    targets = select_targets(request, parse_itinerary(itinerary))
+    if targets is None:
+        return False
+    editor = ItineraryEditor(
+        GatewayClient(get_llm_gateway(), priority=PRIORITY_CHAT),
+        model=route["model"],
+        temperature=route["temperature"],
+        cost_table=COST_TABLE if STRUCTURED_ITINERARIES else None
     )
+    days, finals = targets
+    started = time.perf_counter()
+    with st.spinner("✏️ Updating " + ", ".join([f"Day {d}" for d in days] + [k.replace("_", " ") for k in finals]) + "..."):
+        try:
+            result = editor.edit(
+                build_system_prompt(route["focus"]), itinerary, request, current_session().trip_context,
+                on_usage=lambda usage, kind, **timings: record_usage(usage, kind, model=route["model"], **timings)
+            )
+        except Exception as e:
+            logger.warning("Itinerary edit failed, falling back to a full reply: %s", e)
+            METRICS.inc("trivanza_itinerary_edit_errors_total", error=type(e).__name__)
+            return False
+    METRICS.observe("trivanza_itinerary_edit_seconds", time.perf_counter() - started)
+    if result is None:
+        return False
+    updated, _ = result
+    current_session().messages.append({"role": "assistant", "content": updated})
+    with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
+        st.markdown(updated)
+    return True
+
+def nearby_tool_messages(request):
+    """Answers "nearest X" requests with the find_nearby tool over the offline POI index.
+
+    Returns the tool call, its result and the phrasing instructions to append to the
+    payload, or None when there is no index, no GPS position or no matching category.
+    """
+    category = detect_category(request)
+    if category is None:
+        return None
+    index = get_poi_index()
+    coords = st.session_state.get("location_coords")
+    if index is None or category not in index.categories or not coords:
+        return None
+    if coords["location"] != st.session_state.get("current_location"):
+        return None  # The user typed a different location; the GPS position no longer applies.
+    arguments = {"category": category, "open_now": True, "limit": DEFAULT_LIMIT}
+    started = time.perf_counter()
+    try:
+        result = find_nearby(index, lat=coords["lat"], lon=coords["lon"], timezone=st.session_state.get("timezone", "UTC"), **arguments)
+    except Exception as e:
+        logger.warning("Nearby lookup failed: %s", e)
+        METRICS.inc("trivanza_nearby_errors_total", error=type(e).__name__)
+        return None
+    METRICS.observe("trivanza_nearby_seconds", time.perf_counter() - started, category=category)
+    METRICS.inc("trivanza_nearby_total", category=category, found="yes" if result["places"] else "no")
+    call_id = f"call_{uuid.uuid4().hex[:24]}"
+    return [
+        {"role": "assistant", "content": None, "tool_calls": [{
+            "id": call_id, "type": "function",
+            "function": {"name": "find_nearby", "arguments": json.dumps(arguments)},
+        }]},
+        {"role": "tool", "tool_call_id": call_id, "content": json.dumps(result, ensure_ascii=False)},
+        {"role": "system", "content": NEARBY_REPLY_INSTRUCTIONS},
+    ]
 
 # --- Streamlit UI and Session State Management ---
 
+def count_execution(kind):
+    """Counts full script runs, chat fragment runs and user turns for this session."""
+    counts = st.session_state.setdefault("execution_counts", {"script": 0, "chat_fragment": 0, "turns": 0})
+    counts[kind] += 1
+    # Server-side, so reruns can be measured against a real browser session (bench/fragment_reruns.py).
+    METRICS.inc("trivanza_executions_total", kind=kind)
+    if kind == "script":
+        logger.debug("Execution counts: %s", counts)
+        requested_at = st.session_state.pop("rerun_requested_at", None)
+        if requested_at is not None and STAGE_TIMING:
+            METRICS.observe("trivanza_stage_seconds", time.perf_counter() - requested_at, stage="rerun", kind="")
+
+def request_rerun(reason):
+    """Counts and times a full st.rerun() (the time until the next script run starts)."""
+    METRICS.inc("trivanza_reruns_total", reason=reason)
+    st.session_state.rerun_requested_at = time.perf_counter()
+    st.rerun()
+
 def initialize_app():
-    """Handles the initial setup, including location and timezone detection."""
+    """Sets up session state. Location detection finishes in the background, see update_location()."""
     if 'app_initialized' in st.session_state:
         return
 
-    # This component will trigger a rerun once it has a value.
-    gps_result = get_location_component()
-    
-    # If the component hasn't returned a value yet, show a loading message and wait.
-    if gps_result is None:
-        st.info("Initializing and detecting your timezone...")
-        return # Stop execution and wait for the component to trigger a rerun.
-
-    # If we get here, the component has returned a value.
-    st.session_state.timezone = "UTC" # Default timezone
-    if isinstance(gps_result, dict):
-        st.session_state.timezone = gps_result.get("timezone", "UTC")
-        if gps_result.get("status") == "GPS_SUCCESS":
-            st.session_state.current_location = gps_result.get("location")
-        else: # GPS failed, not supported, or component failed
-            st.session_state.current_location = "Not Detected"
-    else: 
-        st.session_state.current_location = "Not Detected"
-
-    # Initialize other state variables now that we have location/timezone
+    st.session_state.timezone = "UTC" # Default until the location arrives
+    st.session_state.current_location = "Detecting..."
+    st.session_state.location_pending = True
     st.session_state.trip_form_expanded = False
-    st.session_state.messages = []
-    st.session_state.form_submitted = False
-    st.session_state.trip_context = None
+    # The session id comes from a signed, HttpOnly cookie, so a reload restores the same chat.
+    st.session_state.session_id = claim_session()
+    st.session_state.form_submitted = current_session().trip_context is not None
     st.session_state.pending_form_response = False
+    st.session_state.conversation_context = ConversationContext(CONTEXT_TOKEN_BUDGET)
     st.session_state.app_initialized = True
-    st.rerun()
 
+def apply_location_result(gps_result):
+    """Resolves the browser's coordinates to a location and timezone with the offline gazetteer."""
+    timezone = "UTC"
+    location = "Not Detected"
+    coords = None  # Kept for the nearby-services tool
+    if isinstance(gps_result, dict):
+        timezone = gps_result.get("browser_timezone") or "UTC"
+        if gps_result.get("status") == "GPS_SUCCESS":
+            try:
+                place = reverse_geocode(gps_result["lat"], gps_result["lon"])
+            except (KeyError, TypeError, ValueError):
+                place = None
+            # Farther than the cutoff from any town, the nearest one is the wrong place
+            # name but still the best guess at the timezone.
+            if place:
+                timezone = place["timezone"]
+                if place["distance_km"] <= MAX_CITY_DISTANCE_KM:
+                    location = f"{place['city']}, {place['country']}"
+                coords = {"lat": float(gps_result["lat"]), "lon": float(gps_result["lon"]), "location": location}
+    st.session_state.timezone = timezone
+    st.session_state.current_location = location
+    st.session_state.location_coords = coords
+
+def update_location():
+    """Mounts the location component until it reports back; never blocks the rest of the page.
+
+    Must run before the location text box is drawn, since it writes that widget's value.
+    """
+    if not st.session_state.get("location_pending"):
+        return
+    gps_result = get_location_component()
+    if gps_result is None:
+        return # The component triggers a rerun once it has a value.
+    apply_location_result(gps_result)
+    st.session_state.location_pending = False
 
-def main_app():
-    """The main application logic, runs after initialization."""
-    # Custom CSS for UI enhancements
-    st.markdown("""
-    <style>
-        .logo-container { display: flex; justify-content: center; align-items: center; margin-bottom: 10px; }
-        .logo { width: 300px; }
-        .stChatInputContainer { position: fixed; bottom: 0; width: 100%; background: white; z-index: 1001; padding-bottom: 1rem; }
-        .appview-container .main .block-container { padding-bottom: 5rem; }
-    </style>
-    <div class="logo-container">
-        <img class="logo" src="https://raw.githubusercontent.com/armanmujtaba/Trivanza/main/Trivanza.png?raw=true" alt="Trivanza Logo">
-    </div>
-    """, unsafe_allow_html=True)
-
-    # Let user override location if needed.
-    st.text_input(
-        "📍 Your Current Location (auto-detected)",
-        key="current_location",
-        help="We've tried to detect your location automatically. You can correct it here if needed."
-    )
 
+@st.fragment
+def render_trip_form():
+    """The "Plan My Trip" form. As a fragment, editing it never re-runs the chat."""
     # "Plan My Trip" form
     with st.expander("📋 Plan My Trip", expanded=st.session_state.trip_form_expanded):
         with st.form("travel_form", clear_on_submit=True):
@@ -270,13 +491,16 @@ def main_app():
             comm_connectivity = st.multiselect("📡 Communication & Connectivity", ["English Spoken", "Language Barrier", "Wi-Fi Required", "SIM Card Needed", "Translation Tools"], key="comm_connectivity")
             sustainability = st.selectbox("🌱 Sustainability", ["None", "Eco-Friendly Stays", "Carbon Offset Flights", "Zero-Waste Activities"], key="sustainability")
             cultural_pref = st.selectbox("👗 Cultural Sensitivity", ["Standard", "Conservative Dress", "Religious Holidays", "Gender Norms"], key="cultural_pref")
+            fresh_itinerary = st.checkbox("🔄 Always generate a fresh itinerary", help="Skip saved itineraries for similar trips.", key="fresh_itinerary")
             submit_button = st.form_submit_button("🚀 Generate Itinerary")
 
             if submit_button:
                 st.session_state.trip_form_expanded = False
                 st.session_state.form_submitted = True
                 st.session_state.pending_form_response = True
-                st.session_state.trip_context = {
+                st.session_state.bypass_itinerary_cache = fresh_itinerary
+                session = current_session()
+                session.trip_context = {
                     "origin": origin, "destination": destination, "from_date": from_date, "to_date": to_date,
                     "traveler_type": traveler_type, "group_size": group_size, "purpose_of_travel": purpose_of_travel,
                     "food_preferences": food_preferences, "comm_connectivity": comm_connectivity,
@@ -285,17 +509,22 @@ def main_app():
                     "currency_type": currency_type, "accommodation_pref": accommodation_pref,
                     "mode_of_transport": mode_of_transport
                 }
-                prompt_for_llm = (f"Plan a trip from {origin} to {destination} from {from_date} to {to_date} for a {traveler_type.lower()} of {group_size} people. Details: {st.session_state.trip_context}")
-                st.session_state.pending_llm_prompt = prompt_for_llm
-                st.session_state.messages = []
-                st.rerun()
-
-    # Display trip summary if a form was submitted
-    if st.session_state.form_submitted and st.session_state.trip_context:
-        st.info(format_trip_summary(st.session_state.trip_context))
-
+                session.pending_llm_prompt = build_trip_prompt(session.trip_context)
+                session.messages.clear()
+                save_session()
+                st.session_state.conversation_context = ConversationContext(CONTEXT_TOKEN_BUDGET)
+                count_execution("turns")
+                request_rerun("form_submit") # Full rerun: the summary and the chat fragment both change.
+
+@st.fragment
+def render_chat():
+    """Chat history, chat input and pending itinerary generation.
+
+    As a fragment, sending a message only re-executes this function, not the whole script.
+    """
+    count_execution("chat_fragment")
     # Show initial greeting message if no other messages exist
-    if not st.session_state.messages:
+    if not current_session().messages:
         loc = st.session_state.get("current_location", "Detecting...")
         user_timezone_str = st.session_state.get("timezone", "UTC")
         try:
@@ -305,7 +534,13 @@ def main_app():
         now_local = datetime.now(user_tz)
         current_time_str = now_local.strftime("%I:%M %p")
 
-        if loc in ["Detecting...", "Not Detected"]:
+        if st.session_state.get("location_pending"):
+            greeting_message = f"""
+    Namaste Traveler! Welcome to Trivanza. The current time is **{current_time_str}**.
+
+    I'm detecting your location so I can help with anything nearby. Meanwhile, I'm ready to help you plan a trip or answer any other travel questions you might have!
+    """
+        elif loc in ["Detecting...", "Not Detected"]:
             greeting_message = f"""
     Namaste Traveler! Welcome to Trivanza. The current time is **{current_time_str}**.
 
@@ -321,59 +556,114 @@ def main_app():
 
     How can I help you today? Are you looking to plan a new adventure or need some info for your current travels?
     """
-        st.session_state.messages.append({"role": "assistant", "content": greeting_message})
+        if st.session_state.get("location_pending"):
+            # Shown but not stored: the final greeting depends on the detected location.
+            with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
+                st.markdown(greeting_message)
+        else:
+            current_session().messages.append({"role": "assistant", "content": prepare_markdown(greeting_message)})
 
     # Display chat history
-    for msg in st.session_state.messages:
-        avatar = "https://raw.githubusercontent.com/armanmujtaba/Trivanza/main/trivanza_logo.png" if msg["role"] == "assistant" else None
-        with st.chat_message(msg["role"], avatar=avatar):
-            st.markdown(msg["content"])
+    with timed("render_history"):
+        for msg in current_session().messages:
+            avatar = ASSISTANT_AVATAR if msg["role"] == "assistant" else None
+            with st.chat_message(msg["role"], avatar=avatar):
+                st.markdown(prepare_markdown(msg["content"]))
 
     # Handle new user input from chat box
     if user_input := st.chat_input("How can I help with your travels today?"):
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        with st.spinner("Thinking..."):
-            try:
-                final_prompt = build_system_prompt()
-                messages_payload = [{"role": "system", "content": final_prompt}] + st.session_state.messages
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=messages_payload,
-                    temperature=0.7,
-                    max_tokens=2048
-                )
-                assistant_response = response.choices[0].message.content
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
-                assistant_response = "I'm having a little trouble connecting right now. Please try again in a moment."
-        st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-        st.rerun()
+        count_execution("turns")
+        has_itinerary = latest_itinerary_index(current_session().messages) is not None
+        intent, route = route_message(user_input, has_itinerary)
+        METRICS.inc("trivanza_intent_total", intent=intent)
+        current_session().messages.append({"role": "user", "content": user_input})
+        with st.chat_message("user"):
+            st.markdown(user_input)
+        patched = PATCH_EDITS and intent == ITINERARY_EDIT and apply_itinerary_edit(user_input, route)
+        if not patched:
+            # "Nearest X" requests are answered from the offline POI index; the model only phrases the result.
+            # Checked for every intent: "My scooter has a puncture" needs a mechanic whatever it was routed as.
+            tool_messages = nearby_tool_messages(user_input)
+            create_kwargs = {}
+            if tool_messages:
+                intent, route = NEARBY, route_for(NEARBY)
+                create_kwargs = {"tools": [NEARBY_TOOL], "tool_choice": "none"}
+            messages_payload = build_messages_payload(route["focus"]) + (tool_messages or [])
+            stream_assistant_response(
+                messages_payload,
+                max_tokens=route["max_tokens"],
+                model=route["model"],
+                temperature=route["temperature"],
+                usage_kind=f"chat_{intent}",
+                waiting_text="Thinking...",
+                error_prefix="An error occurred",
+                fallback_message="I'm having a little trouble connecting right now. Please try again in a moment.",
+                **create_kwargs
+            )
+        save_session()
 
     # Handle the response generation after form submission
     if st.session_state.pending_form_response:
-        prompt = st.session_state.pending_llm_prompt
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        prompt = current_session().pending_llm_prompt
+        current_session().messages.append({"role": "user", "content": prompt})
         st.session_state.pending_form_response = False
-        with st.spinner("🚀 Crafting your personalized itinerary..."):
-            try:
-                final_prompt = build_system_prompt()
-                messages_payload = [{"role": "system", "content": final_prompt}] + st.session_state.messages
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=messages_payload,
-                    temperature=0.7,
-                    max_tokens=3500
-                )
-                assistant_response = response.choices[0].message.content
-            except Exception as e:
-                st.error(f"An error occurred while generating the itinerary: {e}")
-                assistant_response = "I'm unable to create the itinerary at this moment. Please try again later."
-        st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-        st.rerun()
+        with st.chat_message("user"):
+            st.markdown(prompt)
+        trip_context = current_session().trip_context
+        use_cache = cache_enabled() and not st.session_state.get("bypass_itinerary_cache", False)
+        cached_response = get_itinerary_cache().get(trip_context) if use_cache else None
+        if cached_response is not None:
+            current_session().messages.append({"role": "assistant", "content": cached_response})
+            with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
+                st.markdown(cached_response)
+            logger.info("Itinerary cache hit: %s", get_itinerary_cache().stats())
+        else:
+            assistant_response = generate_itinerary_response(
+                trip_context,
+                prompt,
+                fallback_message="I'm unable to create the itinerary at this moment. Please try again later."
+            )
+            if assistant_response and cache_enabled():
+                get_itinerary_cache().put(trip_context, assistant_response)
+        save_session()
+
+
+def main_app():
+    """The main application logic, runs after initialization."""
+    # Custom CSS for UI enhancements
+    st.markdown("""
+    <style>
+        .logo-container { display: flex; justify-content: center; align-items: center; margin-bottom: 10px; }
+        .logo { width: 300px; }
+        .stChatInputContainer { position: fixed; bottom: 0; width: 100%; background: white; z-index: 1001; padding-bottom: 1rem; }
+        .appview-container .main .block-container { padding-bottom: 5rem; }
+    </style>
+    <div class="logo-container">
+        <img class="logo" src="https://raw.githubusercontent.com/armanmujtaba/Trivanza/main/Trivanza.png?raw=true" alt="Trivanza Logo">
+    </div>
+    """, unsafe_allow_html=True)
+
+    update_location()
+
+    # Let user override location if needed.
+    st.text_input(
+        "📍 Your Current Location (auto-detected)",
+        key="current_location",
+        help="We've tried to detect your location automatically. You can correct it here if needed."
+    )
+
+    render_trip_form()
+
+    # Display trip summary if a form was submitted
+    trip_context = current_session().trip_context
+    if st.session_state.form_submitted and trip_context:
+        st.info(format_trip_summary(trip_context))
+
+    render_chat()
 
 
 # --- Main App Execution ---
-if 'app_initialized' not in st.session_state:
-    initialize_app()
-else:
+initialize_app()
+count_execution("script")
+with timed("script_run"):
     main_app()
@@ -0,0 +1,185 @@
+"""Token-budgeted conversation context for Trivanza.
+
+Keeps each request to the model bounded: the latest itinerary and the most recent
+turns are sent verbatim, and everything older is folded into a rolling summary. Also
+holds the per-message caches shared by every session: token counts and the Markdown
+prepared for re-rendering history.
+"""
+import os
+import textwrap
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to a character heuristic
+    _ENCODING = None
+
+# Fixed overhead the API adds per chat message (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+ITINERARY_MARKER = "### Day "
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+# Cached counts are keyed by (hash, length) and hold no text, so the cache can cover the
+# history of every live session: a few MB at the default size.
+TOKEN_CACHE_SIZE = int(os.environ.get("TRIVANZA_TOKEN_CACHE_SIZE", "65536"))
+
+# Prepared Markdown is keyed the same way; messages that need no changes are cached as
+# None, so only text that differs is held.
+RENDER_CACHE_SIZE = int(os.environ.get("TRIVANZA_RENDER_CACHE_SIZE", "4096"))
+
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+_prepared = OrderedDict()
+_prepared_lock = threading.Lock()
+
+
+def _count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def count_tokens(text):
+    """Returns the token count for a string. Cached, so each message is only counted once."""
+    if not text:
+        return 0
+    key = (hash(text), len(text))
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = _count_tokens(text)
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def prepare_markdown(content):
+    """Dedents and trims a message for display. Cached, so reruns reuse the prepared text."""
+    key = (hash(content), len(content))
+    with _prepared_lock:
+        if key in _prepared:
+            _prepared.move_to_end(key)
+            prepared = _prepared[key]
+            return content if prepared is None else prepared
+    prepared = textwrap.dedent(content).strip()
+    with _prepared_lock:
+        _prepared[key] = None if prepared == content else prepared
+        if len(_prepared) > RENDER_CACHE_SIZE:
+            _prepared.popitem(last=False)
+    return prepared
+
+
+def message_tokens(message):
+    """Token cost of a single chat message, including per-message overhead."""
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _truncate_to_tokens(text, max_tokens):
+    """Keeps the tail of a text so it fits in roughly max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * 4
+    # Characters per token vary, so shrink until the tail actually fits.
+    while max_chars > 0 and count_tokens("…" + text[-max_chars:]) > max_tokens:
+        max_chars -= max(1, max_chars // 10)
+    return "…" + text[-max_chars:] if max_chars > 0 else ""
+
+
+def extractive_summary(previous_summary, messages, max_tokens=400):
+    """Offline summarizer: keeps the opening of each folded turn, newest last."""
+    lines = [previous_summary] if previous_summary else []
+    for msg in messages:
+        snippet = " ".join(msg["content"].split())[:200]
+        lines.append(f"- {msg['role']}: {snippet}")
+    return _truncate_to_tokens("\n".join(lines), max_tokens)
+
+
+def latest_itinerary_index(messages):
+    """Index of the most recent assistant message that contains an itinerary, or None."""
+    for i in range(len(messages) - 1, -1, -1):
+        msg = messages[i]
+        if msg["role"] == "assistant" and ITINERARY_MARKER in msg["content"]:
+            return i
+    return None
+
+
+class ConversationContext:
+    """Builds bounded message payloads for one chat session.
+
+    `budget_tokens` caps everything sent per call except the system prompt. Within it,
+    up to `summary_tokens` go to the rolling summary and the rest to the latest itinerary
+    and the most recent `max_recent_messages` turns. The summary is updated incrementally:
+    each call only folds the turns that have just fallen out of the verbatim window.
+    """
+
+    def __init__(self, budget_tokens=6000, summary_tokens=400, max_recent_messages=8):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.max_recent_messages = max_recent_messages
+        self.summary = ""
+        self.summarized_count = 0
+
+    def reset(self):
+        self.summary = ""
+        self.summarized_count = 0
+
+    def _window_start(self, messages, itinerary_idx):
+        """First index of the verbatim tail that fits in the budget."""
+        # Reserve the whole summary message, header and overhead included.
+        available = self.budget_tokens - self.summary_tokens - count_tokens(SUMMARY_HEADER) - MESSAGE_OVERHEAD_TOKENS
+        if itinerary_idx is not None:
+            available -= message_tokens(messages[itinerary_idx])
+        start = len(messages)
+        kept = 0
+        while start > 0 and kept < self.max_recent_messages:
+            i = start - 1
+            if i == itinerary_idx:
+                start -= 1
+                continue
+            cost = message_tokens(messages[i])
+            # The newest message is always kept, even if it alone exceeds the budget.
+            if kept and cost > available:
+                break
+            available -= cost
+            kept += 1
+            start -= 1
+        return start
+
+    def build_payload(self, system_prompt, messages, summarize=extractive_summary):
+        """Returns the list of messages to send: system prompt, summary, itinerary and recent turns.
+
+        `summarize(previous_summary, messages)` is only called when turns fall out of the window.
+        """
+        if len(messages) < self.summarized_count:
+            # The chat history was cleared (e.g. a new trip form), start over.
+            self.reset()
+
+        itinerary_idx = latest_itinerary_index(messages)
+        start = self._window_start(messages, itinerary_idx)
+
+        if start > self.summarized_count:
+            to_fold = [
+                messages[i] for i in range(self.summarized_count, start)
+                if i != itinerary_idx
+            ]
+            if to_fold:
+                self.summary = _truncate_to_tokens(
+                    summarize(self.summary, to_fold), self.summary_tokens
+                )
+            self.summarized_count = start
+
+        payload = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            payload.append({
+                "role": "system",
+                "content": SUMMARY_HEADER + self.summary
+            })
+        if itinerary_idx is not None and itinerary_idx < start:
+            payload.append(messages[itinerary_idx])
+        payload.extend(messages[start:])
+        return payload
@@ -0,0 +1,234 @@
+"""Local cost computation for structured itineraries.
+
+In structured mode the model lists each itinerary item as compact JSON with a category,
+an amount and the currency it is priced in. Everything numeric happens here instead:
+all items are converted in one vectorized pass against the currency rate table, and the
+daily totals, cost breakdown, grand total and budget analysis are computed and rendered
+as Markdown, so the sums are always exact.
+"""
+import json
+import math
+import re
+
+import pandas as pd
+
+CATEGORIES = ["Flights", "Accommodation", "Meals", "Transportation", "Activities", "Travel Extras"]
+CATEGORY_NAMES = {category.lower(): category for category in CATEGORIES}
+CURRENCY_SYMBOLS = {"INR": "₹", "USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥"}
+SYMBOL_CODES = {symbol: code for code, symbol in CURRENCY_SYMBOLS.items()}
+ITEM_COLUMNS = ["day", "time", "category", "title", "details", "link", "amount", "currency"]
+MONEY_RE = re.compile(r"(?:(?P<code>[A-Z]{3}) |(?P<symbol>[₹$€£¥]))(?P<amount>-?[\d,]+(?:\.\d+)?)")
+# Written instead of a converted amount when the table has no rate for an item's currency.
+UNCONVERTED_NOTE = "(no exchange rate, not in totals)"
+# "Cost: €20 (≈ ₹1,995) · Activities", as written by render_day().
+COST_LINE_RE = re.compile(r"^Cost: (?P<cost>.+?)(?: \(≈ (?P<target>.+?)\))? · (?P<category>[A-Za-z ]+)$", re.MULTILINE)
+
+# One itinerary item as the model returns it.
+ITEM_SHAPE = """{"time": "HH:MM", "category": "<one of: Flights, Accommodation, Meals, Transportation, Activities, Travel Extras>",
+"title": "<realistic named option>", "details": "<one short sentence>", "link": "<booking/info URL or empty>",
+"amount": <number, total for all travelers>, "currency": "<ISO code the price is quoted in>"}"""
+ITEM_RULES = """List every flight, hotel, meal, activity and transfer for the day as its own item, in time order.
+Quote each price in the local currency where it is paid. Do NOT add totals or convert currencies."""
+DAY_ITEMS_INSTRUCTIONS = f"""
+Reply with JSON only, in this exact shape and with no other text:
+{{"items": [{ITEM_SHAPE}]}}
+{ITEM_RULES}
+"""
+
+# Currency rate table for INR conversion, shared by the app and the cache pre-warm.
+CURRENCY_RATES = pd.DataFrame([
+    {"Currency": "US Dollar", "Code": "USD", "INR_Value": 86.28},
+    {"Currency": "Euro", "Code": "EUR", "INR_Value": 99.75},
+    {"Currency": "British Pound", "Code": "GBP", "INR_Value": 116.94},
+    {"Currency": "Japanese Yen", "Code": "JPY", "INR_Value": 0.60},
+    {"Currency": "Australian Dollar", "Code": "AUD", "INR_Value": 56.35},
+    {"Currency": "Canadian Dollar", "Code": "CAD", "INR_Value": 63.55},
+    {"Currency": "Swiss Franc", "Code": "CHF", "INR_Value": 106.01},
+    {"Currency": "Chinese Yuan", "Code": "CNY", "INR_Value": 12.02},
+    {"Currency": "UAE Dirham", "Code": "AED", "INR_Value": 23.51},
+    {"Currency": "Singapore Dollar", "Code": "SGD", "INR_Value": 67.36},
+    {"Currency": "New Zealand Dollar", "Code": "NZD", "INR_Value": 52.38},
+    {"Currency": "Russian Ruble", "Code": "RUB", "INR_Value": 1.10},
+    {"Currency": "South African Rand", "Code": "ZAR", "INR_Value": 4.83},
+    {"Currency": "Brazilian Real", "Code": "BRL", "INR_Value": 15.77},
+    {"Currency": "Saudi Riyal", "Code": "SAR", "INR_Value": 22.99},
+    {"Currency": "Qatari Riyal", "Code": "QAR", "INR_Value": 23.66},
+    {"Currency": "Kuwaiti Dinar", "Code": "KWD", "INR_Value": 281.80},
+    {"Currency": "Bahraini Dinar", "Code": "BHD", "INR_Value": 228.77},
+    {"Currency": "Omani Rial", "Code": "OMR", "INR_Value": 224.42},
+])
+
+DISCLAIMER = "⚠️ *Disclaimer: All estimated costs are for guidance only and may vary with season, availability and exchange rates. Please confirm prices with the providers before booking.*"
+
+
+def currency_code(currency_type):
+    """Extracts the ISO code from a form value such as '₹ INR'."""
+    return str(currency_type).split()[-1].upper() if currency_type else "INR"
+
+
+def format_money(amount, code):
+    symbol = CURRENCY_SYMBOLS.get(code)
+    return f"{symbol}{amount:,.0f}" if symbol else f"{code} {amount:,.0f}"
+
+
+def parse_money(text):
+    """Parses the first amount written like format_money() output into (amount, code), or None."""
+    match = MONEY_RE.search(text)
+    if match is None:
+        return None
+    code = match.group("code") or SYMBOL_CODES[match.group("symbol")]
+    return float(match.group("amount").replace(",", "")), code
+
+
+class CostTable:
+    """Indexed currency conversion table built from a DataFrame with Code and INR_Value columns."""
+
+    def __init__(self, rates):
+        inr_per_unit = rates.set_index("Code")["INR_Value"].astype(float)
+        if "INR" not in inr_per_unit.index:
+            inr_per_unit = pd.concat([inr_per_unit, pd.Series({"INR": 1.0})])
+        self.inr_per_unit = inr_per_unit
+
+    def knows(self, code):
+        return code in self.inr_per_unit.index
+
+    def rate(self, source_code, target_code):
+        """Units of target_code per one unit of source_code, or NaN if either is not in the table."""
+        if source_code == target_code:
+            return 1.0
+        return self.inr_per_unit.get(source_code, math.nan) / self.inr_per_unit.get(target_code, math.nan)
+
+    def convert(self, items, target_code):
+        """Adds an `amount_target` column with every item converted to target_code.
+
+        Items without a currency are taken to be in the target currency. Items priced in
+        a currency missing from the table are never guessed at: their `amount_target` is
+        NaN, so they are left out of every total and rendered with UNCONVERTED_NOTE. The
+        same goes for every other currency when target_code itself is missing.
+        """
+        items = items.copy()
+        target_rate = self.inr_per_unit.get(target_code, math.nan)
+        currency = items["currency"].where(items["currency"] != "", target_code)
+        source_rate = currency.map(self.inr_per_unit)
+        converted = items["amount"] * source_rate / target_rate
+        items["amount_target"] = converted.where(currency != target_code, items["amount"].astype(float))
+        return items
+
+
+def parse_day_items(text, day):
+    """Parses one day's JSON reply into an items DataFrame."""
+    data = json.loads(text)
+    rows = data.get("items", []) if isinstance(data, dict) else []
+    items = pd.DataFrame([r for r in rows if isinstance(r, dict)], columns=ITEM_COLUMNS[1:])
+    items.insert(0, "day", day)
+    items["amount"] = pd.to_numeric(items["amount"], errors="coerce").fillna(0.0)
+    items["currency"] = items["currency"].fillna("").astype(str).str.upper().str.strip()
+    category = items["category"].fillna("").astype(str).str.strip().str.lower()
+    items["category"] = category.map(CATEGORY_NAMES).fillna("Travel Extras")
+    return items.fillna("")
+
+
+def unconverted_note(items):
+    """A note naming the currencies left out of the totals, or "" if every item was converted."""
+    codes = sorted(set(items.loc[items["amount_target"].isna(), "currency"]))
+    if not codes:
+        return ""
+    return f"_Not included: items priced in {', '.join(codes)}, for which no exchange rate is available._"
+
+
+def unpriced_note(days):
+    """A note naming the days left out of the totals because they could not be planned, or ""."""
+    if not days:
+        return ""
+    names = ", ".join(f"Day {day}" for day in sorted(days))
+    return f"_Not included: {names}, which could not be planned, so the totals are incomplete._"
+
+
+def render_day(heading, items, target_code):
+    """Renders one day from converted items, ending with its exact daily total."""
+    paragraphs = [heading]
+    for item in items.itertuples(index=False):
+        line = f"**{item.time} – {item.title}**" if item.time else f"**{item.title}**"
+        if item.details:
+            line += f" — {item.details}"
+        if item.link:
+            line += f" [Book]({item.link})"
+        if pd.isna(item.amount_target):
+            cost = f"{format_money(item.amount, item.currency)} {UNCONVERTED_NOTE}"
+        else:
+            cost = format_money(item.amount_target, target_code)
+            if item.currency and item.currency != target_code:
+                cost = f"{format_money(item.amount, item.currency)} (≈ {cost})"
+        paragraphs.append(f"{line}\n\nCost: {cost} · {item.category}")
+    total = f"🎯 Daily Total: {format_money(items['amount_target'].sum(), target_code)}"
+    note = unconverted_note(items)
+    paragraphs.append(f"{total}\n\n{note}" if note else total)
+    return "\n\n".join(paragraphs)
+
+
+def parse_rendered_items(text, day):
+    """Recovers the priced items of a day written by render_day() (amounts as displayed).
+
+    Returns a DataFrame with day, category, amount, currency and amount_target columns.
+    """
+    rows = []
+    for match in COST_LINE_RE.finditer(text):
+        cost = parse_money(match.group("cost"))
+        target = parse_money(match.group("target")) if match.group("target") else cost
+        if cost is None or target is None:
+            continue
+        unconverted = match.group("cost").endswith(UNCONVERTED_NOTE)
+        rows.append({
+            "day": day, "category": match.group("category"),
+            "amount": cost[0], "currency": cost[1], "amount_target": float("nan") if unconverted else target[0],
+        })
+    return pd.DataFrame(rows, columns=["day", "category", "amount", "currency", "amount_target"])
+
+
+def render_cost_breakdown(items, cost_table, target_code, unpriced_days=()):
+    """Renders the cost breakdown by category and the grand total for all items.
+
+    `unpriced_days` are days whose costs are unknown; the totals say they leave them out.
+    """
+    by_category = items.groupby("category")["amount_target"].sum().reindex(CATEGORIES, fill_value=0.0)
+    lines = [f"- {cat}: {format_money(amount, target_code)}" for cat, amount in by_category.items()]
+    foreign = sorted(c for c in set(items["currency"]) - {target_code, ""} if cost_table.knows(c))
+    if foreign:
+        lines.append("\n_Exchange rates used: " + ", ".join(
+            f"1 {code} = {cost_table.rate(code, target_code):,.4g} {target_code}" for code in foreign
+        ) + "_")
+    for note in (unconverted_note(items), unpriced_note(unpriced_days)):
+        if note:
+            lines.append("\n" + note)
+    grand_total = f"💰 Grand Total: {format_money(by_category.sum(), target_code)}"
+    if unpriced_days:
+        grand_total += f" (excluding {', '.join(f'Day {day}' for day in sorted(unpriced_days))})"
+    return "🧾 Cost Breakdown:\n\n" + "\n".join(lines) + "\n\n" + grand_total
+
+
+def render_budget_analysis(items, target_code, budget_amount, unpriced_days=()):
+    """Compares the grand total with the traveler's budget and says exactly what is left or over."""
+    by_category = items.groupby("category")["amount_target"].sum()
+    grand_total = float(by_category.sum())
+    budget = float(budget_amount or 0)
+    difference = budget - grand_total
+    if budget <= 0:
+        analysis = f"The estimated trip cost is {format_money(grand_total, target_code)}."
+    elif difference >= 0:
+        analysis = (
+            f"Your budget is {format_money(budget, target_code)} and the estimated cost is "
+            f"{format_money(grand_total, target_code)}, leaving **{format_money(difference, target_code)}** "
+            f"({difference / budget:.0%} of your budget) for shopping, upgrades or emergencies."
+        )
+    else:
+        biggest = by_category.idxmax()
+        analysis = (
+            f"Your budget is {format_money(budget, target_code)} but the estimated cost is "
+            f"{format_money(grand_total, target_code)}, which is **{format_money(-difference, target_code)} over** "
+            f"({-difference / budget:.0%}). {biggest} is the largest expense "
+            f"({format_money(by_category[biggest], target_code)}), so that is the best place to save."
+        )
+    for note in (unconverted_note(items), unpriced_note(unpriced_days)):
+        if note:
+            analysis += " " + note.strip("_").replace("Not included:", "This leaves out")
+    return f"💼 Budget Analysis: {analysis}"
@@ -0,0 +1,378 @@
+"""Patch-based itinerary edits for Trivanza.
+
+A follow-up such as "swap Day 3's hotel for something cheaper" used to regenerate the
+whole itinerary. Instead, the latest itinerary is split into sections: the greeting,
+one section per `### Day N:` heading, the final 🧾/💰/🎒/💼/📌/⚠️ blocks and the closing
+question. Only the sections the request touches are sent to the model, the rewritten
+sections are spliced back in place, and the totals are recomputed locally:
+
+- structured itineraries (cost lines written by trivanza_costs.render_day) get their
+  cost breakdown, grand total and budget analysis re-rendered from every item,
+- prose itineraries get their grand total re-summed from the daily totals, and their
+  cost breakdown and budget analysis rewritten by the model in the same reply (or, if it
+  leaves them out, rendered locally per day from the daily totals).
+
+Days whose daily total can't be read (e.g. a day the engine could not plan) are left out
+of the recomputed totals, which say so.
+
+Requests that don't name specific days (e.g. "make the whole trip cheaper") return None
+from ItineraryEditor.edit(), and the caller falls back to a normal chat reply.
+"""
+import json
+import logging
+import re
+import time
+
+import pandas as pd
+
+from trivanza_costs import (
+    DISCLAIMER, ITEM_RULES, ITEM_SHAPE, currency_code, format_money, parse_day_items, parse_money,
+    parse_rendered_items, render_budget_analysis, render_cost_breakdown, render_day, unpriced_note,
+)
+from trivanza_itinerary import CLOSING_LINE, DAY_MAX_TOKENS, DEFAULT_MODEL
+
+logger = logging.getLogger("trivanza.edits")
+
+DAY_HEADING_RE = re.compile(r"^###\s*Day\s+(\d+)\b")
+# Headings written by the itinerary engine: "### Day 3: Forts – Goa (2026-11-03)".
+ENGINE_HEADING_RE = re.compile(r"^### Day (\d+): (.+) – (.+) \((\d{4}-\d{2}-\d{2})\)$")
+# The final sections' headings; item lines inside a day may start with the same emoji.
+FINAL_HEADINGS = {
+    "🧾 Cost Breakdown": "cost_breakdown", "💰 Grand Total": "grand_total", "🎒 Packing Checklist": "packing",
+    "💼 Budget Analysis": "budget", "📌 Destination Pro Tip": "tip", "⚠️ *Disclaimer": "disclaimer",
+}
+DAILY_TOTAL_PREFIX = "🎯"
+
+ORDINAL_DAYS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7}
+DAY_REF_RE = re.compile(r"\bday\s*(\d+)\b|\b(first|second|third|fourth|fifth|sixth|seventh|last|final) day\b")
+WHOLE_TRIP_RE = re.compile(r"\b(all|every|each) days?\b|\bwhole\b|\bentire\b|\ball over\b|\bevery morning\b")
+FINAL_REQUEST_PATTERNS = {
+    "packing": re.compile(r"\bpack(ing)?\b|\bchecklist\b"),
+    "tip": re.compile(r"\bpro tip\b|\btip\b"),
+}
+EDIT_MAX_TOKENS_EXTRA = 300
+
+STRUCTURED_EDIT_INSTRUCTIONS = """
+The traveler asked to change their itinerary: "{request}"
+Only the sections below are changing; everything else in the itinerary stays as it is.
+
+{sections}
+
+Reply with JSON only, with an entry for every section above and nothing else:
+{{"days": [{{"day": <day number>, "theme": "<short activity theme>", "items": [<item>, ...]}}, ...]{extras_shape}}}
+Each <item> has this shape:
+{item_shape}
+{item_rules}
+Keep items the traveler did not ask to change exactly as they are.
+"""
+
+PROSE_EDIT_INSTRUCTIONS = """
+The traveler asked to change their itinerary: "{request}"
+Only the sections below are changing; everything else in the itinerary stays as it is.
+
+{sections}
+
+Rewrite ONLY these sections, following every itinerary formatting and cost rule from your
+instructions. Start each day with its exact `### Day N:` heading and end it with its
+`🎯 Daily Total` line; start any other section with the same emoji heading. Keep the parts
+the traveler did not ask to change as they are. Do NOT write a greeting, other days, any
+section not shown above, the grand total or a closing question.
+"""
+
+# Appended when days change, since the cost breakdown and budget analysis are sent too.
+PROSE_TOTALS_INSTRUCTIONS = """
+Update the 🧾 Cost Breakdown and 💼 Budget Analysis so every figure matches the new plan.
+The days you are not rewriting keep these daily totals:
+{totals}
+"""
+
+
+class ParsedItinerary:
+    """An itinerary split into its sections; render() joins them back in order."""
+
+    def __init__(self, preamble, days, finals, closing):
+        self.preamble = preamble
+        self.days = days  # {day number: section text}, in itinerary order
+        self.finals = finals  # {marker key: block text}, in itinerary order
+        self.closing = closing
+
+    def render(self):
+        parts = [self.preamble] + list(self.days.values()) + list(self.finals.values()) + [self.closing]
+        return "\n\n".join(p.strip() for p in parts if p and p.strip())
+
+
+def _final_key(line):
+    line = line.lstrip("*# ")
+    return next((key for heading, key in FINAL_HEADINGS.items() if line.startswith(heading)), None)
+
+
+def parse_itinerary(text):
+    """Splits itinerary Markdown by its day headings and the final sections after the last day."""
+    lines = text.split("\n")
+    last_heading = max((i for i, line in enumerate(lines) if DAY_HEADING_RE.match(line.strip())), default=-1)
+    preamble, days, finals, closing = [], {}, {}, []
+    current = preamble
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        heading = DAY_HEADING_RE.match(stripped)
+        marker = _final_key(stripped) if i > last_heading else None
+        if heading:
+            current = days.setdefault(int(heading.group(1)), [])
+        elif marker and marker not in finals:
+            current = finals.setdefault(marker, [])
+        elif stripped == CLOSING_LINE:
+            current = closing
+        current.append(line)
+    join = lambda lines: "\n".join(lines).strip()  # noqa: E731
+    return ParsedItinerary(
+        join(preamble),
+        {day: join(lines) for day, lines in days.items()},
+        {key: join(lines) for key, lines in finals.items()},
+        join(closing),
+    )
+
+
+def select_targets(request, parsed):
+    """Returns (day numbers, final keys) an edit request touches, or None if it can't be patched."""
+    text = request.lower()
+    if WHOLE_TRIP_RE.search(text) or not parsed.days:
+        return None
+    last_day = max(parsed.days)
+    days = set()
+    for number, ordinal in DAY_REF_RE.findall(text):
+        if number:
+            days.add(int(number))
+        elif ordinal in ("last", "final"):
+            days.add(last_day)
+        else:
+            days.add(ORDINAL_DAYS[ordinal])
+    # A city only picks the days when no day is named ("move the Panaji fort to day 4").
+    for day, section in parsed.days.items() if not days else ():
+        heading = ENGINE_HEADING_RE.match(section.split("\n", 1)[0])
+        if heading and re.search(rf"\b{re.escape(heading.group(3).lower())}\b", text):
+            days.add(day)
+    days &= set(parsed.days)
+    finals = [key for key, pattern in FINAL_REQUEST_PATTERNS.items() if pattern.search(text) and key in parsed.finals]
+    if not days and not finals:
+        return None
+    return sorted(days), finals
+
+
+def is_structured(parsed):
+    """True if the day sections carry per-item cost lines from render_day()."""
+    return any(not parse_rendered_items(section, day).empty for day, section in parsed.days.items())
+
+
+def _target_code(parsed, ctx):
+    if ctx and ctx.get("currency_type"):
+        return currency_code(ctx["currency_type"])
+    for key in ("grand_total", "cost_breakdown"):
+        money = parse_money(parsed.finals.get(key, ""))
+        if money:
+            return money[1]
+    return "INR"
+
+
+def _retheme(section, day, theme):
+    """Replaces the theme in an engine-style day heading, keeping city and date."""
+    lines = section.split("\n", 1)
+    heading = ENGINE_HEADING_RE.match(lines[0])
+    if not theme or heading is None or int(heading.group(1)) != day:
+        return lines[0]
+    return f"### Day {day}: {theme} – {heading.group(3)} ({heading.group(4)})"
+
+
+def daily_total(section):
+    """(amount, code) from a day's last `🎯 Daily Total` line, or None if it has none or can't be read."""
+    lines = [line for line in section.split("\n") if line.strip().startswith(DAILY_TOTAL_PREFIX)]
+    return parse_money(lines[-1]) if lines else None
+
+
+def recompute_prose_totals(parsed, stale=(), budget_amount=None):
+    """Re-sums the grand total from every day's `🎯 Daily Total` line.
+
+    Final sections named in `stale` (cost_breakdown, budget) still hold figures from before
+    the edit and are re-rendered per day from the daily totals. Days without a readable
+    total are left out and named; nothing changes if the days use different currencies.
+    """
+    totals = {day: daily_total(section) for day, section in parsed.days.items()}
+    unpriced = [day for day, money in totals.items() if money is None]
+    totals = {day: money for day, money in totals.items() if money is not None}
+    codes = {code for _, code in totals.values()}
+    if len(codes) != 1:
+        return
+    code = codes.pop()
+    by_day = pd.DataFrame(
+        [{"category": f"Day {day}", "currency": code, "amount_target": amount} for day, (amount, _) in totals.items()],
+        columns=["category", "currency", "amount_target"]
+    )
+    if "grand_total" in parsed.finals:
+        grand_total = f"💰 Grand Total: {format_money(by_day['amount_target'].sum(), code)}"
+        if unpriced:
+            grand_total += f" (excluding {', '.join(f'Day {day}' for day in unpriced)})"
+        parsed.finals["grand_total"] = grand_total
+    if "cost_breakdown" in stale:
+        lines = [f"- {row.category}: {format_money(row.amount_target, code)}" for row in by_day.itertuples()]
+        note = unpriced_note(unpriced)
+        parsed.finals["cost_breakdown"] = "🧾 Cost Breakdown:\n\n" + "\n".join(lines + (["\n" + note] if note else []))
+    if "budget" in stale:
+        parsed.finals["budget"] = render_budget_analysis(by_day, code, budget_amount, unpriced)
+
+
+class ItineraryEditor:
+    """Applies an edit request to an itinerary by regenerating only the affected sections.
+
+    `client` has the `client.chat.completions.create(**kwargs)` interface (e.g. the
+    LLMGateway). With a `cost_table`, itineraries rendered by the structured engine are
+    edited as JSON items and all totals are recomputed locally.
+    """
+
+    def __init__(self, client, model=DEFAULT_MODEL, temperature=0.7, cost_table=None):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.cost_table = cost_table
+
+    def edit(self, system_prompt, itinerary, request, ctx=None, on_usage=None, **create_kwargs):
+        """Returns (new itinerary, (days, finals)) or None if the request needs a full reply.
+
+        (days, finals) are the sections the reply actually replaced; if it replaced none
+        (unparsable JSON, wrong day numbers, missing headings), None is returned too.
+        """
+        parsed = parse_itinerary(itinerary)
+        targets = select_targets(request, parsed)
+        if targets is None:
+            return None
+        days, finals = targets
+        structured = self.cost_table is not None and is_structured(parsed)
+        # Prose totals can't be recomputed by category locally, so the model rewrites them too.
+        regenerated = [] if structured or not days else [
+            key for key in ("cost_breakdown", "budget") if key in parsed.finals and key not in finals
+        ]
+        sections = "\n\n".join([parsed.days[d] for d in days] + [parsed.finals[k] for k in finals + regenerated])
+        if structured:
+            extras_shape = "".join(
+                {"packing": ', "packing_checklist": ["<item>", ...]', "tip": ', "pro_tip": "<one tip>"'}[k] for k in finals
+            )
+            instructions = STRUCTURED_EDIT_INSTRUCTIONS.format(
+                request=request, sections=sections, extras_shape=extras_shape,
+                item_shape=ITEM_SHAPE, item_rules=ITEM_RULES
+            )
+            create_kwargs.setdefault("response_format", {"type": "json_object"})
+        else:
+            instructions = PROSE_EDIT_INSTRUCTIONS.format(request=request, sections=sections)
+            if regenerated:
+                kept = "\n".join(
+                    f"- Day {day}: {format_money(*money) if money else 'not available'}"
+                    for day, money in ((day, daily_total(section)) for day, section in parsed.days.items())
+                    if day not in days
+                )
+                instructions += PROSE_TOTALS_INSTRUCTIONS.format(totals=kept or "- (none)")
+        started = time.perf_counter()
+        response = error = None
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": instructions},
+                ],
+                temperature=self.temperature,
+                max_tokens=DAY_MAX_TOKENS * max(len(days), 1) + EDIT_MAX_TOKENS_EXTRA,
+                **create_kwargs
+            )
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if on_usage is not None:
+                last_queue_seconds = getattr(self.client, "last_queue_seconds", None)
+                on_usage(
+                    response.usage if response is not None else None, "itinerary_edit", error=error,
+                    total_seconds=time.perf_counter() - started,
+                    queue_seconds=last_queue_seconds() if last_queue_seconds and not error else None
+                )
+        text = response.choices[0].message.content or ""
+        if structured:
+            applied = self._apply_structured(parsed, text, days, finals, ctx)
+        else:
+            applied = self._apply_prose(parsed, text, days, finals, regenerated, ctx)
+        if not any(applied):
+            logger.warning("Itinerary edit replaced none of %s: %r", targets, text[:200])
+            return None
+        return parsed.render(), applied
+
+    @staticmethod
+    def _apply_prose(parsed, text, days, finals, regenerated=(), ctx=None):
+        """Splices the reply's sections in; returns the (days, finals) replaced.
+
+        `regenerated` final sections are only taken from the reply if a day changed; any it
+        left out are re-rendered locally so no figures from before the edit remain.
+        """
+        patch = parse_itinerary(text)
+        applied_days = [day for day in days if day in patch.days]
+        applied_finals = [key for key in finals if key in patch.finals]
+        for day in applied_days:
+            parsed.days[day] = patch.days[day]
+        for key in applied_finals:
+            parsed.finals[key] = patch.finals[key]
+        if applied_days:
+            rewritten = [key for key in regenerated if key in patch.finals]
+            for key in rewritten:
+                parsed.finals[key] = patch.finals[key]
+            applied_finals += rewritten
+            stale = [key for key in regenerated if key not in rewritten]
+            recompute_prose_totals(parsed, stale, (ctx or {}).get("budget_amount"))
+        return applied_days, applied_finals
+
+    def _apply_structured(self, parsed, text, days, finals, ctx):
+        """Renders the reply's items and extras in; returns the (days, finals) replaced."""
+        try:
+            patch = json.loads(text)
+        except ValueError:
+            patch = None
+        if not isinstance(patch, dict):
+            logger.warning("Could not parse the itinerary edit: %r", text[:200])
+            return [], []
+        target_code = _target_code(parsed, ctx)
+        edited = {}
+        entries = patch.get("days")
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                day = int(entry.get("day"))
+            except (TypeError, ValueError):
+                continue
+            if day not in days:
+                continue
+            try:
+                items = parse_day_items(json.dumps({"items": entry.get("items") or []}), day)
+            except (ValueError, AttributeError) as e:
+                logger.warning("Could not parse edited items for day %d: %s", day, e)
+                continue
+            converted = self.cost_table.convert(items, target_code)
+            parsed.days[day] = render_day(_retheme(parsed.days[day], day, entry.get("theme")), converted, target_code)
+            edited[day] = converted
+        applied_finals = []
+        if "packing" in finals and isinstance(patch.get("packing_checklist"), list) and patch["packing_checklist"]:
+            parsed.finals["packing"] = "🎒 Packing Checklist:\n\n" + "\n".join(f"- {i}" for i in patch["packing_checklist"])
+            applied_finals.append("packing")
+        if "tip" in finals and patch.get("pro_tip"):
+            parsed.finals["tip"] = f"📌 Destination Pro Tip: {patch['pro_tip']}"
+            applied_finals.append("tip")
+        if not edited:
+            return [], applied_finals
+
+        all_items = pd.concat(
+            [edited.get(day, parse_rendered_items(section, day)) for day, section in parsed.days.items()],
+            ignore_index=True
+        )
+        unpriced = [day for day, section in parsed.days.items() if day not in edited and daily_total(section) is None]
+        # render_cost_breakdown() writes both the 🧾 and the 💰 block.
+        parsed.finals["cost_breakdown"] = render_cost_breakdown(all_items, self.cost_table, target_code, unpriced)
+        parsed.finals.pop("grand_total", None)
+        if ctx and "budget" in parsed.finals:
+            parsed.finals["budget"] = render_budget_analysis(all_items, target_code, ctx.get("budget_amount"), unpriced)
+        parsed.finals.setdefault("disclaimer", DISCLAIMER)
+        return sorted(edited), applied_finals
@@ -0,0 +1,369 @@
+"""Shared LLM gateway for Trivanza.
+
+Every chat completion in the process goes through one LLMGateway, which provides:
+
+- admission control with token buckets on both requests/min and tokens/min, adapted
+  from the `x-ratelimit-*` headers OpenAI returns with each response. The limits are
+  learned from the first response's headers, so they match the account tier;
+  TRIVANZA_RPM / TRIVANZA_TPM only set a starting limit (e.g. to be conservative).
+  Each request is admitted on an estimate, corrected with the reported usage once the
+  response (or a stream's final usage chunk) arrives,
+- priorities, so interactive chat is admitted before itinerary generation,
+- retries with jittered exponential backoff on 429s, 5xx and connection errors,
+  always within a per-request deadline,
+- coalescing of identical in-flight (non-streaming) requests into one upstream call.
+
+Streamlit runs each session in its own thread, so the gateway is thread-safe and
+blocking; `AsyncGatewayClient` adapts it for asyncio code such as the itinerary engine.
+"""
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+
+import openai
+
+from trivanza_context import count_tokens
+
+logger = logging.getLogger("trivanza.gateway")
+
+PRIORITY_CHAT = 0
+PRIORITY_ITINERARY = 1
+DEFAULT_DEADLINES = {PRIORITY_CHAT: 60.0, PRIORITY_ITINERARY: 180.0}
+RETRYABLE_ERRORS = (
+    openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError,
+)
+DURATION_RE = re.compile(r"([\d.]+)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request could not be admitted or completed before its deadline."""
+
+
+def parse_duration(value):
+    """Parses OpenAI reset durations such as '1s', '6m0s' or '20ms' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    matches = DURATION_RE.findall(value)
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in matches) if matches else None
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header: delay-seconds or an HTTP date (RFC 9110)."""
+    seconds = parse_duration(value)
+    if seconds is not None or not value:
+        return seconds
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `per_minute / 60` per second.
+
+    With per_minute=None the limit is unknown and nothing is throttled until observe()
+    learns it from rate-limit headers (429s still pause admission, see LLMGateway).
+    """
+
+    def __init__(self, per_minute=None):
+        self.capacity = float(per_minute) if per_minute else None
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (0 if it can be taken now)."""
+        self._refill(now)
+        if self.capacity is None:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) * 60.0 / self.capacity)
+
+    def take(self, amount, now):
+        self._refill(now)
+        if self.capacity is not None:
+            self.level -= min(amount, self.capacity)
+
+    def observe(self, limit, remaining, now):
+        """Aligns the bucket with the server's view from rate-limit headers."""
+        self._refill(now)
+        if limit:
+            if self.capacity is None:
+                self.level = float(limit)
+            self.capacity = float(limit)
+        if remaining is not None and self.capacity is not None:
+            self.level = min(self.level, float(remaining))
+
+
+def estimate_request_tokens(kwargs):
+    """Prompt tokens plus the completion allowance a request can consume."""
+    prompt = sum(count_tokens(m.get("content") or "") + 4 for m in kwargs.get("messages", []))
+    return prompt + int(kwargs.get("max_tokens") or 1024)
+
+
+def configured_limit(name):
+    """A per-minute limit from the environment, or None to learn it from the API's headers."""
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def request_key(kwargs):
+    encoded = json.dumps(kwargs, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    """Rate-limit-aware front door for `client.chat.completions.create`."""
+
+    def __init__(self, client=None, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=5, base_delay=0.5, max_delay=20.0):
+        self.client = client if client is not None else openai.OpenAI(max_retries=0)
+        self.requests = TokenBucket(requests_per_minute or configured_limit("TRIVANZA_RPM"))
+        self.tokens = TokenBucket(tokens_per_minute or configured_limit("TRIVANZA_TPM"))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._blocked_until = 0.0
+        self._in_flight = {}
+        self._local = threading.local()
+        self.stats = {"requests": 0, "upstream_calls": 0, "coalesced": 0, "retries": 0, "rate_limited": 0}
+
+    # --- Admission ---
+
+    def _admit(self, priority, tokens, deadline):
+        """Blocks until this request is first in line and both buckets have room."""
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._waiting[0] == ticket:
+                        wait = max(
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now),
+                            self._blocked_until - now,
+                        )
+                        if wait <= 0:
+                            self.requests.take(1, now)
+                            self.tokens.take(tokens, now)
+                            return time.monotonic()
+                    remaining = deadline - now
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        raise DeadlineExceeded("Timed out waiting for rate-limit admission")
+                    self._cond.wait(timeout=remaining if wait is None else wait)
+            finally:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _observe_headers(self, headers):
+        now = time.monotonic()
+
+        def _num(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        with self._cond:
+            self.requests.observe(_num("x-ratelimit-limit-requests"), _num("x-ratelimit-remaining-requests"), now)
+            self.tokens.observe(_num("x-ratelimit-limit-tokens"), _num("x-ratelimit-remaining-tokens"), now)
+
+    def _backoff(self, attempt, error):
+        """Jittered exponential delay, never shorter than the server's retry hint."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        hint = None
+        retry_after_ms = parse_duration(headers.get("retry-after-ms"))
+        retry_after = parse_retry_after(headers.get("retry-after"))
+        if retry_after_ms is not None:
+            hint = retry_after_ms / 1000.0
+        elif retry_after is not None:
+            hint = retry_after
+        elif isinstance(error, openai.RateLimitError):
+            hint = max(filter(None, [
+                parse_duration(headers.get("x-ratelimit-reset-requests")),
+                parse_duration(headers.get("x-ratelimit-reset-tokens")),
+            ]), default=None)
+        if hint:
+            delay = max(delay, min(hint, self.max_delay))
+        if isinstance(error, openai.RateLimitError):
+            # Pause admission for everyone, not just this request.
+            with self._cond:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                self._cond.notify_all()
+        return delay
+
+    # --- Requests ---
+
+    def last_queue_seconds(self):
+        """Admission wait of the most recent request made from the calling thread."""
+        return getattr(self._local, "queue_seconds", 0.0)
+
+    def create(self, priority=PRIORITY_CHAT, deadline=None, **kwargs):
+        """Drop-in for `client.chat.completions.create(**kwargs)`.
+
+        `deadline` is in seconds from now and covers queueing, retries and the call itself.
+        Returns the parsed response (a Stream when stream=True). The time this thread's last
+        request spent waiting for admission is available from last_queue_seconds().
+        """
+        deadline_at = time.monotonic() + (deadline or DEFAULT_DEADLINES.get(priority, 120.0))
+        with self._cond:
+            self.stats["requests"] += 1
+        if kwargs.get("stream"):
+            return self._call(priority, deadline_at, kwargs)
+
+        key = request_key(kwargs)
+        with self._cond:
+            leader = key not in self._in_flight
+            if leader:
+                self._in_flight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+            future = self._in_flight[key]
+        if not leader:
+            try:
+                return future.result(timeout=max(0.0, deadline_at - time.monotonic()))
+            except TimeoutError as e:
+                raise DeadlineExceeded("Timed out waiting for a coalesced request") from e
+        try:
+            response = self._call(priority, deadline_at, kwargs)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # e.g. the leader's Streamlit run was interrupted; don't leak that into other sessions.
+            future.set_exception(RuntimeError("The coalesced request was cancelled"))
+            raise
+        finally:
+            with self._cond:
+                self._in_flight.pop(key, None)
+
+    def _correct_tokens(self, usage, estimated):
+        """Replaces the admission estimate with the tokens the request actually used."""
+        if usage is not None:
+            with self._cond:
+                self.tokens.take(usage.total_tokens - estimated, time.monotonic())
+
+    def _call(self, priority, deadline_at, kwargs):
+        estimated = estimate_request_tokens(kwargs)
+        queued_at = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            admitted_at = self._admit(priority, estimated, deadline_at)
+            remaining = deadline_at - admitted_at
+            try:
+                with self._cond:
+                    self.stats["upstream_calls"] += 1
+                raw = self.client.chat.completions.with_raw_response.create(timeout=remaining, **kwargs)
+                self._observe_headers(raw.headers)
+                response = raw.parse()
+                self._local.queue_seconds = admitted_at - queued_at
+                if kwargs.get("stream"):
+                    return UsageObservingStream(response, lambda usage: self._correct_tokens(usage, estimated))
+                self._correct_tokens(getattr(response, "usage", None), estimated)
+                return response
+            except RETRYABLE_ERRORS as e:
+                with self._cond:
+                    self.stats["retries"] += 1
+                    if isinstance(e, openai.RateLimitError):
+                        self.stats["rate_limited"] += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= deadline_at:
+                    raise DeadlineExceeded("Deadline reached while retrying") from e
+                logger.info("Retrying after %s (attempt %d, %.2fs)", type(e).__name__, attempt + 1, delay)
+                time.sleep(delay)
+
+
+class UsageObservingStream:
+    """Wraps a streamed response and reports the usage from its final chunk.
+
+    With `stream_options={"include_usage": True}` the last chunk carries the request's
+    usage; without it the admission estimate stands.
+    """
+
+    def __init__(self, stream, on_usage):
+        self._stream = stream
+        self._on_usage = on_usage
+
+    def __iter__(self):
+        for chunk in self._stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None and self._on_usage is not None:
+                self._on_usage(usage)
+                self._on_usage = None
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._stream.close()
+
+
+class AsyncGatewayClient:
+    """Exposes `await client.chat.completions.create(...)` on top of a shared LLMGateway."""
+
+    def __init__(self, gateway, priority=PRIORITY_ITINERARY, deadline=None):
+        # Per asyncio task, since the gateway's own record is per worker thread.
+        self._queue_seconds = contextvars.ContextVar("queue_seconds", default=0.0)
+
+        def call(kwargs):
+            response = gateway.create(priority=priority, deadline=deadline, **kwargs)
+            return response, gateway.last_queue_seconds()
+
+        async def create(**kwargs):
+            response, queue_seconds = await asyncio.to_thread(call, kwargs)
+            self._queue_seconds.set(queue_seconds)
+            return response
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+    def last_queue_seconds(self):
+        """Admission wait of the most recent request awaited in the calling task."""
+        return self._queue_seconds.get()
+
+
+class GatewayClient:
+    """Exposes `client.chat.completions.create(...)` on top of a shared LLMGateway, with a fixed priority."""
+
+    def __init__(self, gateway, priority=PRIORITY_CHAT, deadline=None):
+        def create(**kwargs):
+            return gateway.create(priority=priority, deadline=deadline, **kwargs)
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+        self.last_queue_seconds = gateway.last_queue_seconds
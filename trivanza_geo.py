@@ -0,0 +1,241 @@
+"""Offline reverse geocoding for Trivanza.
+
+The browser only sends raw latitude/longitude; the server resolves them to
+"City, Country" and an IANA timezone from a bundled gazetteer, so no request ever
+goes to an external geocoding service. Cities are held in a KD-tree over 3-D unit
+vectors (no wrap-around problems at the antimeridian or the poles), and lookups are
+cached by coordinates quantized to ~1 km.
+
+The bundled data/cities.tsv holds the GeoNames cities15000 extract (~34,000 towns;
+https://www.geonames.org, CC BY 4.0). A denser one such as cities1000 can be built
+from the dump (https://download.geonames.org/export/dump/) and selected with
+TRIVANZA_GAZETTEER:
+
+    python trivanza_geo.py build-gazetteer cities15000.txt countryInfo.txt -o data/cities.tsv
+    python trivanza_geo.py bench
+"""
+import argparse
+import heapq
+import math
+import os
+import random
+import time
+from array import array
+from functools import lru_cache
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_GAZETTEER_PATH = os.environ.get(
+    "TRIVANZA_GAZETTEER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cities.tsv")
+)
+# Two decimal places is ~1.1 km at the equator: fine for city-level lookups.
+QUANTIZE_DECIMALS = 2
+
+
+def to_xyz(lat, lon):
+    """Converts degrees to a point on the unit sphere."""
+    lat_r, lon_r = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat_r)
+    return (cos_lat * math.cos(lon_r), cos_lat * math.sin(lon_r), math.sin(lat_r))
+
+
+def chord_to_km(chord):
+    """Converts a straight-line distance between unit vectors to a great-circle distance."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """Static 3-D KD-tree stored as flat, median-ordered arrays (no node objects).
+
+    Node i has its x, y, z at coords[3i:3i + 3] and its input index at order[i]. Both can
+    be any indexable buffer, e.g. memoryviews over a memory-mapped file (see from_buffers()).
+    """
+
+    def __init__(self, points):
+        order = list(range(len(points)))
+        stack = [(0, len(order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= 1:
+                continue
+            axis = depth % 3
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+        self.order = order
+        self.coords = array("d", [c for i in order for c in points[i]])
+
+    @classmethod
+    def from_buffers(cls, coords, order=None):
+        """Wraps already median-ordered coordinates; order defaults to the identity."""
+        tree = cls.__new__(cls)
+        tree.coords = coords
+        tree.order = order if order is not None else range(len(coords) // 3)
+        return tree
+
+    def __len__(self):
+        return len(self.order)
+
+    def query(self, point, k=1, predicate=None):
+        """Returns up to k (chord_distance, original_index) pairs, nearest first.
+
+        `predicate(original_index)` can exclude points without rebuilding the tree.
+        """
+        px, py, pz = point
+        coords, order = self.coords, self.order
+        heap = []  # max-heap on distance via negated squared distances
+
+        def visit(lo, hi, depth):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            base = 3 * mid
+            cx, cy, cz = coords[base], coords[base + 1], coords[base + 2]
+            d2 = (px - cx) ** 2 + (py - cy) ** 2 + (pz - cz) ** 2
+            if (len(heap) < k or d2 < -heap[0][0]) and (predicate is None or predicate(order[mid])):
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d2, order[mid]))
+                else:
+                    heapq.heapreplace(heap, (-d2, order[mid]))
+            diff = point[depth % 3] - coords[base + depth % 3]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            visit(near[0], near[1], depth + 1)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                visit(far[0], far[1], depth + 1)
+
+        visit(0, len(order), 0)
+        return sorted((math.sqrt(-d2), i) for d2, i in heap)
+
+
+class Gazetteer:
+    """Cities with their country and timezone, indexed for nearest-city lookups."""
+
+    def __init__(self, names, countries, timezones, latlons):
+        self.names = names
+        self.countries = countries
+        self.timezones = timezones
+        self.latlons = latlons
+        self.tree = KDTree([to_xyz(lat, lon) for lat, lon in latlons])
+
+    @classmethod
+    def load(cls, path=DEFAULT_GAZETTEER_PATH):
+        """Loads a tab-separated file of name, country, latitude, longitude, timezone."""
+        names, countries, timezones, latlons = [], [], [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                name, country, lat, lon, tz = line.rstrip("\n").split("\t")[:5]
+                names.append(name)
+                countries.append(country)
+                timezones.append(tz)
+                latlons.append((float(lat), float(lon)))
+        return cls(names, countries, timezones, latlons)
+
+    def nearest(self, lat, lon):
+        """Returns the nearest city as a dict, or None for an empty gazetteer."""
+        result = self.tree.query(to_xyz(lat, lon), k=1)
+        if not result:
+            return None
+        chord, i = result[0]
+        return {
+            "city": self.names[i],
+            "country": self.countries[i],
+            "timezone": self.timezones[i],
+            "distance_km": chord_to_km(chord),
+        }
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer():
+    """The process-wide gazetteer, loaded on first use."""
+    return Gazetteer.load(DEFAULT_GAZETTEER_PATH)
+
+
+@lru_cache(maxsize=65536)
+def _reverse_geocode_quantized(lat_q, lon_q):
+    return get_gazetteer().nearest(lat_q, lon_q)
+
+
+def reverse_geocode(lat, lon):
+    """Resolves coordinates to {"city", "country", "timezone", "distance_km"} (or None)."""
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return _reverse_geocode_quantized(round(lat, QUANTIZE_DECIMALS), round(lon, QUANTIZE_DECIMALS))
+
+
+# --- CLI ---
+
+def build_gazetteer(cities_path, country_info_path, output_path):
+    """Converts a GeoNames citiesNNNN.txt dump (+ countryInfo.txt) to the bundled format."""
+    country_names = {}
+    with open(country_info_path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) > 4:
+                country_names[cols[0]] = cols[4]
+    count = 0
+    with open(cities_path, encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as out:
+        out.write(f"# GeoNames {os.path.basename(cities_path)} (https://www.geonames.org, CC BY 4.0)\n")
+        out.write("# name\tcountry\tlatitude\tlongitude\ttimezone\n")
+        for line in src:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 18 or not cols[17]:
+                continue
+            out.write(f"{cols[1]}\t{country_names.get(cols[8], cols[8])}\t{cols[4]}\t{cols[5]}\t{cols[17]}\n")
+            count += 1
+    return count
+
+
+def benchmark(gazetteer, lookups=100_000, seed=7):
+    """Measures uncached and cached lookup latency in microseconds."""
+    rng = random.Random(seed)
+    points = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(lookups)]
+    start = time.perf_counter()
+    for lat, lon in points:
+        gazetteer.nearest(lat, lon)
+    uncached = (time.perf_counter() - start) / lookups
+    _reverse_geocode_quantized.cache_clear()
+    hot = points[:1000]
+    for lat, lon in hot:
+        reverse_geocode(lat, lon)
+    start = time.perf_counter()
+    for _ in range(lookups // len(hot)):
+        for lat, lon in hot:
+            reverse_geocode(lat, lon)
+    cached = (time.perf_counter() - start) / (lookups // len(hot) * len(hot))
+    return {"cities": len(gazetteer.tree), "uncached_us": uncached * 1e6, "cached_us": cached * 1e6}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trivanza offline reverse geocoder.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build-gazetteer", help="Convert a GeoNames dump to the bundled format")
+    build.add_argument("cities_path")
+    build.add_argument("country_info_path")
+    build.add_argument("-o", "--output", default=DEFAULT_GAZETTEER_PATH)
+    bench = sub.add_parser("bench", help="Measure lookup latency")
+    bench.add_argument("--lookups", type=int, default=100_000)
+    lookup = sub.add_parser("lookup", help="Resolve one coordinate")
+    lookup.add_argument("lat", type=float)
+    lookup.add_argument("lon", type=float)
+    args = parser.parse_args(argv)
+
+    if args.command == "build-gazetteer":
+        print(f"Wrote {build_gazetteer(args.cities_path, args.country_info_path, args.output)} cities to {args.output}")
+    elif args.command == "bench":
+        start = time.perf_counter()
+        gazetteer = get_gazetteer()
+        load_ms = (time.perf_counter() - start) * 1000
+        result = benchmark(gazetteer, args.lookups)
+        print(f"{result['cities']} cities loaded in {load_ms:.1f} ms")
+        print(f"uncached lookup: {result['uncached_us']:.1f} µs, cached lookup: {result['cached_us']:.2f} µs")
+    else:
+        print(reverse_geocode(args.lat, args.lon))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Local intent router for Trivanza chat messages.
+
+Before each chat call, the user's message is classified as one of:
+
+- emergency:      on-the-go and urgent needs (hospital, lost passport, nearest ATM),
+- quick_fact:     short practical questions (visa, currency, weather, tipping),
+- itinerary_edit: changes to the itinerary already in the chat,
+- new_plan:       a request for a whole new trip plan.
+
+The classifier is a small weighted lexicon over stemmed words plus a few phrase
+patterns; it needs no model download and runs in tens of microseconds. nltk's Porter
+stemmer is used when nltk is installed, with a crude suffix stripper otherwise.
+
+Each intent maps to a route: model, max_tokens, temperature and the focus note sent
+after the shared system prompt (see trivanza_prompts.PROMPT_FOCUS), so every route keeps
+the same cacheable prompt prefix. Routes can be overridden with a JSON file named by TRIVANZA_ROUTES,
+e.g. {"quick_fact": {"model": "gpt-4o", "max_tokens": 800}}, and routing can be
+turned off with TRIVANZA_ROUTING=off. The "nearby" route is used when an emergency
+message is answered from the offline POI index (see trivanza_poi).
+
+    python trivanza_intent.py eval          # accuracy and latency on data/intent_samples.tsv
+    python trivanza_intent.py eval data/intent_heldout.tsv     # frozen held-out set, never tuned on
+    python trivanza_intent.py eval data/intent_regression.tsv  # past misses and retune checks
+    python trivanza_intent.py classify "Where is the nearest pharmacy?"
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from trivanza_prompts import PROMPT_FOCUS
+
+try:
+    from nltk.stem import PorterStemmer
+    _STEMMER = PorterStemmer()
+except ImportError:  # nltk is optional
+    _STEMMER = None
+
+EMERGENCY = "emergency"
+QUICK_FACT = "quick_fact"
+ITINERARY_EDIT = "itinerary_edit"
+NEW_PLAN = "new_plan"
+INTENTS = (EMERGENCY, QUICK_FACT, ITINERARY_EDIT, NEW_PLAN)
+NEARBY = "nearby"
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_SAMPLES_PATH = os.path.join(DATA_DIR, "intent_samples.tsv")
+HELDOUT_SAMPLES_PATH = os.path.join(DATA_DIR, "intent_heldout.tsv")
+REGRESSION_SAMPLES_PATH = os.path.join(DATA_DIR, "intent_regression.tsv")
+
+DEFAULT_ROUTE = {"model": "gpt-4o", "max_tokens": 2048, "temperature": 0.7, "focus": None}
+DEFAULT_ROUTES = {
+    EMERGENCY: {"model": "gpt-4o", "max_tokens": 700, "temperature": 0.3, "focus": "on_the_go"},
+    QUICK_FACT: {"model": "gpt-4o-mini", "max_tokens": 600, "temperature": 0.5, "focus": "quick_fact"},
+    ITINERARY_EDIT: {"model": "gpt-4o", "max_tokens": 2048, "temperature": 0.7, "focus": "itinerary"},
+    NEW_PLAN: {"model": "gpt-4o", "max_tokens": 3500, "temperature": 0.7, "focus": "itinerary"},
+    # Not a classifier label: messages answered from the local POI index
+    # (trivanza_poi), where the model only phrases the tool result.
+    NEARBY: {"model": "gpt-4o-mini", "max_tokens": 500, "temperature": 0.2, "focus": "nearby"},
+}
+
+# Word weights per intent. Words are stemmed when the lexicon is built, so inflections match.
+LEXICON = {
+    EMERGENCY: {
+        4.0: "emergency urgent urgently ambulance hospital police stolen robbed injured accident bleeding "
+             "sick ill fever pain hurt lost missing embassy consulate fire earthquake flood scam harassed "
+             "danger attacked assaulted threatened unsafe",
+        2.5: "pharmacy chemist doctor clinic atm mechanic breakdown flat tyre tire toilet restroom "
+             "nearest nearby closest stuck stranded cancelled delayed missed locked",
+        1.5: "now tonight open directions route taxi cab uber station airport charger wifi hotel",
+    },
+    QUICK_FACT: {
+        2.5: "visa currency exchange rate weather temperature climate tip tipping plug adapter voltage "
+             "sim esim language safe vaccine vaccination passport customs timezone",
+        1.5: "best time season cost price much need require allowed legal dress code festival holiday "
+             "available accepted",
+        1.0: "what which how is are does do can should",
+    },
+    ITINERARY_EDIT: {
+        3.0: "change swap replace remove add move shift reschedule instead cheaper expensive "
+             "relaxed relaxing shorter longer extend reduce skip drop adjust update modify edit",
+        2.0: "itinerary plan day days hotel budget morning afternoon evening activity",
+    },
+    NEW_PLAN: {
+        3.0: "plan itinerary trip vacation holiday getaway honeymoon tour",
+        2.0: "week weekend days nights budget visit travel explore",
+        1.0: "create make build suggest organize",
+    },
+}
+
+# (pattern, intent, weight) over the lower-cased message.
+PHRASES = [
+    (r"\bnear (me|here|my)\b|\baround (me|here)\b|\bclosest\b", EMERGENCY, 3.0),
+    (r"\b(lost|lose) my\b|\bhelp me\b|\bcall (the )?police\b|\bi('m| am) (lost|stuck|sick|hurt)\b", EMERGENCY, 4.0),
+    (r"\b(following|stalking|threatening|harassing) (me|us)\b|\bwho (do|should|can) (i|we) call\b", EMERGENCY, 4.0),
+    (r"\bright now\b|\bopen now\b|\bstill open\b|\bhow (do|can) i get (to|from)\b", EMERGENCY, 2.5),
+    (r"\bday\s*\d+\b|\b(first|second|third|last) day\b", ITINERARY_EDIT, 3.0),
+    (r"\b(make|can you make) (it|this|that|the trip|day)\b|\bthe itinerary\b|\bmy itinerary\b", ITINERARY_EDIT, 2.5),
+    (r"\b(plan|organi[sz]e|create|build) (a|an|my|me a)\b.*\b(trip|itinerary|vacation|holiday|getaway|tour)\b", NEW_PLAN, 4.0),
+    (r"\b\d+[- ]?(day|days|night|nights|week|weeks)\b", NEW_PLAN, 2.0),
+    (r"\bfrom [a-z]+ to [a-z]+\b", NEW_PLAN, 1.5),
+    (r"\b(is|are) [\w ]+ (available|accepted|allowed|legal|common) (in|at)\b", QUICK_FACT, 2.5),
+    (r"\b(do i need|is it safe|what is|what's|how much|when is|which)\b", QUICK_FACT, 2.0),
+]
+# Explicitly asking for another trip overrides the "an itinerary is on screen" bias.
+NEW_TRIP_RE = re.compile(r"\b(new|another|separate|different)( [\w-]+)? (trip|itinerary|plan|vacation)\b")
+_COMPILED_PHRASES = [(re.compile(pattern), intent, weight) for pattern, intent, weight in PHRASES]
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=16384)
+def stem(word):
+    if _STEMMER is not None:
+        return _STEMMER.stem(word)
+    for suffix in ("ing", "ies", "es", "ed", "ly", "s"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            return word[: -len(suffix)]
+    return word
+
+
+def _build_weights():
+    weights = defaultdict(dict)
+    for intent, tiers in LEXICON.items():
+        for weight, words in tiers.items():
+            for word in words.split():
+                weights[stem(word)][intent] = max(weight, weights[stem(word)].get(intent, 0.0))
+    return dict(weights)
+
+
+WORD_WEIGHTS = _build_weights()
+
+
+def intent_scores(message, has_itinerary=False):
+    """Raw score per intent for a message."""
+    text = message.lower()
+    scores = dict.fromkeys(INTENTS, 0.0)
+    for word in set(WORD_RE.findall(text)):
+        for intent, weight in WORD_WEIGHTS.get(stem(word), {}).items():
+            scores[intent] += weight
+    for pattern, intent, weight in _COMPILED_PHRASES:
+        if pattern.search(text):
+            scores[intent] += weight
+    if has_itinerary and NEW_TRIP_RE.search(text):
+        scores[NEW_PLAN] += 4.0
+    elif has_itinerary:
+        # With an itinerary on screen, planning words usually mean "change it".
+        scores[ITINERARY_EDIT] += 0.5 * scores[NEW_PLAN]
+        scores[NEW_PLAN] *= 0.5
+    else:
+        scores[NEW_PLAN] += 0.5 * scores[ITINERARY_EDIT]
+        scores[ITINERARY_EDIT] = 0.0
+    return scores
+
+
+def classify(message, has_itinerary=False):
+    """Returns the most likely intent; short messages with no signal count as quick facts."""
+    scores = intent_scores(message, has_itinerary)
+    best = max(INTENTS, key=scores.__getitem__)
+    return best if scores[best] > 0 else QUICK_FACT
+
+
+def routing_enabled():
+    return os.environ.get("TRIVANZA_ROUTING", "on").lower() not in ("0", "off", "false", "no")
+
+
+@lru_cache(maxsize=1)
+def load_routes(path=None):
+    """DEFAULT_ROUTES with per-intent overrides from a JSON file (TRIVANZA_ROUTES)."""
+    path = path or os.environ.get("TRIVANZA_ROUTES")
+    routes = {intent: dict(route) for intent, route in DEFAULT_ROUTES.items()}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for intent, overrides in json.load(f).items():
+                if intent not in routes:
+                    raise ValueError(f"Unknown intent in {path}: {intent}")
+                routes[intent].update(overrides)
+    for intent, route in routes.items():
+        if route.get("focus") is not None and route["focus"] not in PROMPT_FOCUS:
+            raise ValueError(f"Unknown focus for {intent} in {path}: {route['focus']}")
+    return routes
+
+
+def route_for(name):
+    """The route for an intent (or NEARBY); DEFAULT_ROUTE when routing is off."""
+    return load_routes()[name] if routing_enabled() else DEFAULT_ROUTE
+
+
+def route_message(message, has_itinerary=False):
+    """Returns (intent, route) for a chat message; the route is DEFAULT_ROUTE when routing is off."""
+    intent = classify(message, has_itinerary)
+    return intent, route_for(intent)
+
+
+# --- Offline evaluation ---
+
+def read_samples(path=DEFAULT_SAMPLES_PATH):
+    """Reads (intent, has_itinerary, message) rows from a tab-separated file."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            intent, has_itinerary, message = line.rstrip("\n").split("\t", 2)
+            yield intent, has_itinerary == "1", message
+
+
+def evaluate(samples, repeats=200):
+    """Accuracy, confusion counts and per-message latency (µs) over labeled samples."""
+    samples = list(samples)
+    confusion = Counter()
+    mistakes = []
+    for intent, has_itinerary, message in samples:
+        predicted = classify(message, has_itinerary)
+        confusion[(intent, predicted)] += 1
+        if predicted != intent:
+            mistakes.append((intent, predicted, message))
+    timings = []
+    for _ in range(repeats):
+        for _, has_itinerary, message in samples:
+            start = time.perf_counter()
+            classify(message, has_itinerary)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    correct = sum(count for (label, predicted), count in confusion.items() if label == predicted)
+    return {
+        "samples": len(samples),
+        "accuracy": correct / len(samples) if samples else 0.0,
+        "confusion": confusion,
+        "mistakes": mistakes,
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p99_us": timings[int(len(timings) * 0.99)] * 1e6,
+        "max_us": timings[-1] * 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trivanza intent router.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ev = sub.add_parser("eval", help="Accuracy and latency on a labeled sample")
+    ev.add_argument("path", nargs="?", default=DEFAULT_SAMPLES_PATH)
+    ev.add_argument("--min-accuracy", type=float, default=0.0, help="Exit non-zero below this accuracy")
+    ev.add_argument("--max-p99-us", type=float, default=1000.0, help="Exit non-zero above this p99 latency")
+    one = sub.add_parser("classify", help="Classify one message")
+    one.add_argument("message")
+    one.add_argument("--has-itinerary", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "classify":
+        intent, route = route_message(args.message, args.has_itinerary)
+        print(json.dumps({"intent": intent, "route": route, "scores": intent_scores(args.message, args.has_itinerary)}))
+        return
+    result = evaluate(read_samples(args.path))
+    print(f"{result['samples']} samples, accuracy {result['accuracy']:.1%}")
+    print(f"latency p50 {result['p50_us']:.1f} µs, p99 {result['p99_us']:.1f} µs, max {result['max_us']:.1f} µs")
+    print("confusion (label -> predicted):")
+    for (label, predicted), count in sorted(result["confusion"].items()):
+        print(f"  {label:>15} -> {predicted:<15} {count}")
+    for label, predicted, message in result["mistakes"]:
+        print(f"  MISS {label} -> {predicted}: {message}")
+    if result["accuracy"] < args.min_accuracy or result["p99_us"] > args.max_p99_us:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Parallel itinerary generation for Trivanza.
+
+Instead of one long completion, an itinerary is built in three steps:
+
+1. a short JSON skeleton with the greeting and the city/theme of every day,
+2. every `### Day N: ...` section, generated concurrently (bounded by a semaphore),
+3. the final sections (cost breakdown, grand total, packing, budget analysis, tip),
+   written from the day headings and daily totals only.
+
+In structured mode (see trivanza_costs) the days come back as JSON items and every
+amount, total and the budget analysis is computed locally; the model only adds the
+packing checklist and the pro tip.
+
+Sections are assembled in day order no matter which finishes first, so wall-clock time
+follows the slowest day rather than the trip length and long trips are no longer cut off
+by a single max_tokens limit. A day that fails or comes back unparsable is requested once
+more; if that fails too, the day is shown as a placeholder and left out of the totals,
+which say so, instead of failing the whole itinerary or counting as ₹0.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+from trivanza_costs import (
+    DAY_ITEMS_INSTRUCTIONS, DISCLAIMER, currency_code, parse_day_items,
+    render_budget_analysis, render_cost_breakdown, render_day,
+)
+from trivanza_metrics import CANCELLED
+
+logger = logging.getLogger("trivanza.itinerary")
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_CONCURRENCY = 6
+DAY_MAX_TOKENS = 900
+# A day that fails or comes back unparsable is requested once more, then shown as a placeholder.
+DAY_ATTEMPTS = 2
+FINAL_MAX_TOKENS = 1200
+CLOSING_LINE = "How does this look? I'm happy to make any adjustments you'd like."
+
+SKELETON_INSTRUCTIONS = """
+You are drafting the outline of a travel itinerary. Reply with JSON only, in this exact shape:
+{{"greeting": "<warm, personalized greeting line mentioning the place and duration>",
+  "days": [{{"day": 1, "city": "<city or area>", "theme": "<short activity theme>"}}, ...]}}
+The trip has exactly {num_days} days; return exactly {num_days} entries in "days", in order.
+Day 1 includes travel from the origin and the last day includes the return journey.
+"""
+
+DAY_INSTRUCTIONS = """
+Write ONLY the section for Day {day} of this {num_days}-day itinerary. The full day plan is:
+{outline}
+
+Start with exactly this heading: `### Day {day}: {theme} ({date})`
+Follow every itinerary formatting and cost rule from your instructions for this single day,
+and end the section with the `🎯 Daily Total` line. Do NOT write a greeting, other days,
+the final sections, a disclaimer or a closing question.
+"""
+
+FINAL_INSTRUCTIONS = """
+The day-by-day plan has already been written. These are its day headings and daily totals:
+{totals}
+
+Write ONLY the final sections of the itinerary, in the exact order and format from your
+instructions: `🧾 Cost Breakdown:`, `💰 Grand Total:`, `🎒 Packing Checklist:`,
+`💼 Budget Analysis:`, `📌 Destination Pro Tip:` and the `⚠️ *Disclaimer...*` line.
+The Grand Total MUST equal the sum of the daily totals above; if a day's total is not
+available, say that the Grand Total excludes that day. Do NOT repeat the days,
+do NOT write a greeting and do NOT ask a closing question.
+"""
+
+SKELETON_MAX_TOKENS = 120
+SKELETON_TOKENS_PER_DAY = 40
+
+STRUCTURED_DAY_INSTRUCTIONS = """
+List the itinerary items for Day {day} ({theme}, {date}) of this {num_days}-day trip. The full day plan is:
+{outline}
+""" + DAY_ITEMS_INSTRUCTIONS.replace("{", "{{").replace("}", "}}")
+
+STRUCTURED_EXTRAS_MAX_TOKENS = 400
+STRUCTURED_EXTRAS_INSTRUCTIONS = """
+The day-by-day plan and all costs are already done. Reply with JSON only, in this shape:
+{"packing_checklist": ["<item personalized for the destination, weather and activities>", ...],
+ "pro_tip": "<one fun, useful tip about the destination>"}
+"""
+
+DAILY_TOTAL_RE = re.compile(r"^.*🎯\s*Daily Total.*$", re.MULTILINE)
+
+
+def trip_dates(ctx):
+    """Returns the date of every day of the trip, first to last."""
+    num_days = max((ctx["to_date"] - ctx["from_date"]).days + 1, 1)
+    return [ctx["from_date"] + timedelta(days=i) for i in range(num_days)]
+
+
+def parse_skeleton(text, num_days, destination):
+    """Parses the skeleton JSON, padding or trimming it to exactly num_days entries.
+
+    Raises ValueError if the reply is not a JSON object (e.g. it was cut off at max_tokens).
+    """
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("skeleton is not a JSON object")
+    days = data.get("days")
+    days = [d for d in days if isinstance(d, dict)][:num_days] if isinstance(days, list) else []
+    while len(days) < num_days:
+        days.append({"city": destination, "theme": "Explore"})
+    greeting = data.get("greeting") or f"Namaste Traveler! Let's plan your {num_days}-day trip to {destination}!"
+    return greeting, [(d.get("city") or destination, d.get("theme") or "Explore") for d in days]
+
+
+def _day_heading(day, city, theme, day_date):
+    return f"### Day {day}: {theme} – {city} ({day_date.isoformat()})"
+
+
+def unplanned_day(heading, day):
+    """The visible placeholder for a day that could not be generated."""
+    return (
+        f"{heading}\n\n⚠️ _This day could not be planned just now. Ask me to redo Day {day} and I'll try again._"
+        "\n\n🎯 Daily Total: not available"
+    )
+
+
+def assemble_itinerary(greeting, day_sections, final_sections):
+    """Joins the pieces in their fixed order."""
+    parts = [greeting.strip()] + [s.strip() for s in day_sections] + [final_sections.strip(), CLOSING_LINE]
+    return "\n\n".join(p for p in parts if p)
+
+
+class ItineraryEngine:
+    """Generates an itinerary with concurrent per-day completions.
+
+    With a `cost_table` (see trivanza_costs.CostTable) the engine runs in structured mode:
+    each day comes back as JSON items and all totals, the cost breakdown and the budget
+    analysis are computed and rendered locally instead of by the model.
+
+    Progress is reported through optional callbacks, all called from the event-loop
+    thread in a deterministic place:
+      - on_skeleton(greeting, headings) once the outline is known,
+      - on_day(index, text) whenever a day section finishes (in completion order),
+      - on_usage(usage, kind, queue_seconds=..., total_seconds=..., error=...) for every
+        completion, including failed ones (usage None) and ones cancelled with the
+        generation (error "cancelled").
+    """
+
+    def __init__(self, client, model=DEFAULT_MODEL, concurrency=DEFAULT_CONCURRENCY, temperature=0.7, cost_table=None):
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.temperature = temperature
+        self.cost_table = cost_table
+
+    async def _complete(self, messages, max_tokens, on_usage, kind, **kwargs):
+        started = time.perf_counter()
+        usage = error = None
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+            usage = response.usage
+            return response.choices[0].message.content or ""
+        except asyncio.CancelledError:
+            error = CANCELLED
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if on_usage is not None:
+                last_queue_seconds = getattr(self.client, "last_queue_seconds", None)
+                on_usage(
+                    usage, kind, error=error, total_seconds=time.perf_counter() - started,
+                    queue_seconds=last_queue_seconds() if last_queue_seconds and not error else None
+                )
+
+    async def generate(self, system_prompt, trip_prompt, ctx, on_skeleton=None, on_day=None, on_usage=None):
+        """Returns the full itinerary Markdown."""
+        dates = trip_dates(ctx)
+        num_days = len(dates)
+        structured = self.cost_table is not None
+        target_code = currency_code(ctx.get("currency_type"))
+
+        greeting, outline = await self._skeleton(trip_prompt, num_days, ctx["destination"], on_usage)
+        headings = [
+            _day_heading(i + 1, city, theme, day_date)
+            for i, ((city, theme), day_date) in enumerate(zip(outline, dates))
+        ]
+        if on_skeleton is not None:
+            on_skeleton(greeting, headings)
+
+        outline_text = "\n".join(f"- {h[4:]}" for h in headings)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def write_day(index):
+            city, theme = outline[index]
+            template = STRUCTURED_DAY_INSTRUCTIONS if structured else DAY_INSTRUCTIONS
+            instructions = template.format(
+                day=index + 1, num_days=num_days, outline=outline_text,
+                theme=f"{theme} – {city}", date=dates[index].isoformat()
+            )
+            extra = {"response_format": {"type": "json_object"}} if structured else {}
+            for attempt in range(DAY_ATTEMPTS):
+                try:
+                    async with semaphore:
+                        text = await self._complete(
+                            [
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": f"{trip_prompt}\n\n{instructions}"},
+                            ],
+                            max_tokens=DAY_MAX_TOKENS,
+                            on_usage=on_usage,
+                            kind="itinerary_day",
+                            **extra
+                        )
+                    if structured:
+                        return index, text, self._parse_items(text, index + 1)
+                    if not text.strip():
+                        raise ValueError("empty reply")
+                    return index, text, None
+                except Exception as e:
+                    logger.warning("Day %d failed (attempt %d): %s", index + 1, attempt + 1, e)
+            return index, None, None
+
+        day_sections = [""] * num_days
+        day_items = [None] * num_days
+        tasks = [asyncio.create_task(write_day(i)) for i in range(num_days)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, text, items = await next_done
+                if text is None:
+                    text = unplanned_day(headings[index], index + 1)
+                elif structured:
+                    day_items[index] = items
+                    text = render_day(headings[index], self.cost_table.convert(items, target_code), target_code)
+                day_sections[index] = text
+                if on_day is not None:
+                    on_day(index, text)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if structured:
+            return await self._finish_structured(
+                system_prompt, trip_prompt, ctx, greeting, headings, day_sections, day_items, target_code, on_usage
+            )
+
+        totals = "\n".join(
+            f"{heading}\n{(DAILY_TOTAL_RE.findall(text) or ['🎯 Daily Total: (not stated)'])[-1].strip()}"
+            for heading, text in zip(headings, day_sections)
+        )
+        final_sections = await self._complete(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"{trip_prompt}\n\n{FINAL_INSTRUCTIONS.format(totals=totals)}"},
+            ],
+            max_tokens=FINAL_MAX_TOKENS,
+            on_usage=on_usage,
+            kind="itinerary_final"
+        )
+        return assemble_itinerary(greeting, day_sections, final_sections)
+
+    async def _skeleton(self, trip_prompt, num_days, destination, on_usage):
+        """Returns (greeting, outline); retries once with twice the tokens, then uses a generic outline."""
+        max_tokens = SKELETON_MAX_TOKENS + SKELETON_TOKENS_PER_DAY * num_days
+        for attempt in range(2):
+            text = await self._complete(
+                [
+                    {"role": "system", "content": SKELETON_INSTRUCTIONS.format(num_days=num_days)},
+                    {"role": "user", "content": trip_prompt},
+                ],
+                max_tokens=max_tokens * (attempt + 1),
+                on_usage=on_usage,
+                kind="itinerary_skeleton",
+                response_format={"type": "json_object"}
+            )
+            try:
+                return parse_skeleton(text, num_days, destination)
+            except ValueError as e:
+                logger.warning("Could not parse the skeleton (attempt %d): %s", attempt + 1, e)
+        # Every day is still written by the model; only the themes are generic.
+        return parse_skeleton("{}", num_days, destination)
+
+    @staticmethod
+    def _parse_items(text, day):
+        """Parses a day's items; raises ValueError for invalid JSON or a day without items."""
+        try:
+            items = parse_day_items(text, day)
+        except AttributeError as e:
+            raise ValueError(f"unexpected item shape: {e}") from e
+        if items.empty:
+            raise ValueError("no items")
+        return items
+
+    async def _finish_structured(self, system_prompt, trip_prompt, ctx, greeting, headings, day_sections, day_items,
+                                 target_code, on_usage):
+        """Converts every item in one pass, then renders days, totals and the closing sections.
+
+        Days without items (see unplanned_day()) keep their placeholder and are named in the totals.
+        """
+        unpriced_days = [i + 1 for i, day in enumerate(day_items) if day is None]
+        priced = [day for day in day_items if day is not None] or [parse_day_items('{"items": []}', 1)]
+        items = self.cost_table.convert(pd.concat(priced, ignore_index=True), target_code)
+        day_sections = [
+            section if day_items[i] is None else render_day(heading, items[items["day"] == i + 1], target_code)
+            for i, (heading, section) in enumerate(zip(headings, day_sections))
+        ]
+        extras_text = await self._complete(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"{trip_prompt}\n\n{STRUCTURED_EXTRAS_INSTRUCTIONS}"},
+            ],
+            max_tokens=STRUCTURED_EXTRAS_MAX_TOKENS,
+            on_usage=on_usage,
+            kind="itinerary_final",
+            response_format={"type": "json_object"}
+        )
+        try:
+            extras = json.loads(extras_text)
+        except ValueError:
+            extras = {}
+        if not isinstance(extras, dict):
+            extras = {}
+        checklist = extras.get("packing_checklist")
+        packing = "\n".join(f"- {item}" for item in checklist if item) if isinstance(checklist, list) else ""
+        pro_tip = extras.get("pro_tip")
+        final_sections = "\n\n".join(section for section in [
+            render_cost_breakdown(items, self.cost_table, target_code, unpriced_days),
+            f"🎒 Packing Checklist:\n\n{packing}" if packing else "",
+            render_budget_analysis(items, target_code, ctx.get("budget_amount"), unpriced_days),
+            f"📌 Destination Pro Tip: {pro_tip}" if pro_tip and isinstance(pro_tip, str) else "",
+            DISCLAIMER,
+        ] if section)
+        return assemble_itinerary(greeting, day_sections, final_sections)
@@ -0,0 +1,279 @@
+"""Latency, token and cost telemetry for Trivanza.
+
+One process-wide registry collects:
+
+- LLM call metrics for every request (queue time, time to first token, total time,
+  prompt/completion/cached tokens and estimated cost), labelled by request kind,
+- optional per-stage timings (prompt building, rendering, script runs) through
+  `timed()`, which is a no-op unless TRIVANZA_STAGE_TIMING is set.
+
+Exports:
+- TRIVANZA_METRICS_PROM: a Prometheus text file (e.g. for node_exporter's textfile
+  collector), rewritten at most every few seconds,
+- TRIVANZA_METRICS_JSONL: an append-only JSONL file with one event per LLM call.
+
+    python trivanza_metrics.py summarize metrics.jsonl   # p50/p95/p99 per kind
+"""
+import argparse
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("trivanza.metrics")
+
+STAGE_TIMING = os.environ.get("TRIVANZA_STAGE_TIMING", "").lower() in ("1", "on", "true", "yes")
+PROM_PATH = os.environ.get("TRIVANZA_METRICS_PROM")
+JSONL_PATH = os.environ.get("TRIVANZA_METRICS_JSONL")
+PROM_FLUSH_SECONDS = 5.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+QUANTILES = (0.5, 0.95, 0.99)
+RESERVOIR_SIZE = 2048
+# Recorded as the error of a call the caller abandoned (e.g. a stream interrupted by a new message).
+CANCELLED = "cancelled"
+
+# USD per 1M tokens: (input, cached input, output).
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """Estimated USD cost of one call; unknown models are priced like gpt-4o."""
+    price_in, price_cached, price_out = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o"])
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * price_in + cached_tokens * price_cached + completion_tokens * price_out) / 1_000_000
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+
+class MetricsRegistry:
+    """Thread-safe counters and latency histograms keyed by (name, labels)."""
+
+    def __init__(self, prom_path=PROM_PATH, jsonl_path=JSONL_PATH):
+        self.prom_path = prom_path
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = defaultdict(_Histogram)
+        self._last_flush = 0.0
+
+    def inc(self, name, amount=1.0, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+        self._maybe_flush()
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            self._histograms[(name, tuple(sorted(labels.items())))].observe(seconds)
+        self._maybe_flush()
+
+    def event(self, record):
+        """Appends one JSON record to the JSONL file, if configured."""
+        if not self.jsonl_path:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def snapshot(self):
+        """Counters plus count/mean/p50/p95/p99 for every histogram."""
+        with self._lock:
+            counters = {_series(name, labels): value for (name, labels), value in self._counters.items()}
+            histograms = {}
+            for (name, labels), hist in self._histograms.items():
+                recent = sorted(hist.recent)
+                histograms[_series(name, labels)] = dict(
+                    count=hist.count,
+                    mean=hist.total / hist.count if hist.count else 0.0,
+                    **{f"p{int(q * 100)}": percentile(recent, q) for q in QUANTILES}
+                )
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self):
+        """Prometheus text exposition format.
+
+        Histograms also get a `<name>_recent` gauge with p50/p95/p99 over recent samples.
+        """
+        lines = []
+        typed = set()
+
+        def _type(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                _type(name, "counter")
+                lines.append(f"{_series(name, labels)} {value:g}")
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            for (name, labels), hist in histograms:
+                _type(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (math.inf,), hist.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(f"{_series(name + '_bucket', labels + (('le', le),))} {cumulative}")
+                lines.append(f"{_series(name + '_sum', labels)} {hist.total:g}")
+                lines.append(f"{_series(name + '_count', labels)} {hist.count}")
+            for (name, labels), hist in histograms:
+                _type(name + "_recent", "gauge")
+                recent = sorted(hist.recent)
+                for q in QUANTILES:
+                    lines.append(f"{_series(name + '_recent', labels + (('quantile', f'{q:g}'),))} {percentile(recent, q):g}")
+        return "\n".join(lines) + "\n"
+
+    def _maybe_flush(self):
+        if not self.prom_path:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_flush < PROM_FLUSH_SECONDS:
+                return
+            self._last_flush = now
+        self.flush()
+
+    def flush(self):
+        """Atomically rewrites the Prometheus text file."""
+        if not self.prom_path:
+            return
+        tmp_path = f"{self.prom_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, self.prom_path)
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+METRICS = MetricsRegistry()
+atexit.register(METRICS.flush)
+
+
+@contextmanager
+def _timer(stage, kind):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.observe("trivanza_stage_seconds", time.perf_counter() - started, stage=stage, kind=kind)
+
+
+def timed(stage, kind=""):
+    """Times a block as `trivanza_stage_seconds{stage=...}` when stage timing is enabled."""
+    if not STAGE_TIMING:
+        return nullcontext()
+    return _timer(stage, kind)
+
+
+def call_outcome(error):
+    """The `outcome` label for a call: "ok", "cancelled" (the user moved on) or "error"."""
+    if not error:
+        return "ok"
+    return CANCELLED if error == CANCELLED else "error"
+
+
+def record_llm_call(kind, model, session_id=None, usage=None, queue_seconds=None, ttft_seconds=None,
+                    total_seconds=None, error=None):
+    """Records one LLM call and returns its estimated cost in USD.
+
+    Pass error=CANCELLED for a call abandoned by the caller, so it is not counted as a failure.
+    """
+    prompt_tokens = completion_tokens = cached_tokens = 0
+    if usage is not None:
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+
+    outcome = call_outcome(error)
+    METRICS.inc("trivanza_llm_requests_total", kind=kind, outcome=outcome)
+    for token_type, amount in (("prompt", prompt_tokens), ("completion", completion_tokens), ("cached", cached_tokens)):
+        if amount:
+            METRICS.inc("trivanza_llm_tokens_total", amount, kind=kind, type=token_type)
+    if cost:
+        METRICS.inc("trivanza_llm_cost_usd_total", cost, kind=kind)
+    for phase, value in (("queue", queue_seconds), ("ttft", ttft_seconds), ("total", total_seconds)):
+        if value is not None:
+            METRICS.observe("trivanza_llm_seconds", value, kind=kind, phase=phase)
+    METRICS.event({
+        "ts": time.time(), "session": session_id, "kind": kind, "model": model,
+        "queue_s": queue_seconds, "ttft_s": ttft_seconds, "total_s": total_seconds,
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens, "cost_usd": cost, "outcome": outcome, "error": error,
+    })
+    return cost
+
+
+def summarize_jsonl(path):
+    """Per-kind p50/p95/p99 latencies, token totals and cost from a JSONL metrics file."""
+    by_kind = defaultdict(lambda: defaultdict(list))
+    totals = defaultdict(lambda: defaultdict(float))
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.get("kind", "unknown")
+            for phase in ("queue_s", "ttft_s", "total_s"):
+                if record.get(phase) is not None:
+                    by_kind[kind][phase].append(record[phase])
+            for field in ("prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd"):
+                totals[kind][field] += record.get(field) or 0
+            totals[kind]["calls"] += 1
+            outcome = record.get("outcome") or call_outcome(record.get("error"))
+            totals[kind]["errors"] += 1 if outcome == "error" else 0
+            totals[kind]["cancelled"] += 1 if outcome == CANCELLED else 0
+    summary = {}
+    for kind in totals:
+        summary[kind] = dict(totals[kind])
+        for phase, values in by_kind[kind].items():
+            values.sort()
+            summary[kind][phase] = {f"p{int(q * 100)}": percentile(values, q) for q in QUANTILES}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trivanza metrics tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summarize = sub.add_parser("summarize", help="Summarize a JSONL metrics file")
+    summarize.add_argument("path")
+    args = parser.parse_args(argv)
+    print(json.dumps(summarize_jsonl(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
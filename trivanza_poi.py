@@ -0,0 +1,514 @@
+"""Offline nearby-services lookup for Trivanza.
+
+"Nearest ATM / hospital / pharmacy / mechanic" questions are answered from a local
+OpenStreetMap POI extract instead of names the model makes up. The extract is built
+into one file pair per category:
+
+- <category>.kdt: the KD-tree of trivanza_geo (3-D unit vectors in median order)
+  followed by byte offsets into the records file,
+- <category>.tsv: one record per tree node (name, lat, lon, opening_hours, phone, address),
+
+plus a manifest.json. Both files are memory-mapped, so opening an index costs almost
+nothing and a query only touches the pages on its search path. k-nearest queries can
+skip places that are closed at the traveler's local time, using a subset of the OSM
+opening_hours syntax ("24/7", "Mo-Fr 09:00-18:00; Sa 10:00-14:00", "Su off", ...);
+places with missing or unsupported hours are kept and reported as "hours unknown".
+
+No extract is bundled: build one from a Geofabrik download and select it with
+TRIVANZA_POI_INDEX (default data/poi). Without an index the chat answers as before.
+
+    python trivanza_poi.py build india-latest.osm.pbf -o data/poi   # .pbf needs pyosmium
+    python trivanza_poi.py build goa.osm -o data/poi                # .osm / .osm.bz2 XML
+    python trivanza_poi.py nearest pharmacy 15.4909 73.8278 --timezone Asia/Kolkata
+    python trivanza_poi.py bench --synthetic 2000000
+"""
+import argparse
+import bz2
+import json
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from trivanza_geo import KDTree, chord_to_km, to_xyz
+
+DEFAULT_INDEX_PATH = os.environ.get(
+    "TRIVANZA_POI_INDEX", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "poi")
+)
+INDEX_VERSION = 1
+# Native byte order: an index is built on the machine (or architecture) that serves it.
+HEADER = struct.Struct("=8sQ")
+MAGIC = b"TRVPOI01"
+RECORD_FIELDS = ("name", "lat", "lon", "opening_hours", "phone", "address")
+
+# OSM tags per category: (key, value, extra tag that must also be present or None).
+CATEGORY_TAGS = {
+    "atm": [("amenity", "atm", None), ("amenity", "bank", ("atm", "yes"))],
+    "hospital": [("amenity", "hospital", None), ("healthcare", "hospital", None), ("amenity", "clinic", None)],
+    "pharmacy": [("amenity", "pharmacy", None), ("healthcare", "pharmacy", None), ("shop", "chemist", None)],
+    "mechanic": [("shop", "car_repair", None), ("shop", "motorcycle_repair", None), ("shop", "tyres", None)],
+}
+CATEGORIES = tuple(CATEGORY_TAGS)
+# Words in a chat message that ask for each category.
+CATEGORY_PATTERNS = {
+    "atm": re.compile(r"\batms?\b|\bcash ?(machine|point)s?\b|\bwithdraw"),
+    "hospital": re.compile(r"\bhospitals?\b|\bemergency room\b|\bclinics?\b|\bdoctors?\b|\bambulance\b"),
+    "pharmacy": re.compile(r"\bpharmac(y|ies|ist)\b|\bchemists?\b|\bdrug ?stores?\b|\bmedicines?\b"),
+    "mechanic": re.compile(r"\bmechanics?\b|\b(car|bike|tyre|tire) repair\b|\bgarage\b|\bflat (tyre|tire)\b|\bpuncture\b|\bbr(oke|eak) ?down\b"),
+}
+DEFAULT_LIMIT = 5
+
+NEARBY_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "find_nearby",
+        "description": "Find the nearest ATMs, hospitals, pharmacies or mechanics to the traveler "
+                       "from an offline OpenStreetMap extract, optionally only those open now.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "category": {"type": "string", "enum": list(CATEGORIES)},
+                "open_now": {"type": "boolean"},
+                "limit": {"type": "integer", "minimum": 1, "maximum": 10},
+            },
+            "required": ["category"],
+        },
+    },
+}
+NEARBY_REPLY_INSTRUCTIONS = (
+    "Answer the traveler's last message using ONLY the places returned by find_nearby. "
+    "Give each place's name, distance, address and phone number exactly as returned and "
+    "never invent places, addresses or phone numbers; say so when a detail is missing or "
+    "the opening hours are unknown. If no places were found, say that and suggest the local "
+    "emergency number or asking nearby. Keep it short."
+)
+
+
+# --- Opening hours ---
+
+WEEKDAYS = ("mo", "tu", "we", "th", "fr", "sa", "su")
+_DAY_RANGE_RE = re.compile(r"^(mo|tu|we|th|fr|sa|su)(?:-(mo|tu|we|th|fr|sa|su))?$")
+_TIME_RANGE_RE = re.compile(r"^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})\+?$")
+_RULE_RE = re.compile(r"^(?P<days>[a-z]{2}(?:-[a-z]{2})?(?:,[a-z]{2}(?:-[a-z]{2})?)*)?\s*(?P<times>.*)$")
+
+
+def _parse_days(text):
+    days = set()
+    for part in text.split(","):
+        match = _DAY_RANGE_RE.match(part)
+        if match is None:
+            return None
+        start = WEEKDAYS.index(match.group(1))
+        end = WEEKDAYS.index(match.group(2) or match.group(1))
+        days.update((start + i) % 7 for i in range((end - start) % 7 + 1))
+    return days
+
+
+@lru_cache(maxsize=4096)
+def parse_opening_hours(text):
+    """Parses an OSM opening_hours value into {weekday: ((start_min, end_min), ...)}.
+
+    Returns None for values outside the supported subset. Later rules override earlier
+    ones for their days, as in OSM; public-holiday ("PH") rules are ignored.
+    """
+    text = (text or "").strip().lower()
+    if not text:
+        return None
+    if text == "24/7":
+        return {day: ((0, 1440),) for day in range(7)}
+    schedule = {}
+    for rule in filter(None, (r.strip() for r in text.split(";"))):
+        if rule.startswith("ph"):
+            continue
+        match = _RULE_RE.match(rule)
+        days = _parse_days(match.group("days")) if match.group("days") else set(range(7))
+        times = match.group("times").strip()
+        if days is None:
+            return None
+        if times in ("off", "closed"):
+            ranges = ()
+        else:
+            ranges = []
+            for part in times.replace(" ", "").split(","):
+                tm = _TIME_RANGE_RE.match(part)
+                if tm is None:
+                    return None
+                start = int(tm.group(1)) * 60 + int(tm.group(2))
+                end = int(tm.group(3)) * 60 + int(tm.group(4))
+                if start > 1440 or end > 1440:
+                    return None
+                ranges.append((start, end))
+            ranges = tuple(ranges)
+        for day in days:
+            schedule[day] = ranges
+    return schedule
+
+
+def is_open(opening_hours, local_time):
+    """True/False if `opening_hours` says the place is open at `local_time`, None if unknown."""
+    schedule = parse_opening_hours(opening_hours)
+    if schedule is None:
+        return None
+    minute = local_time.hour * 60 + local_time.minute
+    weekday = local_time.weekday()
+    for start, end in schedule.get(weekday, ()):
+        if start < end and start <= minute < end:
+            return True
+        if end <= start <= minute:
+            return True
+    # Ranges past midnight ("22:00-02:00") carry over into the next morning.
+    for start, end in schedule.get((weekday - 1) % 7, ()):
+        if end <= start and minute < end:
+            return True
+    return False
+
+
+# --- Index ---
+
+class CategoryIndex:
+    """One category's memory-mapped KD-tree and records."""
+
+    def __init__(self, kdt_path, tsv_path):
+        with open(kdt_path, "rb") as f:
+            self._kdt = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(tsv_path, "rb") as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        magic, count = HEADER.unpack_from(self._kdt)
+        if magic != MAGIC:
+            raise ValueError(f"Not a Trivanza POI index: {kdt_path}")
+        view = memoryview(self._kdt)
+        coords_end = HEADER.size + 24 * count
+        self.tree = KDTree.from_buffers(view[HEADER.size:coords_end].cast("d"))
+        self.offsets = view[coords_end:coords_end + 8 * (count + 1)].cast("Q")
+
+    def __len__(self):
+        return len(self.tree)
+
+    def record(self, i):
+        values = self._records[self.offsets[i]:self.offsets[i + 1]].decode("utf-8").rstrip("\n").split("\t")
+        record = dict(zip(RECORD_FIELDS, values))
+        record["lat"], record["lon"] = float(record["lat"]), float(record["lon"])
+        return record
+
+    def opening_hours(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self._records[start:end].decode("utf-8").split("\t")[3]
+
+
+class POIIndex:
+    """Category-partitioned nearby-services index; categories are mapped on first use."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported POI index version in {path}: {self.manifest.get('version')}")
+        self.categories = tuple(self.manifest["categories"])
+        self._opened = {}
+
+    def category(self, name):
+        if name not in self._opened:
+            if name not in self.categories:
+                raise KeyError(f"No {name!r} places in the POI index")
+            self._opened[name] = CategoryIndex(
+                os.path.join(self.path, f"{name}.kdt"), os.path.join(self.path, f"{name}.tsv")
+            )
+        return self._opened[name]
+
+    def nearest(self, category, lat, lon, k=DEFAULT_LIMIT, open_at=None):
+        """Returns up to k places nearest to (lat, lon), nearest first.
+
+        With `open_at` (a timezone-aware local datetime), places known to be closed then
+        are skipped; each result gets "open_now": True, False or None (unknown).
+        """
+        index = self.category(category)
+        predicate = None
+        if open_at is not None:
+            predicate = lambda i: is_open(index.opening_hours(i), open_at) is not False  # noqa: E731
+        results = []
+        for chord, i in index.tree.query(to_xyz(lat, lon), k=k, predicate=predicate):
+            record = index.record(i)
+            record["distance_km"] = round(chord_to_km(chord), 2)
+            record["open_now"] = is_open(record["opening_hours"], open_at) if open_at is not None else None
+            results.append(record)
+        return results
+
+
+@lru_cache(maxsize=1)
+def get_poi_index():
+    """The process-wide POI index, or None if no index has been built."""
+    if not os.path.exists(os.path.join(DEFAULT_INDEX_PATH, "manifest.json")):
+        return None
+    return POIIndex(DEFAULT_INDEX_PATH)
+
+
+def detect_category(message):
+    """The nearby-services category a chat message asks for, or None."""
+    text = message.lower()
+    return next((category for category, pattern in CATEGORY_PATTERNS.items() if pattern.search(text)), None)
+
+
+def find_nearby(index, category, lat, lon, timezone="UTC", open_now=True, limit=DEFAULT_LIMIT, now=None):
+    """Runs the find_nearby tool and returns its JSON-serializable result."""
+    try:
+        tz = ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = ZoneInfo("UTC")
+    local_time = (now or datetime.now(tz)).astimezone(tz)
+    places = index.nearest(category, lat, lon, k=max(1, min(int(limit), 10)), open_at=local_time if open_now else None)
+    for place in places:
+        place["opening_hours"] = place["opening_hours"] or "unknown"
+        for field in ("phone", "address"):
+            place[field] = place[field] or "not listed"
+    return {
+        "category": category,
+        "local_time": local_time.strftime("%a %H:%M"),
+        "open_now_filter": bool(open_now),
+        "places": places,
+        "source": "OpenStreetMap contributors (offline extract)",
+    }
+
+
+# --- Building ---
+
+def category_of(tags):
+    """The category an OSM object's tags belong to, or None."""
+    for category, rules in CATEGORY_TAGS.items():
+        for key, value, extra in rules:
+            if tags.get(key) == value and (extra is None or tags.get(extra[0]) == extra[1]):
+                return category
+    return None
+
+
+def _clean(value):
+    return " ".join(str(value or "").split())
+
+
+def place_record(tags, lat, lon):
+    """A record tuple for an OSM object with a category, or None if it has no usable name."""
+    name = _clean(tags.get("name") or tags.get("brand") or tags.get("operator"))
+    if not name:
+        return None
+    address = ", ".join(_clean(tags[key]) for key in (
+        "addr:housenumber", "addr:street", "addr:suburb", "addr:city", "addr:postcode"
+    ) if tags.get(key))
+    return (
+        name, f"{lat:.6f}", f"{lon:.6f}", _clean(tags.get("opening_hours")),
+        _clean(tags.get("phone") or tags.get("contact:phone")), address,
+    )
+
+
+def _osm_elements(path):
+    """Yields the node, way and relation elements of an .osm or .osm.bz2 XML file in order."""
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rb") as f:
+        events = ET.iterparse(f, events=("start", "end"))
+        _, root = next(events)
+        for event, elem in events:
+            if event == "end" and elem.tag in ("node", "way", "relation"):
+                yield elem
+                root.clear()  # keeps memory flat on country-sized files
+
+
+def _xml_tags(elem):
+    return {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+
+
+def read_osm_xml(path):
+    """Yields (tags, lat, lon) for tagged nodes and way centroids of an .osm or .osm.bz2 XML file.
+
+    XML ways only reference their nodes, so the file is read twice: the first pass collects
+    the node refs of ways that belong to a category, and the second keeps the coordinates
+    of just those nodes (which come before the ways) to place each way at their centroid.
+    """
+    wanted = set()
+    for elem in _osm_elements(path):
+        if elem.tag == "way" and category_of(_xml_tags(elem)):
+            wanted.update(nd.get("ref") for nd in elem.iter("nd"))
+    coords = {}
+    for elem in _osm_elements(path):
+        if elem.tag == "node":
+            tags, lat, lon = _xml_tags(elem), float(elem.get("lat")), float(elem.get("lon"))
+            if elem.get("id") in wanted:
+                coords[elem.get("id")] = (lat, lon)
+            if tags:
+                yield tags, lat, lon
+        elif elem.tag == "way" and wanted:
+            tags = _xml_tags(elem)
+            points = [coords[nd.get("ref")] for nd in elem.iter("nd") if nd.get("ref") in coords]
+            if points and category_of(tags):
+                yield tags, sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+
+
+def read_osm_pbf(path):
+    """Yields (tags, lat, lon) for tagged nodes and way centroids of an .osm.pbf file."""
+    try:
+        import osmium
+    except ImportError:  # pyosmium is optional
+        raise SystemExit("Reading .osm.pbf files needs pyosmium (pip install osmium); or convert to .osm XML.")
+    for obj in osmium.FileProcessor(path).with_locations().with_filter(osmium.filter.EmptyTagFilter()):
+        tags = dict(obj.tags)
+        if category_of(tags) is None:
+            continue
+        if obj.is_node():
+            yield tags, obj.location.lat, obj.location.lon
+        elif obj.is_way() and len(obj.nodes):
+            points = [(n.location.lat, n.location.lon) for n in obj.nodes if n.location.valid()]
+            if points:
+                yield tags, sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+
+
+def write_category(path, category, records):
+    """Writes one category's KD-tree and records; returns the number of places."""
+    tree = KDTree([to_xyz(float(r[1]), float(r[2])) for r in records])
+    offsets = [0]
+    with open(os.path.join(path, f"{category}.tsv"), "wb") as out:
+        for i in tree.order:
+            line = ("\t".join(records[i]) + "\n").encode("utf-8")
+            out.write(line)
+            offsets.append(offsets[-1] + len(line))
+    with open(os.path.join(path, f"{category}.kdt"), "wb") as out:
+        out.write(HEADER.pack(MAGIC, len(records)))
+        out.write(tree.coords.tobytes())
+        out.write(array("Q", offsets).tobytes())
+    return len(records)
+
+
+def build_index(objects, path, source=""):
+    """Builds an index directory from (tags, lat, lon) objects; returns places per category."""
+    os.makedirs(path, exist_ok=True)
+    records = {category: [] for category in CATEGORIES}
+    bbox = [90.0, 180.0, -90.0, -180.0]
+    for tags, lat, lon in objects:
+        category = category_of(tags)
+        record = place_record(tags, lat, lon) if category else None
+        if record:
+            records[category].append(record)
+            bbox = [min(bbox[0], lat), min(bbox[1], lon), max(bbox[2], lat), max(bbox[3], lon)]
+    counts = {category: write_category(path, category, rows) for category, rows in records.items()}
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "source": source, "built": datetime.now().isoformat(timespec="seconds"),
+                   "bbox": [round(v, 4) for v in bbox], "categories": counts}, f, indent=2)
+    return counts
+
+
+# --- Benchmark ---
+
+SYNTHETIC_HOURS = ["24/7", "Mo-Sa 09:00-21:00", "Mo-Fr 08:30-17:30; Sa 09:00-13:00; Su off",
+                   "Mo-Su 10:00-22:00", "Mo-Su 18:00-02:00", "", "by appointment"]
+
+
+def synthetic_objects(count, seed=7, bbox=(8.0, 68.0, 35.0, 97.0)):
+    """Yields `count` random POIs in a country-sized bounding box (India by default)."""
+    rng = random.Random(seed)
+    values = [(rules[0][0], rules[0][1]) for rules in CATEGORY_TAGS.values()]
+    min_lat, min_lon, max_lat, max_lon = bbox
+    for n in range(count):
+        key, value = values[n % len(values)]
+        tags = {key: value, "name": f"Place {n}", "opening_hours": rng.choice(SYNTHETIC_HOURS),
+                "phone": f"+91 {rng.randrange(10**9, 10**10)}", "addr:city": "Somewhere"}
+        yield tags, rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+
+
+def build_synthetic_index(count, path):
+    return build_index(synthetic_objects(count), path, source=f"synthetic:{count}")
+
+
+def _rss_mb():
+    """(anonymous, file-backed) resident memory in MB; mapped index pages are file-backed."""
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return tuple(int(fields[key].split()[0]) / 1024 for key in ("RssAnon", "RssFile"))
+
+
+def benchmark(index, queries=10_000, k=DEFAULT_LIMIT, seed=11):
+    """Query latency (µs) with and without the opening-hours filter, and RSS growth."""
+    rng = random.Random(seed)
+    min_lat, min_lon, max_lat, max_lon = index.manifest["bbox"]
+    points = [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for _ in range(queries)]
+    tz = ZoneInfo("Asia/Kolkata")
+    times = [datetime(2026, 1, 5, tzinfo=tz) + timedelta(minutes=rng.randrange(7 * 1440)) for _ in range(queries)]
+    rss_before = _rss_mb()
+    results = {}
+    for label, use_hours in (("nearest", False), ("nearest_open", True)):
+        timings = []
+        for n, (lat, lon) in enumerate(points):
+            category = index.categories[n % len(index.categories)]
+            start = time.perf_counter()
+            index.nearest(category, lat, lon, k=k, open_at=times[n] if use_hours else None)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[label] = {"p50_us": timings[len(timings) // 2] * 1e6, "p99_us": timings[int(len(timings) * 0.99)] * 1e6}
+    rss_after = _rss_mb()
+    results["anon_growth_mb"], results["mapped_growth_mb"] = (after - before for after, before in zip(rss_after, rss_before))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trivanza offline nearby-services index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build an index from an OSM extract (.osm, .osm.bz2 or .osm.pbf)")
+    build.add_argument("source")
+    build.add_argument("-o", "--output", default=DEFAULT_INDEX_PATH)
+    near = sub.add_parser("nearest", help="Query the index")
+    near.add_argument("category", choices=CATEGORIES)
+    near.add_argument("lat", type=float)
+    near.add_argument("lon", type=float)
+    near.add_argument("--timezone", default="UTC")
+    near.add_argument("--any-hours", action="store_true", help="Include places that are closed now")
+    near.add_argument("-k", type=int, default=DEFAULT_LIMIT)
+    bench = sub.add_parser("bench", help="Measure build time, size, memory and query latency")
+    bench.add_argument("--synthetic", type=int, default=0, help="Benchmark a synthetic extract of this many POIs")
+    bench.add_argument("--queries", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        reader = read_osm_pbf if args.source.endswith(".pbf") else read_osm_xml
+        start = time.perf_counter()
+        counts = build_index(reader(args.source), args.output, source=os.path.basename(args.source))
+        print(f"Indexed {counts} in {time.perf_counter() - start:.1f}s to {args.output}")
+    elif args.command == "nearest":
+        index = get_poi_index()
+        if index is None:
+            sys.exit(f"No POI index at {DEFAULT_INDEX_PATH}; build one with `python trivanza_poi.py build`.")
+        print(json.dumps(find_nearby(index, args.category, args.lat, args.lon, args.timezone,
+                                     open_now=not args.any_hours, limit=args.k), indent=2, ensure_ascii=False))
+    else:
+        path = DEFAULT_INDEX_PATH
+        if args.synthetic:
+            path = tempfile.mkdtemp(prefix="trivanza-poi-")
+            start = time.perf_counter()
+            # Built in a child process so the memory figures below are the index's alone.
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                pool.submit(build_synthetic_index, args.synthetic, path).result()
+            print(f"built {args.synthetic:,} synthetic POIs in {time.perf_counter() - start:.1f}s")
+        size_mb = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 2**20
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        index = POIIndex(path)
+        for category in index.categories:
+            index.category(category)
+        open_ms = (time.perf_counter() - start) * 1000
+        anon, mapped = (after - before for after, before in zip(_rss_mb(), rss_before))
+        print(f"{sum(index.manifest['categories'].values()):,} places, {size_mb:.1f} MB on disk, "
+              f"opened in {open_ms:.1f} ms (+{anon:.1f} MB heap, +{mapped:.1f} MB mapped)")
+        result = benchmark(index, args.queries)
+        for label in ("nearest", "nearest_open"):
+            print(f"{label:>12}: p50 {result[label]['p50_us']:.0f} µs, p99 {result[label]['p99_us']:.0f} µs")
+        print(f"RSS growth during queries: +{result['anon_growth_mb']:.1f} MB heap, "
+              f"+{result['mapped_growth_mb']:.1f} MB mapped index pages (shared, reclaimable page cache)")
+
+
+if __name__ == "__main__":
+    main()
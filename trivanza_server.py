@@ -0,0 +1,68 @@
+"""ASGI entry point for Trivanza: the chatbot plus a signed, HttpOnly session cookie.
+
+Streamlit scripts can read cookies (st.context.cookies) but cannot set them, so this
+wraps trivanza_chatbot.py in st.App with a small middleware. A browser that arrives
+without a valid trivanza_session cookie gets one holding a new session id signed with
+the store's key (see trivanza_sessions). The cookie is HttpOnly and SameSite=Lax; it is
+never part of the URL, so sharing a link never shares a chat.
+
+    streamlit run trivanza_server.py
+    uvicorn trivanza_server:app
+
+Running trivanza_chatbot.py directly still works, but then every page load starts a
+new chat.
+"""
+import os
+import uuid
+from http.cookies import SimpleCookie
+
+import streamlit as st
+from starlette.middleware import Middleware
+
+from trivanza_sessions import (
+    DEFAULT_SESSION_PATH, DEFAULT_TTL_SECONDS, SESSION_COOKIE, load_session_secret, sign_session_id,
+    verify_session_cookie,
+)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trivanza_chatbot.py")
+
+
+def _request_cookie(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(name)
+            if morsel is not None:
+                return morsel.value
+    return None
+
+
+def _is_https(scope):
+    forwarded = dict(scope.get("headers", ())).get(b"x-forwarded-proto", b"").decode("latin-1")
+    return scope.get("scheme") == "https" or forwarded.split(",")[0].strip() == "https"
+
+
+class SessionCookieMiddleware:
+    """Sets a signed session cookie on HTTP responses to browsers that don't have a valid one."""
+
+    def __init__(self, app, secret=None, max_age=DEFAULT_TTL_SECONDS):
+        self.app = app
+        self.secret = secret or load_session_secret(DEFAULT_SESSION_PATH)
+        self.max_age = int(max_age)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or verify_session_cookie(_request_cookie(scope, SESSION_COOKIE), self.secret):
+            await self.app(scope, receive, send)
+            return
+        cookie = f"{SESSION_COOKIE}={sign_session_id(uuid.uuid4().hex, self.secret)}; Path=/; Max-Age={self.max_age}; HttpOnly; SameSite=Lax"
+        if _is_https(scope):
+            cookie += "; Secure"
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"set-cookie", cookie.encode("latin-1"))])
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+app = st.App(APP_PATH, middleware=[Middleware(SessionCookieMiddleware)])
@@ -0,0 +1,469 @@
+"""Compact, spill-to-disk chat session store for Trivanza.
+
+Chat histories, trip contexts and pending prompts live here instead of in
+st.session_state, keyed by a session id that survives page reloads. The id never
+appears in the URL: trivanza_server.py hands every browser a signed, HttpOnly cookie
+(SESSION_COOKIE) and the app only accepts ids whose signature verifies. A session is
+used by one tab at a time (see SessionStore.claim()). In memory, each message is a slotted record holding UTF-8 bytes, and messages
+older than the recent window are zlib-compressed. Sessions that stay idle longer than
+TRIVANZA_SESSION_IDLE_SECONDS are written to a SQLite file and dropped from memory;
+they are restored lazily the next time the session is used. Sessions are also written
+after every chat turn (save()) and recently used ones on every sweep, so a crash loses
+at most the turn in progress.
+
+    python trivanza_sessions.py bench --sessions 1000   # RSS per 1,000 sessions, before/after
+"""
+import argparse
+import atexit
+import gc
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import date
+
+logger = logging.getLogger("trivanza.sessions")
+
+DEFAULT_SESSION_PATH = os.environ.get("TRIVANZA_SESSION_PATH", ".trivanza_sessions.sqlite3")
+DEFAULT_IDLE_SECONDS = float(os.environ.get("TRIVANZA_SESSION_IDLE_SECONDS", "900"))
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+SWEEP_INTERVAL_SECONDS = 60.0
+# Messages in this many most recent slots are kept uncompressed.
+RECENT_WINDOW = 8
+# Shorter messages are not worth compressing.
+COMPRESS_MIN_BYTES = 256
+# Decompressed text of this many compressed messages just before the recent window is
+# cached per session while it is in use, so reruns don't inflate them again.
+DECOMPRESSED_TAIL = int(os.environ.get("TRIVANZA_DECOMPRESSED_TAIL", "32"))
+
+SESSION_COOKIE = "trivanza_session"
+# Session ids are uuid4 hex strings.
+SESSION_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class Message:
+    """One chat message: an interned role and its content as (possibly compressed) UTF-8."""
+
+    __slots__ = ("role", "data", "compressed")
+
+    def __init__(self, role, content):
+        self.role = sys.intern(role)
+        self.data = content.encode("utf-8")
+        self.compressed = False
+
+    @property
+    def content(self):
+        return (zlib.decompress(self.data) if self.compressed else self.data).decode("utf-8")
+
+    @property
+    def raw_content(self):
+        """The content, or None when reading it means decompressing."""
+        return None if self.compressed else self.data.decode("utf-8")
+
+    def compress(self):
+        if not self.compressed and len(self.data) >= COMPRESS_MIN_BYTES:
+            self.data = zlib.compress(self.data, 6)
+            self.compressed = True
+
+
+class MessageLog:
+    """A list-like chat history that reads and writes `{"role", "content"}` dicts.
+
+    Stores Message records; a message is compressed once it leaves the recent window.
+    The decompressed text of the newest `decompressed_tail` compressed messages is cached
+    until release().
+    """
+
+    def __init__(self, messages=(), recent_window=RECENT_WINDOW, decompressed_tail=DECOMPRESSED_TAIL):
+        self.recent_window = recent_window
+        self.decompressed_tail = decompressed_tail
+        self._records = []
+        self._texts = {}  # record index -> decompressed content
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        self._records.append(Message(message["role"], message["content"]))
+        if len(self._records) > self.recent_window:
+            self._records[-self.recent_window - 1].compress()
+            self._texts.pop(len(self._records) - self.recent_window - self.decompressed_tail - 1, None)
+
+    def clear(self):
+        self._records.clear()
+        self._texts.clear()
+
+    def release(self):
+        """Drops the decompressed-text cache, e.g. once the session goes quiet."""
+        self._texts.clear()
+
+    def _content(self, index):
+        record = self._records[index]
+        text = record.raw_content
+        if text is not None:
+            return text
+        text = self._texts.get(index)
+        if text is None:
+            text = record.content
+            if index >= len(self._records) - self.recent_window - self.decompressed_tail:
+                self._texts[index] = text
+        return text
+
+    def _as_dict(self, index):
+        return {"role": self._records[index].role, "content": self._content(index)}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._as_dict(i) for i in range(*index.indices(len(self._records)))]
+        return self._as_dict(range(len(self._records))[index])
+
+    def __iter__(self):
+        return (self._as_dict(i) for i in range(len(self._records)))
+
+    def encode(self):
+        """The whole history as one compressed blob, for storage."""
+        rows = [[record.role, self._content(i)] for i, record in enumerate(self._records)]
+        return zlib.compress(json.dumps(rows, ensure_ascii=False).encode("utf-8"), 6)
+
+    @classmethod
+    def decode(cls, blob, recent_window=RECENT_WINDOW):
+        rows = json.loads(zlib.decompress(blob).decode("utf-8"))
+        return cls(({"role": role, "content": content} for role, content in rows), recent_window)
+
+
+def _encode_context(trip_context):
+    return json.dumps(trip_context, default=lambda v: {"$date": v.isoformat()} if isinstance(v, date) else str(v))
+
+
+def _decode_context(text):
+    return json.loads(text, object_hook=lambda d: date.fromisoformat(d["$date"]) if set(d) == {"$date"} else d)
+
+
+class ChatSession:
+    """The chat state of one browser session."""
+
+    __slots__ = ("session_id", "messages", "trip_context", "pending_llm_prompt", "last_seen", "owner")
+
+    def __init__(self, session_id, messages=None, trip_context=None, pending_llm_prompt=None):
+        self.session_id = session_id
+        self.messages = messages if messages is not None else MessageLog()
+        self.trip_context = trip_context
+        self.pending_llm_prompt = pending_llm_prompt
+        self.last_seen = time.monotonic()
+        self.owner = None  # The Streamlit session (browser tab) using it
+
+
+class SessionStore:
+    """Process-wide session store that spills idle sessions to SQLite.
+
+    Thread-safe. `get()` returns the live session, restoring it from disk or creating
+    it as needed, and opportunistically evicts sessions idle for over `idle_seconds`.
+    Pass `path=None` to keep every session in memory.
+    """
+
+    def __init__(self, path=DEFAULT_SESSION_PATH, idle_seconds=DEFAULT_IDLE_SECONDS, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.ttl_seconds = ttl_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = self._last_flush = time.monotonic()
+        self.stats = {"restored": 0, "evicted": 0, "created": 0, "saved": 0}
+        if path is None:
+            return
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " messages BLOB NOT NULL,"
+                " trip_context TEXT,"
+                " pending_llm_prompt TEXT,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, session_id):
+        """Returns the session, restoring it from disk or creating an empty one."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+                if session is None:
+                    session = ChatSession(session_id)
+                    self.stats["created"] += 1
+                else:
+                    self.stats["restored"] += 1
+                self._sessions[session_id] = session
+            session.last_seen = time.monotonic()
+        self._maybe_sweep()
+        return session
+
+    def claim(self, session_id, owner, is_active=lambda owner: True):
+        """Returns the session for `owner` (a browser tab), or None if another live tab has it.
+
+        `is_active(other_owner)` tells whether a previous owner is still connected.
+        """
+        session = self.get(session_id)
+        with self._lock:
+            if session.owner not in (None, owner) and is_active(session.owner):
+                return None
+            session.owner = owner
+        return session
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _load(self, session_id):
+        if self.path is None:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT messages, trip_context, pending_llm_prompt FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        trip_context = _decode_context(row[1]) if row[1] else None
+        return ChatSession(session_id, MessageLog.decode(row[0]), trip_context, row[2])
+
+    def save(self, session):
+        """Writes one session to disk now, e.g. after a chat turn."""
+        if self.path is not None:
+            self._save([session])
+
+    def _save(self, sessions):
+        now = time.time()
+        self.stats["saved"] += len(sessions)
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, messages, trip_context, pending_llm_prompt, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [
+                    (s.session_id, s.messages.encode(),
+                     _encode_context(s.trip_context) if s.trip_context is not None else None,
+                     s.pending_llm_prompt, now)
+                    for s in sessions
+                ]
+            )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+                return
+            self._last_sweep = now
+        self.evict_idle()
+        self.flush(since=True)
+        with self._lock:
+            for session in self._sessions.values():
+                if session.last_seen < now - SWEEP_INTERVAL_SECONDS:
+                    session.messages.release()
+
+    def evict_idle(self, idle_seconds=None):
+        """Writes sessions idle for longer than idle_seconds to disk and drops them from memory.
+
+        The write happens outside the lock; a session used again meanwhile stays loaded.
+        """
+        if self.path is None:
+            return 0
+        cutoff = time.monotonic() - (self.idle_seconds if idle_seconds is None else idle_seconds)
+        with self._lock:
+            idle = [s for s in self._sessions.values() if s.last_seen <= cutoff]
+        if not idle:
+            return 0
+        self._save(idle)
+        with self._lock:
+            evicted = [s for s in idle if s.last_seen <= cutoff and self._sessions.get(s.session_id) is s]
+            for session in evicted:
+                del self._sessions[session.session_id]
+            self.stats["evicted"] += len(evicted)
+        logger.info("Evicted %d idle sessions to %s", len(evicted), self.path)
+        return len(evicted)
+
+    def flush(self, since=False):
+        """Writes in-memory sessions to disk, keeping them loaded.
+
+        With since=True only sessions used since the previous flush are written (the
+        periodic sweep); otherwise all of them (e.g. at shutdown).
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            cutoff = self._last_flush if since else float("-inf")
+            self._last_flush = time.monotonic()
+            sessions = [s for s in self._sessions.values() if s.last_seen >= cutoff]
+        if sessions:
+            self._save(sessions)
+
+
+def load_session_secret(path=DEFAULT_SESSION_PATH):
+    """The key that signs session cookies: TRIVANZA_SESSION_SECRET, or a random key kept next to the store."""
+    secret = os.environ.get("TRIVANZA_SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    if not path:
+        return secrets.token_bytes(32)
+    key_path = f"{path}.key"
+    try:
+        with open(key_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    key = secrets.token_bytes(32)
+    try:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:  # another process created it first
+        with open(key_path, "rb") as f:
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def sign_session_id(session_id, secret):
+    """The cookie value for a session id: the id and its HMAC-SHA256 signature."""
+    return f"{session_id}.{hmac.new(secret, session_id.encode('ascii'), hashlib.sha256).hexdigest()}"
+
+
+def verify_session_cookie(value, secret):
+    """The session id in a cookie value, or None if it is missing, malformed or not signed with `secret`."""
+    if not isinstance(value, str):
+        return None
+    session_id = value.partition(".")[0]
+    if not SESSION_ID_RE.fullmatch(session_id):
+        return None
+    if not hmac.compare_digest(sign_session_id(session_id, secret), value):
+        return None
+    return session_id
+
+
+def open_session_store():
+    """The store configured from the environment; TRIVANZA_SESSION_STORE=off keeps sessions in memory only."""
+    if os.environ.get("TRIVANZA_SESSION_STORE", "on").lower() in ("0", "off", "false", "no"):
+        return SessionStore(path=None)
+    store = SessionStore()
+    atexit.register(store.flush)
+    return store
+
+
+# --- Memory benchmark ---
+
+WORDS = (
+    "beach fort market temple museum cafe sunset ferry spice garden heritage walk lunch dinner "
+    "breakfast hotel check-in taxi metro viewpoint village lake boat ride street food"
+).split()
+BENCH_VARIANTS = ("dicts", "compact", "evicted")
+
+
+def _sample_session(rng, index, turns):
+    """A realistic session: a trip form, one itinerary and some short follow-up turns."""
+    itinerary = [f"Namaste Traveler! Here is your trip #{index}."]
+    for day in range(1, 6):
+        itinerary.append(f"### Day {day}: Coast & Culture – Goa (2026-11-{day:02d})")
+        for _ in range(8):
+            phrase = " ".join(rng.choice(WORDS) for _ in range(14))
+            itinerary.append(f"- **{rng.randint(7, 22):02d}:00** 🏖️ {phrase.capitalize()}. Cost: ₹{rng.randint(1, 90) * 100}")
+        itinerary.append(f"🎯 Daily Total: ₹{rng.randint(50, 200) * 100}")
+    messages = [
+        {"role": "assistant", "content": "Namaste Traveler! Welcome to Trivanza."},
+        {"role": "user", "content": f"Plan a trip from New Delhi to Goa #{index} " + " ".join(rng.choice(WORDS) for _ in range(60))},
+        {"role": "assistant", "content": "\n".join(itinerary)},
+    ]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Question {turn}: " + " ".join(rng.choice(WORDS) for _ in range(12))})
+        messages.append({"role": "assistant", "content": " ".join(rng.choice(WORDS) for _ in range(120))})
+    trip_context = {"origin": "New Delhi", "destination": f"Goa {index}", "from_date": date(2026, 11, 1), "to_date": date(2026, 11, 5)}
+    return messages, trip_context
+
+
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_variant(variant, sessions, turns, path):
+    """RSS growth (bytes) from holding `sessions` sessions the given way, measured in this process."""
+    rng = random.Random(7)
+    gc.collect()
+    before = _current_rss_bytes()
+    if variant == "dicts":
+        held = [_sample_session(rng, i, turns) for i in range(sessions)]
+    else:
+        held = SessionStore(path=path if variant == "evicted" else None)
+        for i in range(sessions):
+            messages, trip_context = _sample_session(rng, i, turns)
+            session = held.get(f"bench-{i}")
+            for message in messages:
+                session.messages.append(message)
+            session.trip_context = trip_context
+            if variant == "evicted" and i % 100 == 99:
+                held.evict_idle(idle_seconds=0)  # as the periodic idle sweep would
+    gc.collect()
+    return _current_rss_bytes() - before, held
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trivanza session store tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Compare RSS of plain dict histories with the session store")
+    bench.add_argument("--sessions", type=int, default=1000)
+    bench.add_argument("--turns", type=int, default=6, help="Follow-up chat turns per session")
+    bench.add_argument("--variant", choices=BENCH_VARIANTS, help=argparse.SUPPRESS)
+    bench.add_argument("--path", default=".trivanza_sessions_bench.sqlite3")
+    args = parser.parse_args(argv)
+
+    if args.variant:
+        growth, _ = bench_variant(args.variant, args.sessions, args.turns, args.path)
+        print(growth)
+        return
+    # Each variant runs in a fresh interpreter so earlier allocations don't skew RSS.
+    results = {}
+    try:
+        for variant in BENCH_VARIANTS:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "bench", "--variant", variant,
+                 "--sessions", str(args.sessions), "--turns", str(args.turns), "--path", args.path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results[variant] = int(output.split()[-1])
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    for variant, growth in results.items():
+        per_thousand = growth / args.sessions * 1000 / 2 ** 20
+        print(f"{variant:>8}: {per_thousand:8.1f} MB RSS per 1,000 sessions")
+
+
+if __name__ == "__main__":
+    main()